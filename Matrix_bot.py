@@ -2,7 +2,7 @@ import telebot
 from telebot import types
 from telebot.types import ReplyKeyboardRemove, InlineKeyboardMarkup, InlineKeyboardButton
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import defaultdict, deque, OrderedDict, namedtuple
 import sqlite3
 import feedparser
 import schedule
@@ -15,18 +15,44 @@ import re
 import html
 from uuid import uuid4
 import csv
-from io import StringIO, BytesIO
+from io import StringIO
+import tempfile
+import codecs
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from contextlib import contextmanager
+import atexit
+import heapq
+import asyncio
+import functools
+import queue
+import gzip
+import shutil
+import glob
+import hmac
+import secrets
+import ssl
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import bisect
+import string
+import hashlib
+import multiprocessing
+import signal
+import socket
+import sys
+import multiprocessing.connection
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: no worker processes, so there are no other writers to lock out
 
 current_quiz = {}
 
 # ---- rate limits ----
 RATE_LIMIT_SECONDS = 2.0  # Minimum 1 second between clicks for same user
-last_claim_click = {}     # {telegram_id: last_ts}
-recent_claim_key = {}     # { (packet_id, telegram_id): ts } for preventing duplicate clicks
-last_click_times = {}
-last_chat_points_time = {}  # {telegram_id: last_timestamp} for chat points rate limiting (1 minute)
+CHAT_POINTS_INTERVAL_SECONDS = 60  # Chat points at most once per minute per user
 
 TEMP_SIGNIN_FILE = 'temp_signin_word.txt'
 LOG_FILE = 'admin_actions.log'
@@ -135,6 +161,7 @@ NEWS_BROADCAST_TIME = config.get('NEWS_BROADCAST_TIME', '09:00')  # News broadca
 SIGNIN_WORD_TIME = config.get('SIGNIN_WORD_TIME', '09:05')  # Daily sign-in word selection time (HH:MM format)
 PRICE_UPDATE_TIME = config.get('PRICE_UPDATE_TIME', '00:00')  # Daily price update time (HH:MM format)
 PRICE_BROADCAST_INTERVAL_HOURS = config.get('PRICE_BROADCAST_INTERVAL_HOURS', 2)  # Price broadcast interval in hours
+REDPACKET_REFUND_TIME = config.get('REDPACKET_REFUND_TIME', '01:00')  # Daily red packet refund time (HH:MM format)
 
 # Community general configuration
 COMMUNITY_NAME = config.get('COMMUNITY_NAME', 'Blockchain Community')
@@ -150,12 +177,122 @@ NEWS_ENABLED = config.get('NEWS_ENABLED', False)  # Enable news broadcasting fea
 SIGNIN_WORD_ENABLED = config.get('SIGNIN_WORD_ENABLED', True)  # Enable daily sign-in word feature
 PRICE_BROADCAST_ENABLED = config.get('PRICE_BROADCAST_ENABLED', True)  # Enable price broadcasting feature
 
+# ===== Rate limiters =====
+RATE_LIMIT_MAX_ENTRIES = config.get('RATE_LIMIT_MAX_ENTRIES', 100000)  # Users tracked per rate limiter (memory ceiling)
+
+class _RateLimitEntry:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+class RateLimiter:
+    """
+    Token bucket per key (e.g. telegram_id): at most `limit` actions per `window` seconds
+    Keys idle for a whole window are evicted, since their bucket is full again and forgetting them changes nothing;
+    beyond max_entries the least recently seen key is dropped, so memory stays bounded.
+    """
+    def __init__(self, limit, window, max_entries=RATE_LIMIT_MAX_ENTRIES):
+        self.limit = limit
+        self.window = window
+        self.rate = limit / window
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # {key: _RateLimitEntry}, least recently seen first
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        """Take one action for key; False if it is over the limit (nothing is taken then)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _RateLimitEntry(self.limit, now)
+            else:
+                entry.tokens = min(self.limit, entry.tokens + (now - entry.updated) * self.rate)
+                entry.updated = now
+                self._entries.move_to_end(key)
+            allowed = entry.tokens >= 1 - 1e-9
+            if allowed:
+                entry.tokens -= 1
+            self._evict(now)
+            return allowed
+
+    def _evict(self, now):
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            if len(self._entries) <= self.max_entries and now - oldest.updated < self.window:
+                break
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+claim_click_limiter = RateLimiter(1, RATE_LIMIT_SECONDS)               # Red packet claim buttons
+quiz_click_limiter = RateLimiter(1, RATE_LIMIT_SECONDS)                # Quiz answer buttons
+chat_points_limiter = RateLimiter(1, CHAT_POINTS_INTERVAL_SECONDS)     # Chat points awards
+
 # Load multilingual configuration
 LOCALES_FILE = 'locales.json'
-locales = {}
+LOCALES_FALLBACK_LANG = 'zh_CN'  # Language used for missing languages and missing keys
+LOCALES_RELOAD_SECONDS = config.get('LOCALES_RELOAD_SECONDS', 30)  # How often locales.json is checked for changes
 
 bot = telebot.TeleBot(BOT_TOKEN)
 
+class LocaleCatalog:
+    """
+    locales.json compiled into a flat {(lang, 'dotted.key'): (text, needs_format)} table
+    Keys missing in a language are filled from LOCALES_FALLBACK_LANG when the catalog is built, and texts without
+    placeholders are marked so get_text() returns them without calling format(). A catalog is never modified
+    once built; a reload builds a new one (see load_locales).
+    """
+    def __init__(self, data, version=0):
+        self.version = version
+        self.languages = frozenset(lang for lang, texts in data.items() if isinstance(texts, dict))
+        flat = {lang: dict(self._flatten(data[lang])) for lang in self.languages}
+        fallback = flat.get(LOCALES_FALLBACK_LANG, {})
+        self.templates = {}
+        self.missing = {}  # {lang: [keys taken from the fallback language]}
+        self.invalid = []  # [(lang, key, error)] for texts format() would fail on; they are returned unformatted
+        # The fallback language first, so the other languages can share its entries
+        for lang in sorted(flat, key=lambda lang: lang != LOCALES_FALLBACK_LANG):
+            texts = flat[lang]
+            for key, text in texts.items():
+                self.templates[(lang, key)] = (text, self._needs_format(lang, key, text))
+            self.missing[lang] = sorted(key for key in fallback if key not in texts)
+            for key in self.missing[lang]:
+                self.templates[(lang, key)] = self.templates[(LOCALES_FALLBACK_LANG, key)]
+
+    @classmethod
+    def _flatten(cls, texts, prefix=''):
+        for key, value in texts.items():
+            if isinstance(value, dict):
+                yield from cls._flatten(value, f'{prefix}{key}.')
+            elif isinstance(value, str):
+                yield f'{prefix}{key}', value
+
+    def _needs_format(self, lang, key, text):
+        if '{' not in text and '}' not in text:
+            return False
+        try:
+            list(string.Formatter().parse(text))
+        except ValueError as e:
+            self.invalid.append((lang, key, str(e)))
+            return False
+        return True
+
+    def report(self):
+        """Log what load-time validation found"""
+        for lang in sorted(self.missing):
+            if self.missing[lang]:
+                print(get_log_text('logs.locale_missing_keys', language=lang, count=len(self.missing[lang]),
+                                   fallback=LOCALES_FALLBACK_LANG, keys=', '.join(self.missing[lang])))
+        for lang, key, error in self.invalid:
+            print(get_log_text('logs.locale_invalid_text', language=lang, key=key, error=error))
+
+locale_catalog = LocaleCatalog({})
+_locales_stamp = None
+
 # Multilingual support function
 def get_text(key_path, lang=None, default=None, **kwargs):
     """
@@ -166,42 +303,30 @@ def get_text(key_path, lang=None, default=None, **kwargs):
     :param kwargs: Formatting parameters
     :return: Translated text
     """
+    catalog = locale_catalog  # One snapshot for the whole lookup, even if a reload swaps it meanwhile
     if lang is None:
         lang = DEFAULT_LANGUAGE
-    
+
     # Fallback to Chinese if language not found
-    if lang not in locales:
-        lang = 'zh_CN'
-    
-    if lang not in locales:
-        return default if default is not None else key_path
-    
-    text_dict = locales[lang]
-    
+    if lang not in catalog.languages:
+        lang = LOCALES_FALLBACK_LANG
+
     # Support both string path and list path
-    if isinstance(key_path, str):
-        keys = key_path.split('.')
-    else:
-        keys = key_path
-    
-    # Navigate through nested dictionaries
-    for key in keys:
-        if isinstance(text_dict, dict) and key in text_dict:
-            text_dict = text_dict[key]
-        else:
-            # Fallback to Chinese if not found
-            if lang != 'zh_CN' and 'zh_CN' in locales:
-                return get_text(key_path, 'zh_CN', default=default, **kwargs)
-            return default if default is not None else key_path
-    
+    if not isinstance(key_path, str):
+        key_path = '.'.join(key_path)
+
+    entry = catalog.templates.get((lang, key_path))
+    if entry is None:
+        return default if default is not None else key_path
+
     # Format text
-    if isinstance(text_dict, str) and kwargs:
+    text, needs_format = entry
+    if needs_format and kwargs:
         try:
-            return text_dict.format(**kwargs)
+            return text.format(**kwargs)
         except:
-            return text_dict
-    
-    return text_dict if isinstance(text_dict, str) else (default if default is not None else key_path)
+            return text
+    return text
 
 # Get user language (can be extended based on user preferences, currently uses default language)
 def get_user_lang(telegram_id=None):
@@ -222,14 +347,35 @@ def get_log_text(key_path, lang=None, default=None, **kwargs):
         lang = DEFAULT_LANGUAGE
     return get_text(key_path, lang=lang, default=default, **kwargs)
 
+def load_locales():
+    """
+    Rebuild the locale catalog if LOCALES_FILE changed since the last load (scheduled every LOCALES_RELOAD_SECONDS)
+    The new catalog replaces the old one in a single assignment, so get_text() never sees a half-loaded file.
+    If the file cannot be loaded the current catalog is kept.
+    :return: True if a new catalog was loaded
+    """
+    global locale_catalog, _locales_stamp
+    try:
+        st = os.stat(LOCALES_FILE)
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == _locales_stamp:
+            return False
+        _locales_stamp = stamp
+        with open(LOCALES_FILE, 'r', encoding='utf-8') as f:
+            catalog = LocaleCatalog(json.load(f), locale_catalog.version + 1)
+    except Exception as e:
+        if locale_catalog.languages:
+            print(get_log_text('logs.config_file_reload_failed', file=LOCALES_FILE, error=str(e)))
+        else:
+            print(get_log_text('logs.config_failed_load_locales', error=str(e)))
+        return False
+    locale_catalog = catalog
+    print(get_log_text('logs.config_loaded_languages', count=len(catalog.languages)))
+    catalog.report()
+    return True
+
 # Load locales after get_text is defined
-try:
-    with open(LOCALES_FILE, 'r', encoding='utf-8') as f:
-        locales = json.load(f)
-        print(get_log_text('logs.config_loaded_languages', count=len(locales)))
-except Exception as e:
-    print(get_log_text('logs.config_failed_load_locales', error=str(e)))
-    locales = {}
+load_locales()
 
 print(get_log_text('logs.config_bot_token', token=BOT_TOKEN))
 print(get_log_text('logs.config_admin_ids', ids=ADMIN_IDS))
@@ -242,139 +388,1148 @@ print(get_log_text('logs.config_news_broadcasting', status='Enabled' if NEWS_ENA
 SIGNIN_WORDS_FILE = 'signin_words.txt'
 current_signin_word = ""
 
+# ===== File-backed configuration cache =====
+class CachedFile:
+    """
+    Parsed view of a configuration file that is only re-read when the file changes.
+    get() stats the file and reparses it when its mtime or size differ from the last load;
+    the parsed value is swapped in under a lock, so every thread sees either the old or the new snapshot.
+    If the file disappears the default is returned; if it fails to parse, the last good value is kept.
+    Callers must treat the returned value as read-only.
+    """
+    def __init__(self, path, parser, default=None):
+        self.path = path
+        self.parser = parser
+        self.default = default
+        self.value = default
+        self.error = None
+        self.version = 0
+        self._stamp = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size), None
+        except OSError as e:
+            return None, e
+
+    def get(self):
+        stamp, stat_error = self._stat()
+        if self._loaded and stamp == self._stamp:
+            return self.value
+        with self._lock:
+            if self._loaded and stamp == self._stamp:
+                return self.value
+            if stamp is None:
+                self.value, self.error = self.default, str(stat_error)
+            else:
+                try:
+                    self.value, self.error = self.parser(self.path), None
+                except Exception as e:
+                    self.error = str(e)
+                    print(get_log_text('logs.config_file_reload_failed', file=self.path, error=self.error))
+            self._stamp = stamp
+            self._loaded = True
+            self.version += 1
+            return self.value
+
+    def require(self):
+        """Like get(), but raise if the file is missing or has never parsed successfully"""
+        value = self.get()
+        if self.error and value is self.default:
+            raise RuntimeError(self.error)
+        return value
+
+    def reload(self):
+        """Force a re-read on the next access, even if the file stat is unchanged"""
+        with self._lock:
+            self._loaded = False
+        return self.get()
+
+def _read_json_file(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
 # ===== Activity matching configuration =====
 ACTIVITIES_FILE = "activities.json"
-activities = []
+
+def _parse_activities(path):
+    data = _read_json_file(path)
+    print(get_log_text('logs.activity_config_loaded', count=len(data)))
+    return data
+
+activities_file = CachedFile(ACTIVITIES_FILE, _parse_activities, [])
 
 def load_activities():
-    global activities
+    return activities_file.get()
+
+# ===== Database connection layer =====
+# Every thread reuses one tuned SQLite connection instead of opening a new one per query.
+DB_FILE = 'telegram_bot.db'
+DB_BUSY_TIMEOUT_MS = config.get('DB_BUSY_TIMEOUT_MS', 5000)  # How long a writer waits for the database lock
+DB_CACHE_SIZE_KB = config.get('DB_CACHE_SIZE_KB', 16384)  # Page cache size per connection
+DB_MMAP_SIZE_MB = config.get('DB_MMAP_SIZE_MB', 128)  # Memory-mapped I/O size per connection (0 to disable)
+
+_db_local = threading.local()
+
+def open_db_connection():
+    """Open a new tuned SQLite connection; most code should use db_cursor() instead"""
+    conn = sqlite3.connect(DB_FILE, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA cache_size=-{int(DB_CACHE_SIZE_KB)}')
+    conn.execute(f'PRAGMA mmap_size={int(DB_MMAP_SIZE_MB) * 1024 * 1024}')
+    conn.execute(f'PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT_MS)}')
+    return conn
+
+def get_db_connection():
+    """Return the calling thread's SQLite connection, opening and tuning it on first use"""
+    conn = getattr(_db_local, 'conn', None)
+    if conn is None:
+        conn = open_db_connection()
+        _db_local.conn = conn
+        _db_local.depth = 0
+        _db_local.on_commit = []
+    return conn
+
+@contextmanager
+def db_cursor(immediate=False):
+    """
+    Get a cursor on the thread-local connection
+    The outermost block commits on success and rolls back on exception, nested blocks join it.
+    :param immediate: Take the write lock up front (BEGIN IMMEDIATE), for read-check-write sequences
+    """
+    conn = get_db_connection()
+    outermost = _db_local.depth == 0
+    if outermost and immediate:
+        conn.execute('BEGIN IMMEDIATE')
+    _db_local.depth += 1
+    cursor = conn.cursor()
     try:
-        with open(ACTIVITIES_FILE, "r", encoding="utf-8") as f:
-            activities = json.load(f)
-            print(get_log_text('logs.activity_config_loaded', count=len(activities)))
-    except Exception as e:
-        print(get_log_text('logs.activity_config_failed', error=str(e)))
-        activities = []
-
-# Initialize database fields
-conn = sqlite3.connect('telegram_bot.db')
-cursor = conn.cursor()
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS users (
-    telegram_id INTEGER PRIMARY KEY,
-    last_signin TEXT,
-    points INTEGER DEFAULT 0,
-    binance_uid TEXT,
-    twitter_handle TEXT,
-    a_account TEXT,
-    invited_by TEXT,
-    joined_group INTEGER DEFAULT 0,
-    name TEXT,
-    custom_id TEXT,
-    last_bonus_date TEXT,
-    unlocked_points INTEGER DEFAULT 0
-)
-''')
-conn.commit()
-
-cursor.execute('''CREATE TABLE IF NOT EXISTS quiz_answers (
-    quiz_id TEXT,
-    telegram_id INTEGER,
-    PRIMARY KEY (quiz_id, telegram_id)
-)''')
-conn.commit()
-
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS signin_history (
-    telegram_id INTEGER,
-    date TEXT
-)
-''')
-conn.commit()
-
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS submissions (
-    telegram_id INTEGER,
-    type TEXT, 
-    link TEXT,
-    campaign_id TEXT,        
-    PRIMARY KEY (telegram_id, campaign_id, type, link)
-)
-''')
+        yield cursor
+    except BaseException:
+        _db_local.depth -= 1
+        cursor.close()
+        if outermost:
+            conn.rollback()
+            _db_local.on_commit.clear()
+        raise
+    _db_local.depth -= 1
+    cursor.close()
+    if outermost:
+        try:
+            conn.commit()
+        except BaseException:
+            # A failed COMMIT (disk full, I/O error) leaves the transaction open; end it so the next block starts clean
+            conn.rollback()
+            _db_local.on_commit.clear()
+            raise
+        callbacks, _db_local.on_commit = _db_local.on_commit, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(get_log_text('logs.after_commit_failed', error=repr(e)))
 
-conn.commit()
+def after_commit(callback):
+    """
+    Run callback once the current transaction has committed (right away when not in one)
+    Callbacks of a transaction that rolls back are dropped. Use it to keep in-memory caches in step with the database.
+    """
+    get_db_connection()
+    if _db_local.depth == 0:
+        callback()
+    else:
+        _db_local.on_commit.append(callback)
+
+_inherited_db_locals = []
+
+def _reset_db_after_fork():
+    # An SQLite connection must not be used across fork(); the child opens its own. The parent's connection
+    # objects are kept referenced so they are never closed (and finalized) from the child.
+    global _db_local
+    _inherited_db_locals.append(_db_local)
+    _db_local = threading.local()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_db_after_fork)
+
+# ===== User cache =====
+# get_user() answers from a small LRU cache of users rows. Every statement that writes the users table
+# drops the affected rows through invalidate_cached_users(), which takes effect when its transaction commits.
+USER_CACHE_SIZE = config.get('USER_CACHE_SIZE', 10000)  # Users kept in memory
+USER_CACHE_TTL_SECONDS = config.get('USER_CACHE_TTL_SECONDS', 60)  # Re-read a cached user after this long
+
+# One row of the users table; still indexable like the plain tuple it replaces
+UserRecord = namedtuple('UserRecord', [
+    'telegram_id', 'last_signin', 'points', 'binance_uid', 'twitter_handle', 'a_account',
+    'invited_by', 'joined_group', 'name', 'custom_id', 'last_bonus_date', 'unlocked_points',
+])
+USER_COLUMNS = ', '.join(UserRecord._fields)
+
+class UserCache:
+    """
+    LRU cache {telegram_id: UserRecord} whose entries expire after ttl seconds
+    A row read while an invalidation happened may already be stale, so put() ignores it (checked by generation).
+    """
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # {telegram_id: (expires_at, UserRecord)}, least recently used first
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, telegram_id):
+        with self._lock:
+            entry = self._entries.get(telegram_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[telegram_id]
+                return None
+            self._entries.move_to_end(telegram_id)
+            return entry[1]
+
+    def put(self, telegram_id, record, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[telegram_id] = (time.monotonic() + self.ttl, record)
+            self._entries.move_to_end(telegram_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, telegram_ids):
+        with self._lock:
+            self._generation += 1
+            for telegram_id in telegram_ids:
+                self._entries.pop(telegram_id, None)
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+user_cache_listeners = []  # Also called with every committed invalidation, e.g. to pass it on to worker processes
+
+def invalidate_cached_users(telegram_ids):
+    """Call next to any write of the users table: the rows are dropped from user_cache once it commits"""
+    telegram_ids = list(telegram_ids)
+
+    def invalidate():
+        user_cache.invalidate(telegram_ids)
+        for listener in user_cache_listeners:
+            listener(telegram_ids)
+    after_commit(invalidate)
+
+# ===== Async runtime =====
+# An asyncio event loop running in a background thread, used for long-running handlers.
+# Blocking work (Telegram API calls, SQLite) is awaited through executors so the loop itself never blocks.
+ASYNC_IO_WORKERS = config.get('ASYNC_IO_WORKERS', 16)  # Threads for blocking API calls awaited by coroutines
+ASYNC_DB_WORKERS = config.get('ASYNC_DB_WORKERS', 4)  # Threads for database calls awaited by coroutines
+
+class AsyncRuntime:
+    """
+    Lazily started event loop thread plus the executors coroutines use for blocking calls.
+    Started per process (checked by pid), so a forked worker gets its own loop.
+    """
+    def __init__(self, io_workers, db_workers):
+        self.io_workers = io_workers
+        self.db_workers = db_workers
+        self.loop = None
+        self._io_executor = None
+        self._db_executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return self.loop
+        with self._lock:
+            if self._pid == os.getpid():
+                return self.loop
+            loop = asyncio.new_event_loop()
+            self._io_executor = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix='async-io')
+            self._db_executor = ThreadPoolExecutor(max_workers=self.db_workers, thread_name_prefix='async-db')
+            loop.set_default_executor(self._io_executor)
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            threading.Thread(target=run, name='async-runtime', daemon=True).start()
+            ready.wait()
+            self.loop = loop
+            self._pid = os.getpid()
+            return loop
+
+    def submit(self, coro):
+        """Schedule a coroutine from any thread; returns a concurrent.futures.Future"""
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+        future.add_done_callback(_log_async_failure)
+        return future
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """Await a blocking call, e.g. a Telegram API request"""
+        return await asyncio.get_running_loop().run_in_executor(self._io_executor, functools.partial(func, *args, **kwargs))
+
+    async def run_db(self, func, *args, **kwargs):
+        """Await a database helper; each DB worker thread keeps its own SQLite connection"""
+        return await asyncio.get_running_loop().run_in_executor(self._db_executor, functools.partial(func, *args, **kwargs))
+
+def _log_async_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(get_log_text('logs.async_task_failed', error=repr(future.exception())))
+
+async_runtime = AsyncRuntime(ASYNC_IO_WORKERS, ASYNC_DB_WORKERS)
+
+def async_handler(func):
+    """
+    Compatibility layer for porting handlers to coroutines one at a time
+    Put it under the telebot decorator of an `async def` handler: telebot calls the wrapper from
+    its worker thread, which only schedules the coroutine and returns straight away.
+    Inside the coroutine, await async_runtime.run_blocking(bot.send_message, ...) and
+    async_runtime.run_db(...) instead of calling them directly, and asyncio.sleep instead of time.sleep.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return async_runtime.submit(func(*args, **kwargs))
+    return wrapper
+
+# ===== Delayed action scheduler =====
+# Pending deletes/unpins live in one heap served by a single thread and are mirrored in scheduled_actions,
+# so they survive restarts. Deletions that fall due together in the same chat go out as one deleteMessages call.
+DELAYED_ACTION_BATCH_WINDOW_SECONDS = config.get('DELAYED_ACTION_BATCH_WINDOW_SECONDS', 1)  # Actions due within this window are executed together
+DELETE_MESSAGES_BATCH_SIZE = 100  # Telegram limit for deleteMessages
+
+class DelayedActionScheduler:
+    """
+    Single-thread scheduler for delayed bot actions ('delete', 'unpin', 'close_quiz').
+    Heap entries are (run_at, action_id, action, chat_id, message_id, payload); run_at is a Unix timestamp.
+    """
+    def __init__(self, batch_window):
+        self.batch_window = batch_window
+        self._heap = []
+        self._cond = threading.Condition()
+        self._pid = None
+
+    def start(self):
+        """Load actions persisted by a previous run and start the scheduler thread (once per process)"""
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            with db_cursor() as cursor:
+                cursor.execute('SELECT run_at, id, action, chat_id, message_id, payload FROM scheduled_actions')
+                self._heap = [tuple(row) for row in cursor.fetchall()]
+            heapq.heapify(self._heap)
+            if self._heap:
+                print(get_log_text('logs.delayed_actions_restored', count=len(self._heap)))
+            threading.Thread(target=self._run, name='delayed-actions', daemon=True).start()
+            self._pid = os.getpid()
+
+    def schedule(self, action, delay, chat_id=None, message_id=None, payload=None):
+        self.start()
+        run_at = time.time() + delay
+        with db_cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO scheduled_actions (run_at, action, chat_id, message_id, payload)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (run_at, action, chat_id, message_id, payload))
+            action_id = cursor.lastrowid
+        with self._cond:
+            heapq.heappush(self._heap, (run_at, action_id, action, chat_id, message_id, payload))
+            self._cond.notify()
+        return action_id
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.time():
+                    self._cond.wait(self._heap[0][0] - time.time() if self._heap else None)
+                horizon = time.time() + self.batch_window
+                due = []
+                while self._heap and self._heap[0][0] <= horizon:
+                    due.append(heapq.heappop(self._heap))
+            try:
+                self._execute(due)
+            except Exception as e:
+                print(get_log_text('logs.delayed_action_failed', action='batch', chat_id='-', error=str(e)))
 
-cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transfers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            sender_id INTEGER,
-            recipient_id INTEGER,
-            amount INTEGER,
-            timestamp TEXT
-        )
+    def _execute(self, due):
+        deletes = defaultdict(list)  # {chat_id: [(message_id, label)]}
+        for _, _, action, chat_id, message_id, payload in due:
+            try:
+                if action == 'delete':
+                    deletes[chat_id].append((message_id, payload or ""))
+                elif action == 'unpin':
+                    bot.unpin_chat_message(chat_id, message_id=message_id)
+                elif action == 'close_quiz':
+                    disable_quiz(payload)
+            except Exception as e:
+                print(get_log_text('logs.delayed_action_failed', action=action, chat_id=chat_id, error=str(e)))
+
+        for chat_id, items in deletes.items():
+            for i in range(0, len(items), DELETE_MESSAGES_BATCH_SIZE):
+                chunk = items[i:i + DELETE_MESSAGES_BATCH_SIZE]
+                if len(chunk) == 1:
+                    safe_delete(chat_id, chunk[0][0], chunk[0][1])
+                    continue
+                try:
+                    bot.delete_messages(chat_id, [message_id for message_id, _ in chunk])
+                except Exception as e:
+                    labels = ", ".join(sorted({label for _, label in chunk if label})) or "batch"
+                    print(get_log_text('logs.error_delete_message', label=labels, msg_id=[m for m, _ in chunk], error=str(e)))
+
+        with db_cursor() as cursor:
+            cursor.executemany('DELETE FROM scheduled_actions WHERE id = ?', [(entry[1],) for entry in due])
+
+delayed_actions = DelayedActionScheduler(DELAYED_ACTION_BATCH_WINDOW_SECONDS)
+
+def schedule_delete(chat_id, message_id, delay, label=""):
+    """Delete a message after delay seconds"""
+    return delayed_actions.schedule('delete', delay, chat_id, message_id, label)
+
+def schedule_unpin(chat_id, message_id, delay):
+    """Unpin a message after delay seconds"""
+    return delayed_actions.schedule('unpin', delay, chat_id, message_id)
+
+def schedule_quiz_close(quiz_id, delay):
+    """End the quiz after delay seconds (no-op if another quiz replaced it)"""
+    return delayed_actions.schedule('close_quiz', delay, payload=quiz_id)
+
+# ===== Red packet engine =====
+# A red packet is split into its shares when it is sent; the shares are stored in red_packet_shares and each
+# claim pops the next one inside a single write transaction, so concurrent clicks can never oversubscribe a packet.
+RED_PACKET_EXPIRE_HOURS = 24  # Unclaimed shares can no longer be claimed after this long
+
+def split_red_packet(total_points, count):
+    """
+    Random split of total_points into count shares of at least 1 point each (requires count <= total_points)
+    Each share is drawn from 1 to twice the average of what is left, like the original per-click draw.
+    """
+    shares = []
+    remaining_points = total_points
+    for remaining_count in range(count, 0, -1):
+        if remaining_count == 1:
+            amount = remaining_points
+        else:
+            max_possible = int(remaining_points / remaining_count * 2)
+            amount = random.randint(1, min(max_possible, remaining_points - (remaining_count - 1)))
+        shares.append(amount)
+        remaining_points -= amount
+    return shares
+
+def _insert_red_packet_shares(cursor, packet_id, shares):
+    cursor.executemany('INSERT INTO red_packet_shares (packet_id, seq, points) VALUES (?, ?, ?)',
+                       [(packet_id, seq, points) for seq, points in enumerate(shares)])
+
+def create_red_packet(sender_id, total_points, count):
+    """
+    Deduct total_points from the sender's unlocked points and create the packet with its shares
+    :return: packet_id, or None if the sender does not have enough unlocked points
+    """
+    with db_cursor(immediate=True) as cursor:
+        cursor.execute('''
+            UPDATE users
+            SET unlocked_points = unlocked_points - ?
+            WHERE telegram_id = ? AND unlocked_points >= ?
+        ''', (total_points, sender_id, total_points))
+        if not cursor.rowcount:
+            return None
+        invalidate_cached_users([sender_id])
+
+        packet_id = str(uuid4())
+        cursor.execute('''
+            INSERT INTO red_packets (id, sender_id, total_points, count, created_at, remaining_points)
+            VALUES (?, ?, ?, ?, datetime('now'), ?)
+        ''', (packet_id, sender_id, total_points, count, total_points))
+        _insert_red_packet_shares(cursor, packet_id, split_red_packet(total_points, count))
+    return packet_id
+
+def _red_packet_claim_status(cursor, packet_id, telegram_id):
+    """Why the user cannot claim the packet ('already_claimed', 'not_found', 'expired', 'empty'), or None"""
+    cursor.execute('''
+        SELECT EXISTS (SELECT 1 FROM red_packet_claims WHERE packet_id = p.id AND telegram_id = ?),
+               p.expired OR p.created_at <= datetime('now', ?),
+               p.claimed_count >= p.count OR p.remaining_points <= 0
+        FROM red_packets p
+        WHERE p.id = ?
+    ''', (telegram_id, f'-{RED_PACKET_EXPIRE_HOURS} hours', packet_id))
+    row = cursor.fetchone()
+    if row is None:
+        return 'not_found'
+    already_claimed, expired, empty = row
+    if already_claimed:
+        return 'already_claimed'
+    if expired:
+        return 'expired'
+    if empty:
+        return 'empty'
+    return None
+
+def claim_red_packet_share(packet_id, telegram_id):
+    """
+    Claim the next share of a red packet for the user
+    :return: (status, amount): status is 'claimed' or the reason it failed, amount is 0 unless claimed
+    """
+    # Most clicks on a popular packet fail (empty, repeated); answer those without taking the write lock
+    with db_cursor() as cursor:
+        status = _red_packet_claim_status(cursor, packet_id, telegram_id)
+    if status:
+        return status, 0
+
+    with db_cursor(immediate=True) as cursor:
+        status = _red_packet_claim_status(cursor, packet_id, telegram_id)
+        if status:
+            return status, 0
+        cursor.execute('SELECT seq, points FROM red_packet_shares WHERE packet_id = ? ORDER BY seq LIMIT 1', (packet_id,))
+        share = cursor.fetchone()
+        if share is None:
+            return 'empty', 0
+        seq, amount = share
+        cursor.execute('DELETE FROM red_packet_shares WHERE packet_id = ? AND seq = ?', (packet_id, seq))
+        cursor.execute("UPDATE red_packets SET claimed_count = claimed_count + 1, remaining_points = remaining_points - ? WHERE id = ?", (amount, packet_id))
+        cursor.execute("INSERT INTO red_packet_claims (packet_id, telegram_id, claimed_points) VALUES (?, ?, ?)", (packet_id, telegram_id, amount))
+        cursor.execute("UPDATE users SET unlocked_points = unlocked_points + ? WHERE telegram_id = ?", (amount, telegram_id))
+        invalidate_cached_users([telegram_id])
+    return 'claimed', amount
+
+# ===== Red packet refunds =====
+# Every night packets older than RED_PACKET_EXPIRE_HOURS are marked expired and what is left of them goes back to
+# the sender's unlocked points, one transaction per batch. Senders are then told once each, paced like batch
+# notifications; refund_pending marks refunds not announced yet, so both steps pick up again after a restart.
+REDPACKET_REFUND_BATCH_SIZE = config.get('REDPACKET_REFUND_BATCH_SIZE', 500)  # Expired packets refunded per transaction
+REDPACKET_REFUND_NOTIFY_PER_SECOND = config.get('REDPACKET_REFUND_NOTIFY_PER_SECOND', 10)  # Refund notifications sent per second
+
+class RedPacketRefunder:
+    """Worker thread that runs refund sweeps and then sends the pending refund notifications"""
+    def __init__(self, batch_size, per_second):
+        self.batch_size = batch_size
+        self.interval = 1.0 / per_second
+        self._tasks = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def start(self):
+        """Start the worker thread (once per process) and catch up on refunds missed while the bot was down"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._run, name='redpacket-refunds', daemon=True).start()
+            self._pid = os.getpid()
+        self._tasks.put('sweep')
+
+    def request_sweep(self):
+        """Scheduled job: queue a sweep on the worker thread"""
+        self.start()
+        self._tasks.put('sweep')
+
+    def _run(self):
+        while True:
+            self._tasks.get()
+            try:
+                self.sweep()
+                self._notify_pending()
+            except Exception as e:
+                print(get_log_text('logs.redpacket_refund_task_error', error=str(e)))
+
+    def sweep(self):
+        """
+        Expire and refund all packets past their lifetime; packets already marked expired are never refunded again
+        :return: (packets refunded, points refunded)
+        """
+        print(get_log_text('logs.redpacket_refund_task_executing', datetime=datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        refunded_count = refunded_total = 0
+        while True:
+            with db_cursor(immediate=True) as cursor:
+                cursor.execute('''
+                    SELECT id, sender_id, remaining_points FROM red_packets
+                    WHERE expired = 0 AND created_at <= datetime('now', ?)
+                    LIMIT ?
+                ''', (f'-{RED_PACKET_EXPIRE_HOURS} hours', self.batch_size))
+                packets = cursor.fetchall()
+                if not packets:
+                    break
+                refunds = defaultdict(int)  # {sender_id: points}
+                for _, sender_id, remaining_points in packets:
+                    if remaining_points and remaining_points > 0:
+                        refunds[sender_id] += remaining_points
+                cursor.executemany('UPDATE red_packets SET expired = 1, refund_pending = remaining_points > 0 WHERE id = ?',
+                                   [(packet_id,) for packet_id, _, _ in packets])
+                cursor.executemany('DELETE FROM red_packet_shares WHERE packet_id = ?', [(packet_id,) for packet_id, _, _ in packets])
+                cursor.executemany('UPDATE users SET unlocked_points = unlocked_points + ? WHERE telegram_id = ?',
+                                   [(points, sender_id) for sender_id, points in refunds.items()])
+                invalidate_cached_users(refunds)
+            refunded_count += sum(1 for _, _, remaining_points in packets if remaining_points and remaining_points > 0)
+            refunded_total += sum(refunds.values())
+            if len(packets) < self.batch_size:
+                break
+
+        if refunded_count:
+            print(get_log_text('logs.redpacket_refund_summary', count=refunded_count, total=refunded_total))
+        else:
+            print(get_log_text('logs.redpacket_refund_none'))
+        return refunded_count, refunded_total
+
+    def _notify_pending(self):
+        # One message per sender, covering all of their refunded packets
+        while True:
+            with db_cursor() as cursor:
+                cursor.execute('''
+                    SELECT sender_id, COUNT(*), SUM(remaining_points), MAX(rowid) FROM red_packets
+                    WHERE refund_pending = 1
+                    GROUP BY sender_id LIMIT 200
+                ''')
+                senders = cursor.fetchall()
+            if not senders:
+                return
+            for sender_id, count, points, max_rowid in senders:
+                started = time.monotonic()
+                try:
+                    # Use default language for notification
+                    with outbound_lane(OUTBOUND_LANE_BROADCAST):
+                        bot.send_message(sender_id, get_text('redpacket.refunded', DEFAULT_LANGUAGE, count=count, points=points))
+                except Exception as e:
+                    print(get_log_text('logs.redpacket_refund_notify_failed', sender_id=sender_id, error=str(e)))
+                with db_cursor() as cursor:
+                    cursor.execute('UPDATE red_packets SET refund_pending = 0 WHERE sender_id = ? AND refund_pending = 1 AND rowid <= ?',
+                                   (sender_id, max_rowid))
+                time.sleep(max(0, self.interval - (time.monotonic() - started)))
+
+red_packet_refunds = RedPacketRefunder(REDPACKET_REFUND_BATCH_SIZE, REDPACKET_REFUND_NOTIFY_PER_SECOND)
+
+# ===== Schema migrations =====
+# The schema is built by numbered migration steps; schema_version records which ones have been applied.
+# On startup every newer step runs once, in its own transaction. Released steps are never edited:
+# to change the schema, append a new step to MIGRATIONS.
+
+def _migration_001_base_tables(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        telegram_id INTEGER PRIMARY KEY,
+        last_signin TEXT,
+        points INTEGER DEFAULT 0,
+        binance_uid TEXT,
+        twitter_handle TEXT,
+        a_account TEXT,
+        invited_by TEXT,
+        joined_group INTEGER DEFAULT 0,
+        name TEXT,
+        custom_id TEXT,
+        last_bonus_date TEXT,
+        unlocked_points INTEGER DEFAULT 0
+    )
     ''')
-conn.commit()
-
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS red_packets (
-    id TEXT PRIMARY KEY,
-    sender_id INTEGER,
-    total_points INTEGER,
-    count INTEGER,
-    created_at TEXT,
-    remaining_points INTEGER,
-    claimed_count INTEGER DEFAULT 0,
-    expired INTEGER DEFAULT 0
-)
 
+    cursor.execute('''CREATE TABLE IF NOT EXISTS quiz_answers (
+        quiz_id TEXT,
+        telegram_id INTEGER,
+        PRIMARY KEY (quiz_id, telegram_id)
+    )''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS signin_history (
+        telegram_id INTEGER,
+        date TEXT
+    )
     ''')
-conn.commit()
-
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS red_packet_claims (
-    packet_id TEXT,
-    telegram_id INTEGER,
-    claimed_points INTEGER,
-    PRIMARY KEY (packet_id, telegram_id)
-)
 
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS submissions (
+        telegram_id INTEGER,
+        type TEXT, 
+        link TEXT,
+        campaign_id TEXT,        
+        PRIMARY KEY (telegram_id, campaign_id, type, link)
+    )
     ''')
-conn.commit()
-
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS monthly_snapshot (
-    telegram_id INTEGER,
-    month TEXT,
-    snapshot_points INTEGER,
-    PRIMARY KEY (telegram_id, month)
-)
 
+    cursor.execute('''
+            CREATE TABLE IF NOT EXISTS transfers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sender_id INTEGER,
+                recipient_id INTEGER,
+                amount INTEGER,
+                timestamp TEXT
+            )
+        ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS red_packets (
+        id TEXT PRIMARY KEY,
+        sender_id INTEGER,
+        total_points INTEGER,
+        count INTEGER,
+        created_at TEXT,
+        remaining_points INTEGER,
+        claimed_count INTEGER DEFAULT 0,
+        expired INTEGER DEFAULT 0
+    )
+
+        ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS red_packet_claims (
+        packet_id TEXT,
+        telegram_id INTEGER,
+        claimed_points INTEGER,
+        PRIMARY KEY (packet_id, telegram_id)
+    )
+
+        ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS monthly_snapshot (
+        telegram_id INTEGER,
+        month TEXT,
+        snapshot_points INTEGER,
+        PRIMARY KEY (telegram_id, month)
+    )
+
+        ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS monthly_points (
+        telegram_id INTEGER,
+        month TEXT,                 -- Format: '2025-08'
+        earned INTEGER DEFAULT 0,
+        PRIMARY KEY (telegram_id, month)
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS points_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        telegram_id INTEGER NOT NULL,
+        amount INTEGER NOT NULL,
+        reason TEXT,
+        created_at TEXT NOT NULL
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS message_counts (
+        telegram_id INTEGER,
+        month TEXT,                 -- Format: '2025-08'
+        count INTEGER DEFAULT 0,
+        PRIMARY KEY (telegram_id, month)
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_message_counts_month_count ON message_counts (month, count DESC)')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS rss_feed_state (
+        url TEXT PRIMARY KEY,
+        etag TEXT,
+        last_modified TEXT,
+        last_fetched TEXT
+    )
     ''')
-conn.commit()
-
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS monthly_points (
-    telegram_id INTEGER,
-    month TEXT,                 -- Format: '2025-08'
-    earned INTEGER DEFAULT 0,
-    PRIMARY KEY (telegram_id, month)
-)
-''')
 
-conn.commit()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS rss_entries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        entry_key TEXT UNIQUE,      -- Feed entry id, or link when the feed has no ids
+        feed_url TEXT,
+        title TEXT,
+        link TEXT,
+        fetched_at TEXT NOT NULL,
+        broadcast_at TEXT           -- NULL until the entry has been sent in a news broadcast
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_rss_entries_link ON rss_entries (link)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_rss_entries_pending ON rss_entries (broadcast_at, fetched_at)')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS scheduled_actions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_at REAL NOT NULL,       -- Unix timestamp
+        action TEXT NOT NULL,       -- 'delete', 'unpin' or 'close_quiz'
+        chat_id INTEGER,
+        message_id INTEGER,
+        payload TEXT
+    )
+    ''')
 
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS points_log (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    telegram_id INTEGER NOT NULL,
-    amount INTEGER NOT NULL,
-    reason TEXT,
-    created_at TEXT NOT NULL
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS batch_notify_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        admin_id INTEGER NOT NULL,
+        lang TEXT,                  -- Language of the admin's progress messages
+        status_message_id INTEGER,  -- Admin message edited with the progress
+        total INTEGER NOT NULL,
+        sent INTEGER DEFAULT 0,
+        failed INTEGER DEFAULT 0,
+        last_item_id INTEGER DEFAULT 0,  -- Items up to this id have been processed
+        created_at TEXT NOT NULL,
+        finished_at TEXT
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS batch_notify_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_id INTEGER NOT NULL,
+        telegram_id INTEGER NOT NULL,
+        points INTEGER NOT NULL,
+        total INTEGER NOT NULL      -- User's points right after this row was applied
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_batch_notify_items_job ON batch_notify_items (job_id, id)')
+
+def _migration_002_query_indexes(cursor):
+    # Sign-in streak count (process_signin)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_signin_history_user_date ON signin_history (telegram_id, date)')
+    # /transfers
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transfers_sender ON transfers (sender_id, timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transfers_recipient ON transfers (recipient_id, timestamp)')
+    # /invites, /me
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_invited_by ON users (invited_by, joined_group)')
+    # /recent_points
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_points_log_user_created ON points_log (telegram_id, created_at)')
+    # /ranking, /export_month_rank
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_monthly_points_month_earned ON monthly_points (month, earned DESC)')
+    # Duplicate submission check, /export_submissions_by_campaign
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_submissions_user_type_link ON submissions (telegram_id, type, link)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_submissions_campaign ON submissions (campaign_id)')
+
+def _migration_003_write_behind_state(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS write_behind_state (
+        name TEXT PRIMARY KEY,      -- Buffer name, e.g. 'chat_points'
+        last_seq INTEGER NOT NULL   -- Highest journal sequence number already applied
+    )
+    ''')
+
+def _migration_004_red_packet_shares(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS red_packet_shares (
+        packet_id TEXT,
+        seq INTEGER,        -- Claim order
+        points INTEGER,
+        PRIMARY KEY (packet_id, seq)
+    )
+    ''')
+    # Split what is left of packets that can still be claimed
+    cursor.execute('''
+        SELECT id, remaining_points, count - claimed_count FROM red_packets
+        WHERE expired = 0 AND claimed_count < count AND remaining_points > 0 AND created_at > datetime('now', ?)
+    ''', (f'-{RED_PACKET_EXPIRE_HOURS} hours',))
+    for packet_id, remaining_points, remaining_count in cursor.fetchall():
+        _insert_red_packet_shares(cursor, packet_id, split_red_packet(remaining_points, min(remaining_count, remaining_points)))
+
+def _migration_005_red_packet_refunds(cursor):
+    add_column_if_missing(cursor, 'red_packets', 'refund_pending', 'INTEGER DEFAULT 0')  # Refunded, sender not notified yet
+    # Refund sweep
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_red_packets_expired_created ON red_packets (expired, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_red_packets_refund_pending ON red_packets (sender_id) WHERE refund_pending = 1')
+    # Packets marked expired before the refund sweep existed were never refunded, and the sweep only picks up
+    # unexpired ones: refund what is left of them here, once, and leave the senders to the refund notifier
+    cursor.execute('''
+        SELECT sender_id, SUM(remaining_points) FROM red_packets
+        WHERE expired = 1 AND remaining_points > 0
+        GROUP BY sender_id
+    ''')
+    refunds = cursor.fetchall()
+    cursor.executemany('UPDATE users SET unlocked_points = unlocked_points + ? WHERE telegram_id = ?',
+                       [(points, sender_id) for sender_id, points in refunds])
+    cursor.execute('UPDATE red_packets SET refund_pending = 1 WHERE expired = 1 AND remaining_points > 0')
+    invalidate_cached_users([sender_id for sender_id, _ in refunds])
+
+# (version, name, step) in the order they are applied
+MIGRATIONS = [
+    (1, 'base tables', _migration_001_base_tables),
+    (2, 'query indexes', _migration_002_query_indexes),
+    (3, 'write-behind state', _migration_003_write_behind_state),
+    (4, 'red packet shares', _migration_004_red_packet_shares),
+    (5, 'red packet refunds', _migration_005_red_packet_refunds),
+]
+
+def add_column_if_missing(cursor, table, column, definition):
+    """For migration steps: add a column unless it exists (e.g. created by an older manual fix)"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def apply_migrations():
+    """Apply pending migration steps; safe to run from several processes at once"""
+    with db_cursor(immediate=True) as cursor:
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_at TEXT NOT NULL
+        )
+        ''')
+        cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+        current = cursor.fetchone()[0]
+
+    for version, name, step in MIGRATIONS:
+        if version <= current:
+            continue
+        with db_cursor(immediate=True) as cursor:
+            # Re-check under the write lock in case another process applied it meanwhile
+            cursor.execute('SELECT 1 FROM schema_version WHERE version = ?', (version,))
+            if cursor.fetchone():
+                continue
+            step(cursor)
+            cursor.execute(
+                'INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)',
+                (version, name, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            )
+        print(get_log_text('logs.schema_migrated', version=version, name=name))
+
+apply_migrations()
+
+# ===== Group message log writer =====
+# Handlers only enqueue log records; a background thread appends them to group_messages.log in batches.
+MESSAGE_LOG_QUEUE_SIZE = config.get('MESSAGE_LOG_QUEUE_SIZE', 10000)  # Records buffered in memory before new ones are dropped
+MESSAGE_LOG_BATCH_SIZE = config.get('MESSAGE_LOG_BATCH_SIZE', 500)  # Maximum records written per flush
+MESSAGE_LOG_FLUSH_INTERVAL_SECONDS = config.get('MESSAGE_LOG_FLUSH_INTERVAL_SECONDS', 1)  # Maximum delay before queued records reach the file
+MESSAGE_LOG_MAX_MB = config.get('MESSAGE_LOG_MAX_MB', 50)  # Rotate the log once it grows past this size (0 to disable)
+MESSAGE_LOG_ROTATE_HOURS = config.get('MESSAGE_LOG_ROTATE_HOURS', 24)  # Also rotate when the log was last written in an earlier period of this length (0 to disable)
+VERBOSE_MESSAGE_LOGS = config.get('VERBOSE_MESSAGE_LOGS', False)  # Print per-message debug lines to the console
+# Plain-text line format written by older versions, still understood when reading old logs
+MESSAGE_LOG_PATTERN = re.compile(r'\[(\d{4}-\d{2}-\d{2}) \d{2}:\d{2}:\d{2}\] .*?\[User: (.*?) \((\d+)\)\]')
+
+def debug_log(key, **kwargs):
+    """Print a per-message debug line only when VERBOSE_MESSAGE_LOGS is enabled"""
+    if VERBOSE_MESSAGE_LOGS:
+        print(get_log_text(key, **kwargs))
+
+class MessageLogWriter:
+    """
+    Background writer for the group message log.
+    write() only puts the record on a bounded queue; a daemon thread drains it in batches
+    (by size or after flush_interval), appends them as JSON lines and rotates the file
+    into gzip archives when it gets too large or too old.
+    """
+    def __init__(self, path, queue_size, batch_size, flush_interval, max_bytes, rotate_seconds):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.dropped = 0
+        self.lock_path = None  # Set when several processes append to the log: flock()ed around each batch
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Checked by pid so a forked worker starts its own writer thread
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            threading.Thread(target=self._run, name='message-log-writer', daemon=True).start()
+            self._pid = os.getpid()
+
+    def write(self, record):
+        """Queue one record (a JSON-serialisable dict) without blocking the caller"""
+        self._ensure_started()
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                print(get_log_text('logs.message_log_dropped', count=self.dropped))
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far is written (used at exit)"""
+        if self._pid != os.getpid():
+            return
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch, waiter = self._collect_batch()
+            if batch:
+                self._write_batch(batch)
+            if waiter:
+                waiter.set()
+
+    def _collect_batch(self):
+        batch = []
+        item = self._queue.get()
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            if isinstance(item, threading.Event):
+                return batch, item
+            batch.append(item)
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.batch_size or remaining <= 0:
+                return batch, None
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                return batch, None
+
+    def _write_batch(self, lines):
+        try:
+            if self.lock_path and fcntl is not None:
+                with open(self.lock_path, 'a') as lock:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                    self._append(lines)
+            else:
+                self._append(lines)
+        except Exception as e:
+            print(get_log_text('logs.error_write_log', error=str(e)))
+
+    def _append(self, lines):
+        self._maybe_rotate()
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(lines))
+
+    def _maybe_rotate(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        too_big = self.max_bytes and st.st_size >= self.max_bytes
+        too_old = self.rotate_seconds and int(st.st_mtime // self.rotate_seconds) != int(time.time() // self.rotate_seconds)
+        if not (too_big or too_old) or st.st_size == 0:
+            return
+
+        archive = f"{self.path}.{datetime.now().strftime('%Y%m%d-%H%M%S')}.gz"
+        n = 1
+        while os.path.exists(archive):
+            archive = f"{self.path}.{datetime.now().strftime('%Y%m%d-%H%M%S')}-{n}.gz"
+            n += 1
+        rotating = self.path + '.rotating'
+        os.replace(self.path, rotating)
+        with open(rotating, 'rb') as src, gzip.open(archive, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(rotating)
+        print(get_log_text('logs.message_log_rotated', file=archive))
+
+message_log = MessageLogWriter(
+    MESSAGE_LOG_FILE,
+    queue_size=MESSAGE_LOG_QUEUE_SIZE,
+    batch_size=MESSAGE_LOG_BATCH_SIZE,
+    flush_interval=MESSAGE_LOG_FLUSH_INTERVAL_SECONDS,
+    max_bytes=int(MESSAGE_LOG_MAX_MB * 1024 * 1024),
+    rotate_seconds=int(MESSAGE_LOG_ROTATE_HOURS * 3600),
 )
-''')
-conn.commit()
 
-conn.close()
+def parse_message_log_line(line):
+    """
+    Return (date 'YYYY-MM-DD', telegram_id) for a group message log line, or None
+    Understands both the JSON-lines format and the older plain-text format.
+    """
+    if line.startswith('{'):
+        try:
+            record = json.loads(line)
+            return record['ts'][:10], int(record['user_id'])
+        except (ValueError, KeyError, TypeError):
+            return None
+    match = MESSAGE_LOG_PATTERN.search(line)
+    if not match:
+        return None
+    return match.group(1), int(match.group(3))
+
+def iter_message_log_files(log_path=MESSAGE_LOG_FILE):
+    """Rotated gzip archives (oldest first) followed by the live log file"""
+    paths = sorted(glob.glob(glob.escape(log_path) + '.*.gz'), key=os.path.getmtime)
+    if os.path.exists(log_path):
+        paths.append(log_path)
+    return paths
+
+# ===== Group activity counters (feeds /active) =====
+# Messages are counted in memory and flushed to message_counts in batches.
+ACTIVITY_FLUSH_INTERVAL_SECONDS = config.get('ACTIVITY_FLUSH_INTERVAL_SECONDS', 10)
+
+_activity_buffer = defaultdict(int)  # {(telegram_id, month): pending message count}
+_activity_lock = threading.Lock()
+
+def record_message_activity(telegram_id):
+    month_str = datetime.now().strftime('%Y-%m')
+    with _activity_lock:
+        _activity_buffer[(telegram_id, month_str)] += 1
+
+def flush_activity_counts():
+    """Write buffered message counts in one transaction, keeping them buffered if the write fails"""
+    with _activity_lock:
+        if not _activity_buffer:
+            return
+        pending = list(_activity_buffer.items())
+        _activity_buffer.clear()
+
+    try:
+        with db_cursor() as cursor:
+            cursor.executemany('''
+                INSERT INTO message_counts (telegram_id, month, count)
+                VALUES (?, ?, ?)
+                ON CONFLICT(telegram_id, month)
+                DO UPDATE SET count = count + excluded.count
+            ''', [(tid, month, n) for (tid, month), n in pending])
+            stamp = leaderboard_stamp()
+    except Exception as e:
+        with _activity_lock:
+            for key, n in pending:
+                _activity_buffer[key] += n
+        print(get_log_text('logs.activity_flush_failed', error=str(e)))
+        return
+
+    by_month = defaultdict(list)
+    for (tid, month), n in pending:
+        by_month[month].append((tid, n))
+    for month, deltas in by_month.items():
+        activity_leaderboard.add(month, deltas, stamp)
+
+def backfill_activity_counts(log_path=MESSAGE_LOG_FILE, force=False):
+    """
+    Seed message_counts by streaming the group message log (and its rotated archives) once
+    Counts are replaced rather than added, so running it again is harmless.
+    :param force: Rebuild even if the table already has data
+    """
+    paths = iter_message_log_files(log_path)
+    if not paths:
+        return
+    with db_cursor() as cursor:
+        cursor.execute("SELECT 1 FROM message_counts LIMIT 1")
+        if cursor.fetchone() and not force:
+            return
+
+    print(get_log_text('logs.activity_backfill_started', file=log_path))
+    counts = defaultdict(int)
+    lines = 0
+    for path in paths:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                parsed = parse_message_log_line(line)
+                if not parsed:
+                    continue
+                date_str, tid = parsed
+                counts[(tid, date_str[:7])] += 1
+                lines += 1
+
+    with db_cursor() as cursor:
+        cursor.executemany('''
+            INSERT INTO message_counts (telegram_id, month, count)
+            VALUES (?, ?, ?)
+            ON CONFLICT(telegram_id, month)
+            DO UPDATE SET count = excluded.count
+        ''', [(tid, month, n) for (tid, month), n in counts.items()])
+    activity_leaderboard.reset()
+    print(get_log_text('logs.activity_backfill_done', lines=lines, rows=len(counts)))
 
 def clean_name(name: str) -> str:
     if not name:
@@ -389,17 +1544,23 @@ def clean_name(name: str) -> str:
 # --------- FAQ Display Module (Display only: Category -> Question -> Answer) ---------
 
 FAQ_JSON_PATH = Path("faq.json")  # Same directory as script, or use absolute path
-faq_data = {"categories": []}
+
+def _parse_faq(path):
+    data = _read_json_file(path)
+    print(get_log_text('logs.faq_loaded', count=len(data.get('categories', []))))
+    return data
+
+faq_file = CachedFile(FAQ_JSON_PATH, _parse_faq, {"categories": []})
+
+def get_faq_data():
+    return faq_file.get()
 
 def load_faq():
-    global faq_data
-    try:
-        with open(FAQ_JSON_PATH, "r", encoding="utf-8") as f:
-            faq_data = json.load(f)
-            print(get_log_text('logs.faq_loaded', count=len(faq_data.get('categories', []))))
-    except Exception as e:
-        print(get_log_text('logs.faq_load_error', error=str(e)))
-        faq_data = {"categories": []}
+    """Force a re-read of faq.json and return the parsed data"""
+    data = faq_file.reload()
+    if faq_file.error:
+        print(get_log_text('logs.faq_load_error', error=faq_file.error))
+    return data
 
 # Load once on program startup
 load_faq()
@@ -411,7 +1572,7 @@ def cmd_faq(message):
     if message.chat.type != 'private' and message.chat.id != ALLOWED_GROUP_ID:
         return
 
-    cats = faq_data.get("categories", [])
+    cats = get_faq_data().get("categories", [])
     lang = get_user_lang(message.from_user.id)
     if not cats:
         bot.reply_to(message, get_text('faq.empty', lang))
@@ -431,7 +1592,7 @@ def callback_faq(call):
         # Click category: faq:cat:<cat_id>
         if action == "cat" and len(parts) == 3:
             cat_id = parts[2]
-            cat = next((c for c in faq_data.get("categories", []) if c["id"] == cat_id), None)
+            cat = next((c for c in get_faq_data().get("categories", []) if c["id"] == cat_id), None)
             lang = get_user_lang(call.from_user.id)
             if not cat:
                 bot.answer_callback_query(call.id, get_text('faq.category_not_found', lang))
@@ -458,7 +1619,7 @@ def callback_faq(call):
         if action == "q" and len(parts) == 4:
             cat_id, q_id = parts[2], parts[3]
             lang = get_user_lang(call.from_user.id)
-            cat = next((c for c in faq_data.get("categories", []) if c["id"] == cat_id), None)
+            cat = next((c for c in get_faq_data().get("categories", []) if c["id"] == cat_id), None)
             if not cat:
                 bot.answer_callback_query(call.id, get_text('faq.category_not_found', lang))
                 return
@@ -484,7 +1645,7 @@ def callback_faq(call):
         # Return to category list: faq:back:cats
         if action == "back" and len(parts) == 3 and parts[2] == "cats":
             lang = get_user_lang(call.from_user.id)
-            cats = faq_data.get("categories", [])
+            cats = get_faq_data().get("categories", [])
             if not cats:
                 bot.answer_callback_query(call.id, get_text('faq.no_categories', lang))
                 return
@@ -526,100 +1687,607 @@ def cmd_faq_reload(message):
     if message.from_user.id not in ADMIN_IDS:
         bot.reply_to(message, get_text('common.no_permission', lang))
         return
-    load_faq()
-    bot.reply_to(message, get_text('faq.reload_success', lang, count=len(faq_data.get('categories', []))))
+    data = load_faq()
+    bot.reply_to(message, get_text('faq.reload_success', lang, count=len(data.get('categories', []))))
 # --------- End of FAQ Display Module ---------
 
-def add_monthly_points(telegram_id: int, delta: int):
-    if delta <= 0:
-        return  # Don't record negative numbers
+# ===== Leaderboards =====
+# /ranking, /active and /export_month_rank read monthly scores from memory. A month's scores are loaded once and
+# then kept current by the code writing monthly_points / message_counts (applied after its transaction commits).
+# /ranking replies are cached per language until the ranks they show or a user name change.
+LEADERBOARD_SIZE = 20
+LEADERBOARD_RESYNC_SECONDS = config.get('LEADERBOARD_RESYNC_SECONDS', 600)  # Reload scores from the database at least this often
+LEADERBOARD_MONTHS_CACHED = 3
+SQLITE_MAX_VARIABLES = 900  # Stay below SQLite's limit of bound parameters per statement
 
-    month_str = datetime.now().strftime('%Y-%m')
-    conn = sqlite3.connect('telegram_bot.db')
-    cur = conn.cursor()
+_names_version = 0  # Bumped whenever a stored user name changes, so cached leaderboard texts are re-rendered
+
+def note_user_name_changed():
+    global _names_version
+    _names_version += 1
 
-    cur.execute('''
+def leaderboard_stamp():
+    """
+    Stamp for a batch of leaderboard deltas; take it inside the writing transaction, after its first write
+    The database write lock is held then, and scores are loaded under the same lock, so a batch stamped before a
+    load is already in the loaded scores and one stamped after is not. time.monotonic() is system-wide where
+    worker processes run, so stamps taken in workers compare with the supervisor's.
+    """
+    return time.monotonic()
+
+class _MonthScores:
+    """One month's scores plus the same scores as a list sorted by rank, [(-score, telegram_id)]"""
+    __slots__ = ('stamp', 'scores', 'order')
+
+    def __init__(self, stamp, scores):
+        self.stamp = stamp
+        self.scores = scores
+        self.order = sorted((-score, telegram_id) for telegram_id, score in scores.items())
+
+    def add(self, telegram_id, delta, window):
+        """Change one score in place; True if that changed the first `window` ranks (any rank if window is None)"""
+        old = self.scores.get(telegram_id, 0)
+        new = old + delta
+        if new == old:
+            return False
+        old_pos = new_pos = None
+        if old > 0:
+            old_pos = bisect.bisect_left(self.order, (-old, telegram_id))
+            del self.order[old_pos]
+        if new > 0:
+            self.scores[telegram_id] = new
+            new_pos = bisect.bisect_left(self.order, (-new, telegram_id))
+            self.order.insert(new_pos, (-new, telegram_id))
+        else:
+            self.scores.pop(telegram_id, None)
+        if window is None:
+            return True
+        return (old_pos is not None and old_pos < window) or (new_pos is not None and new_pos < window)
+
+class MonthlyLeaderboard:
+    """
+    Per-month scores of one table (only scores > 0, like the database query), kept sorted as they change
+    render() caches any value built from the ranking (e.g. reply text per language) until the first `window`
+    ranks change, so changes further down the board do not throw the cached texts away.
+    """
+    def __init__(self, table, column, window=None):
+        self.query = f'SELECT telegram_id, {column} FROM {table} WHERE month = ? AND {column} > 0'
+        self.window = window  # Ranks render() results depend on (None: any score change invalidates them)
+        self._months = {}    # {month: _MonthScores}, least recently used first
+        self._versions = defaultdict(int)
+        self._derived = {}   # {(month, key): (version, value)}
+        self._lock = threading.RLock()
+
+    def _load(self, month):
+        entry = self._months.pop(month, None)
+        if entry is None or time.monotonic() - entry.stamp > LEADERBOARD_RESYNC_SECONDS:
+            # Read holding the write lock, so the stamp splits deltas into loaded and not yet loaded ones
+            with db_cursor(immediate=True) as cursor:
+                cursor.execute(self.query, (month,))
+                scores = dict(cursor.fetchall())
+                stamp = leaderboard_stamp()
+            if entry is None or scores != entry.scores:
+                self._versions[month] += 1
+            entry = _MonthScores(stamp, scores)
+        self._months[month] = entry
+        while len(self._months) > LEADERBOARD_MONTHS_CACHED:
+            del self._months[next(iter(self._months))]
+        return entry
+
+    def add(self, month, deltas, stamp):
+        """
+        Apply committed score changes [(telegram_id, delta)] stamped with leaderboard_stamp()
+        Deltas stamped before the month was (re)loaded are already in its scores and skipped; months not loaded
+        are read fresh when needed.
+        """
+        with self._lock:
+            entry = self._months.get(month)
+            if entry is None or stamp < entry.stamp:
+                return
+            changed = False
+            for telegram_id, delta in deltas:
+                changed = entry.add(telegram_id, delta, self.window) or changed
+            if changed:
+                self._versions[month] += 1
+
+    def reset(self):
+        """Forget all loaded months, e.g. after scores were rewritten in bulk"""
+        with self._lock:
+            self._months.clear()
+            self._derived.clear()
+
+    def ranked(self, month, include_admins=False, limit=None):
+        """[(telegram_id, score)] highest first, at most limit entries; admins are left out unless include_admins"""
+        with self._lock:
+            ranked = []
+            for neg_score, telegram_id in self._load(month).order:
+                if include_admins or telegram_id not in ADMIN_IDS:
+                    ranked.append((telegram_id, -neg_score))
+                    if len(ranked) == limit:
+                        break
+            return ranked
+
+    def render(self, month, key, build, depends_on_names=True):
+        """Return build() cached for this month until the ranks (or, if depends_on_names, any user name) change"""
+        with self._lock:
+            self._load(month)
+            version = (self._versions[month], _names_version if depends_on_names else 0)
+            cached = self._derived.get((month, key))
+            if cached and cached[0] == version:
+                return cached[1]
+            value = build()
+            self._derived[(month, key)] = (version, value)
+            for stale in [k for k in self._derived if k[0] not in self._months]:
+                del self._derived[stale]
+            return value
+
+# /ranking shows the top LEADERBOARD_SIZE without admins, so only that many ranks plus the admins' matter to its
+# cached text; /active filters on current points and builds its text on every call
+points_leaderboard = MonthlyLeaderboard('monthly_points', 'earned', LEADERBOARD_SIZE + len(ADMIN_IDS))  # /ranking, /export_month_rank
+activity_leaderboard = MonthlyLeaderboard('message_counts', 'count')                                # /active
+
+def get_user_columns(telegram_ids, columns='name, custom_id, points'):
+    """{telegram_id: (columns...)} for the given users, looked up in chunks"""
+    ids = list(telegram_ids)
+    result = {}
+    with db_cursor() as cursor:
+        for i in range(0, len(ids), SQLITE_MAX_VARIABLES):
+            chunk = ids[i:i + SQLITE_MAX_VARIABLES]
+            cursor.execute(f'SELECT telegram_id, {columns} FROM users WHERE telegram_id IN ({",".join("?" * len(chunk))})', chunk)
+            result.update((row[0], row[1:]) for row in cursor.fetchall())
+    return result
+
+def record_monthly_points(cursor, rows):
+    """Add [(telegram_id, month, delta)] to monthly_points inside the caller's transaction"""
+    cursor.executemany('''
         INSERT INTO monthly_points (telegram_id, month, earned)
         VALUES (?, ?, ?)
         ON CONFLICT(telegram_id, month)
         DO UPDATE SET earned = earned + excluded.earned
-    ''', (telegram_id, month_str, delta))
+    ''', rows)
+    stamp = leaderboard_stamp()
+    by_month = defaultdict(list)
+    for telegram_id, month, delta in rows:
+        by_month[month].append((telegram_id, delta))
+    for month, deltas in by_month.items():
+        after_commit(functools.partial(points_leaderboard.add, month, deltas, stamp))
 
-    conn.commit()
-    conn.close()
+def add_monthly_points(telegram_id: int, delta: int):
+    if delta <= 0:
+        return  # Don't record negative numbers
 
-def log_transfer(sender_id, recipient_id, amount):
-    conn = sqlite3.connect('telegram_bot.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO transfers (sender_id, recipient_id, amount, timestamp)
-        VALUES (?, ?, ?, ?)
-    ''', (sender_id, recipient_id, amount, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-    conn.commit()
-    conn.close()
+    month_str = datetime.now().strftime('%Y-%m')
+    with db_cursor() as cur:
+        record_monthly_points(cur, [(telegram_id, month_str, delta)])
+
+# ===== Chat points accrual =====
+# Chat points are summed in memory and written to users/monthly_points in one transaction every few seconds.
+# Each award is first appended to a journal file with a sequence number; the flush transaction stores the last
+# applied number in write_behind_state, so after a crash exactly the unapplied journal entries are replayed.
+CHAT_POINTS_FLUSH_INTERVAL_SECONDS = config.get('CHAT_POINTS_FLUSH_INTERVAL_SECONDS', 5)  # How often accrued chat points are written
+CHAT_POINTS_JOURNAL_FILE = config.get('CHAT_POINTS_JOURNAL_FILE', 'chat_points.journal')  # Journal of awards not yet written
+CHAT_POINTS_JOURNAL_FSYNC = config.get('CHAT_POINTS_JOURNAL_FSYNC', False)  # fsync every journal entry (survives power loss, slower)
+
+class ChatPointsAccrual:
+    """
+    Write-behind buffer for chat points
+    Journal lines are "seq<TAB>telegram_id<TAB>month<TAB>points". On flush the journal is renamed to
+    "<journal>.<last seq>" and a fresh one is started; renamed journals are deleted once their entries are committed.
+    """
+    def __init__(self, journal_path, name='chat_points'):
+        self.journal_path = journal_path
+        self.name = name
+        self._buffer = defaultdict(int)  # {(telegram_id, month): points}
+        self._seq = 0
+        self._journal = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def _rotated_journals(self):
+        """[(last seq, path)] of journals handed to a flush, oldest first"""
+        rotated = []
+        for path in glob.glob(glob.escape(self.journal_path) + '.*'):
+            suffix = path.rsplit('.', 1)[1]
+            if suffix.isdigit():
+                rotated.append((int(suffix), path))
+        return sorted(rotated)
+
+    def recover(self):
+        """Replay journaled awards that never reached the database; call once at startup before accrue()"""
+        with db_cursor() as cursor:
+            cursor.execute('SELECT last_seq FROM write_behind_state WHERE name = ?', (self.name,))
+            row = cursor.fetchone()
+        last_seq = row[0] if row else 0
+
+        journals = self._rotated_journals()
+        paths = [path for _, path in journals]
+        if os.path.exists(self.journal_path):
+            paths.append(self.journal_path)
+        pending = defaultdict(int)
+        max_seq = last_seq
+        for path in paths:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.rstrip('\n').split('\t')
+                    if len(parts) != 4:
+                        continue  # Torn last line of a crashed write
+                    seq, telegram_id, month, points = int(parts[0]), int(parts[1]), parts[2], int(parts[3])
+                    max_seq = max(max_seq, seq)
+                    if seq > last_seq:
+                        pending[(telegram_id, month)] += points
+
+        if pending:
+            self._write(pending, max_seq)
+            print(get_log_text('logs.chat_points_replayed', count=len(pending), seq=max_seq))
+        for path in paths:
+            os.remove(path)
+        with self._lock:
+            self._seq = max_seq
+
+    def accrue(self, telegram_id, points):
+        month_str = datetime.now().strftime('%Y-%m')
+        with self._lock:
+            if self._journal is None:
+                self._journal = open(self.journal_path, 'a', encoding='utf-8')
+            self._seq += 1
+            self._journal.write(f"{self._seq}\t{telegram_id}\t{month_str}\t{points}\n")
+            self._journal.flush()
+            if CHAT_POINTS_JOURNAL_FSYNC:
+                os.fsync(self._journal.fileno())
+            self._buffer[(telegram_id, month_str)] += points
+
+    def pending_points(self, telegram_id):
+        """Points accrued for a user but not written yet"""
+        with self._lock:
+            return sum(points for (tid, _), points in self._buffer.items() if tid == telegram_id)
+
+    def flush(self):
+        """Write all accrued points in one transaction; on failure they stay buffered (and journaled)"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._buffer:
+                    return
+                pending, self._buffer = self._buffer, defaultdict(int)
+                upto_seq = self._seq
+                self._journal.close()
+                self._journal = None
+                os.replace(self.journal_path, f"{self.journal_path}.{upto_seq}")
 
+            try:
+                self._write(pending, upto_seq)
+            except Exception as e:
+                with self._lock:
+                    for key, points in pending.items():
+                        self._buffer[key] += points
+                print(get_log_text('logs.chat_points_flush_failed', error=str(e)))
+                return
 
-def record_signin_history(telegram_id, date_str):
-    conn = sqlite3.connect('telegram_bot.db')
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO signin_history (telegram_id, date) VALUES (?, ?)", (telegram_id, date_str))
-    conn.commit()
-    conn.close()
+            for seq, path in self._rotated_journals():
+                if seq <= upto_seq:
+                    os.remove(path)
+
+    def _write(self, pending, upto_seq):
+        with db_cursor(immediate=True) as cursor:
+            cursor.executemany('UPDATE users SET points = points + ? WHERE telegram_id = ?',
+                               [(points, telegram_id) for (telegram_id, _), points in pending.items()])
+            invalidate_cached_users({telegram_id for telegram_id, _ in pending})
+            record_monthly_points(cursor, [(telegram_id, month, points) for (telegram_id, month), points in pending.items() if points > 0])
+            cursor.execute('''
+                INSERT INTO write_behind_state (name, last_seq) VALUES (?, ?)
+                ON CONFLICT(name) DO UPDATE SET last_seq = excluded.last_seq
+            ''', (self.name, upto_seq))
+
+chat_points = ChatPointsAccrual(CHAT_POINTS_JOURNAL_FILE)
+chat_points.recover()
+
+def log_transfer(sender_id, recipient_id, amount):
+    with db_cursor() as cursor:
+        cursor.execute('''
+            INSERT INTO transfers (sender_id, recipient_id, amount, timestamp)
+            VALUES (?, ?, ?, ?)
+        ''', (sender_id, recipient_id, amount, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
 
-def count_signins_last_7_days(telegram_id):
-    conn = sqlite3.connect('telegram_bot.db')
-    cursor = conn.cursor()
-    seven_days_ago = (datetime.now() - timedelta(days=6)).strftime('%Y-%m-%d')  # Including today, 7 days total
-    cursor.execute('''
-        SELECT COUNT(DISTINCT date)
-        FROM signin_history
-        WHERE telegram_id = ? AND date >= ?
-    ''', (telegram_id, seven_days_ago))
-    count = cursor.fetchone()[0]
-    conn.close()
-    return count
 
 # Sensitive word filtering
-def load_sensitive_words(file_path='sensitive_words.txt'):
-    if not os.path.exists(file_path):
-        return []
-    with open(file_path, 'r', encoding='utf-8') as f:
+SENSITIVE_WORDS_FILE = 'sensitive_words.txt'
+
+def _parse_sensitive_words(path):
+    with open(path, 'r', encoding='utf-8') as f:
         return [line.strip().lower() for line in f if line.strip()]
 
+sensitive_words_file = CachedFile(SENSITIVE_WORDS_FILE, _parse_sensitive_words, [])
+
+def load_sensitive_words():
+    return sensitive_words_file.get()
+
+# Other JSON files that handlers read on demand
+CAMPAIGNS_FILE = "campaigns.json"
+QUIZ_BANK_FILE = "quiz_bank.json"
+campaigns_file = CachedFile(CAMPAIGNS_FILE, _read_json_file)
+quiz_bank_file = CachedFile(QUIZ_BANK_FILE, _read_json_file)
+
+# ===== Keyword matching (sensitive words + activity keywords) =====
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over a fixed set of keywords.
+    find_all() scans the text once and returns the rules of every keyword found in it,
+    regardless of how many keywords are registered.
+    :param patterns: iterable of (keyword, rule); empty keywords are ignored
+    """
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for keyword, rule in patterns:
+            if not keyword:
+                continue
+            node = 0
+            for ch in keyword:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                node = nxt
+            self._out[node] += (rule,)
+
+        # Breadth-first pass to link each node to its longest proper suffix in the trie
+        pending = deque(self._goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for ch, child in self._goto[node].items():
+                pending.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0) if node else 0
+                self._out[child] += self._out[self._fail[child]]
+
+    def find_all(self, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        hits = set()
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                hits.update(out[node])
+        return hits
+
+_keyword_snapshot = None  # (versions, activities, sensitive_words, matcher)
+_keyword_lock = threading.Lock()
+
+def get_keyword_matcher():
+    """
+    Return (activities, sensitive_words, matcher) for the current configuration files.
+    The automaton is only rebuilt when activities.json or sensitive_words.txt changed since the last build.
+    Rules are ('activity', index into activities) and ('sensitive', index into sensitive_words).
+    """
+    global _keyword_snapshot
+    activities = load_activities()
+    sensitive_words = load_sensitive_words()
+    versions = (activities_file.version, sensitive_words_file.version)
+    snapshot = _keyword_snapshot
+    if snapshot and snapshot[0] == versions:
+        return snapshot[1:]
+    with _keyword_lock:
+        snapshot = _keyword_snapshot
+        if snapshot and snapshot[0] == versions:
+            return snapshot[1:]
+        patterns = [(word, ('sensitive', i)) for i, word in enumerate(sensitive_words)]
+        for i, act in enumerate(activities):
+            patterns.extend((kw.lower(), ('activity', i)) for kw in act.get("match", []))
+        _keyword_snapshot = (versions, activities, sensitive_words, KeywordMatcher(patterns))
+        print(get_log_text('logs.keyword_matcher_built', count=len(patterns)))
+        return _keyword_snapshot[1:]
+
 # Database operation functions
 def get_user(telegram_id):
-    conn = sqlite3.connect('telegram_bot.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE telegram_id = ?', (telegram_id,))
-    user = cursor.fetchone()
-    conn.close()
+    """:return: UserRecord, or None if the user does not exist"""
+    user = user_cache.get(telegram_id)
+    if user is not None:
+        return user
+    # Rows read inside a transaction may still roll back, so only cache committed reads
+    get_db_connection()
+    cacheable = _db_local.depth == 0
+    generation = user_cache.generation
+    with db_cursor() as cursor:
+        cursor.execute(f'SELECT {USER_COLUMNS} FROM users WHERE telegram_id = ?', (telegram_id,))
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    user = UserRecord._make(row)
+    if cacheable:
+        user_cache.put(telegram_id, user, generation)
     return user
 
 def update_user(telegram_id, field, value):
-    conn = sqlite3.connect('telegram_bot.db')
-    cursor = conn.cursor()
-    cursor.execute(f'UPDATE users SET {field} = ? WHERE telegram_id = ?', (value, telegram_id))
-    conn.commit()
-    conn.close()
+    with db_cursor() as cursor:
+        cursor.execute(f'UPDATE users SET {field} = ? WHERE telegram_id = ?', (value, telegram_id))
+        invalidate_cached_users([telegram_id])
+
+def increment_user_field(telegram_id, field, delta):
+    """
+    Add delta to a numeric users column in a single UPDATE (no read-modify-write, so concurrent updates are not lost)
+    :return: the new value, or None if the user does not exist
+    """
+    with db_cursor() as cursor:
+        cursor.execute(f'UPDATE users SET {field} = COALESCE({field}, 0) + ? WHERE telegram_id = ?', (delta, telegram_id))
+        if not cursor.rowcount:
+            return None
+        invalidate_cached_users([telegram_id])
+        cursor.execute(f'SELECT {field} FROM users WHERE telegram_id = ?', (telegram_id,))
+        return cursor.fetchone()[0]
+
+def transfer_unlocked_points(sender_id, recipient_id, amount):
+    """
+    Move unlocked points between users and log the transfer, all in one transaction
+    :return: (done, sender's unlocked points afterwards); done is False if the sender has less than amount
+    """
+    with db_cursor(immediate=True) as cursor:
+        cursor.execute('UPDATE users SET unlocked_points = unlocked_points - ? WHERE telegram_id = ? AND unlocked_points >= ?',
+                       (amount, sender_id, amount))
+        done = cursor.rowcount > 0
+        if done:
+            cursor.execute('UPDATE users SET unlocked_points = COALESCE(unlocked_points, 0) + ? WHERE telegram_id = ?', (amount, recipient_id))
+            log_transfer(sender_id, recipient_id, amount)
+            invalidate_cached_users([sender_id, recipient_id])
+        cursor.execute('SELECT COALESCE(unlocked_points, 0) FROM users WHERE telegram_id = ?', (sender_id,))
+        row = cursor.fetchone()
+    return done, row[0] if row else 0
 
 def update_user_name_and_custom_id(telegram_id, name, custom_id=None):
-    conn = sqlite3.connect('telegram_bot.db')
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET name = ?, custom_id = ? WHERE telegram_id = ?', (name, custom_id, telegram_id))
-    conn.commit()
-    conn.close()
+    # Called for every group message; most of the time nothing changed
+    user = get_user(telegram_id)
+    if user is not None and user.name == name and user.custom_id == custom_id:
+        return
+    with db_cursor() as cursor:
+        cursor.execute(
+            'UPDATE users SET name = ?, custom_id = ? WHERE telegram_id = ? AND (name IS NOT ? OR custom_id IS NOT ?)',
+            (name, custom_id, telegram_id, name, custom_id)
+        )
+        if cursor.rowcount:
+            invalidate_cached_users([telegram_id])
+            after_commit(note_user_name_changed)
 
 def create_user_if_not_exist(telegram_id, invited_by=None, name=None):
-    user = get_user(telegram_id)
-    if not user:
-        conn = sqlite3.connect('telegram_bot.db')
-        cursor = conn.cursor()
+    if user_cache.get(telegram_id) is not None:
+        return
+    with db_cursor() as cursor:
         cursor.execute('''
-            INSERT INTO users (telegram_id, points, invited_by, name, custom_id)
+            INSERT OR IGNORE INTO users (telegram_id, points, invited_by, name, custom_id)
             VALUES (?, ?, ?, ?, ?)
         ''', (telegram_id, 0, invited_by, name, None))
-        conn.commit()
-        conn.close()
+
+# ===== Sign-in service =====
+def process_signin(telegram_id):
+    """
+    Run the whole sign-in flow (duplicate check, reward, 7-day bonus, first-join invite reward)
+    in one write transaction, so concurrent sign-ins from the same user are serialized.
+    :return: dict with 'status': 'user_not_found', 'already_signed' or 'signed'; a 'signed' result also has
+             'total', 'earned', 'bonus' and 'inviter_id' (inviter rewarded, or None)
+    """
+    now = datetime.now()
+    today_str = now.strftime('%Y-%m-%d')
+    month_str = now.strftime('%Y-%m')
+    seven_days_ago = (now - timedelta(days=6)).strftime('%Y-%m-%d')  # Including today, 7 days total
+
+    with db_cursor(immediate=True) as cursor:
+        # Stage 1: user state and sign-in days within the window (today not yet recorded)
+        cursor.execute('''
+            SELECT u.points, u.last_signin, u.invited_by, u.joined_group, u.last_bonus_date,
+                   (SELECT COUNT(DISTINCT h.date) FROM signin_history h
+                     WHERE h.telegram_id = u.telegram_id AND h.date >= ? AND h.date <> ?)
+            FROM users u
+            WHERE u.telegram_id = ?
+        ''', (seven_days_ago, today_str, telegram_id))
+        row = cursor.fetchone()
+        if not row:
+            return {'status': 'user_not_found'}
+        current_points, last_signin, invited_by, joined_group_old, last_bonus_date, signin_days = row
+
+        # Check if already signed in (today)
+        if last_signin:
+            try:
+                if datetime.strptime(last_signin, '%Y-%m-%d %H:%M:%S').date() == now.date():
+                    return {'status': 'already_signed'}
+            except Exception as e:
+                print(get_log_text('logs.error_parse_date', error=str(e)))
+
+        earned = SIGNIN_POINTS
+        bonus = False
+        # Reward for 7 consecutive days within 7 days (today included)
+        try:
+            if signin_days + 1 >= 7:
+                if (not last_bonus_date) or (datetime.strptime(last_bonus_date, "%Y-%m-%d") <= now - timedelta(days=7)):
+                    earned += SIGNIN_BONUS_POINTS
+                    bonus = True
+        except Exception as e:
+            print(get_log_text('logs.error_calculate_bonus', error=str(e)))
+
+        # Stage 2: record sign-in and reward in one statement
+        cursor.execute("INSERT INTO signin_history (telegram_id, date) VALUES (?, ?)", (telegram_id, today_str))
+        cursor.execute('''
+            UPDATE users
+            SET last_signin = ?, points = points + ?, joined_group = 1,
+                last_bonus_date = CASE WHEN ? THEN ? ELSE last_bonus_date END
+            WHERE telegram_id = ?
+        ''', (now.strftime('%Y-%m-%d %H:%M:%S'), earned, bonus, today_str, telegram_id))
+        invalidate_cached_users([telegram_id])
+        monthly_rows = [(telegram_id, month_str, earned)]
+
+        # Stage 3: first "valid group join" (joined_group 0 -> 1) rewards the inviter exactly once
+        inviter_id = None
+        if not joined_group_old and invited_by:
+            try:
+                inviter_id = int(invited_by)
+            except ValueError as e:
+                print(get_log_text('logs.invite_reward_failed', invitee_id=telegram_id, error=str(e)))
+            if inviter_id is not None:
+                cursor.execute("UPDATE users SET points = points + ? WHERE telegram_id = ?", (INVITE_REWARD_POINTS, inviter_id))
+                if cursor.rowcount:
+                    invalidate_cached_users([inviter_id])
+                    monthly_rows.append((inviter_id, month_str, INVITE_REWARD_POINTS))
+                else:
+                    inviter_id = None
+
+        # Stage 4: monthly points for invitee and inviter
+        record_monthly_points(cursor, monthly_rows)
+
+    return {
+        'status': 'signed',
+        'total': current_points + earned,
+        'earned': earned,
+        'bonus': bonus,
+        'inviter_id': inviter_id,
+    }
+
+# ===== Rendered reply cache =====
+# /help, /start, /signinword and the group welcome are assembled from dozens of get_text() calls but hardly ever
+# change. reply_cache keeps the finished text (and serialized reply markup) under a key holding what else the reply
+# depends on, e.g. (command, language, admin flag, sign-in word). Entries are dropped whenever a new locale catalog
+# is loaded; config values are only read at startup, so they cannot change under the cache.
+REPLY_CACHE_MAX_ENTRIES = 256
+INVITE_LINK_PLACEHOLDER = '\x00invite_link\x00'  # Stands in for the per-user link in cached /start texts
+
+class ReplyCache:
+    """Rendered replies {key: value}, valid for one locale catalog version"""
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._version = None
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def render(self, key, build):
+        """Return build() cached under key"""
+        version = locale_catalog.version
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            value = self._entries.get(key)
+        if value is None:
+            value = build()
+            with self._lock:
+                if self._version == version:  # Not built from a catalog that was replaced meanwhile
+                    if len(self._entries) >= self.max_entries:
+                        self._entries.clear()
+                    self._entries[key] = value
+        return value
+
+reply_cache = ReplyCache(REPLY_CACHE_MAX_ENTRIES)
+
+_bot_username = None
+
+def get_bot_username():
+    """The bot's username, asked from Telegram once instead of calling getMe for every invite link"""
+    global _bot_username
+    if _bot_username is None:
+        _bot_username = bot.get_me().username
+    return _bot_username
 
 @bot.message_handler(content_types=['new_chat_members'])
 def welcome_new_members(message):
@@ -635,41 +2303,47 @@ def welcome_new_members(message):
         lang = DEFAULT_LANGUAGE  # Can be adjusted based on user preference
         
         welcome_text = get_text('welcome.title', lang, name=name) + "\n"
-        welcome_text += get_text('welcome.community_group', lang, name=COMMUNITY_NAME) + "\n"
-
-        if COMMUNITY_TWITTER_CN:
-            welcome_text += get_text('welcome.twitter_cn', lang, link=COMMUNITY_TWITTER_CN) + "\n"
-        if COMMUNITY_TWITTER_EN:
-            welcome_text += get_text('welcome.twitter_en', lang, link=COMMUNITY_TWITTER_EN) + "\n"
-        if COMMUNITY_INTRO_LINK:
-            welcome_text += get_text('welcome.intro_link', lang, link=COMMUNITY_INTRO_LINK) + "\n"
-
-        welcome_text += f"\n{get_text('welcome.greeting', lang, name=COMMUNITY_NAME)}\n\n"
-        welcome_text += get_text('welcome.bot_welcome', lang, bot_name=COMMUNITY_BOT_NAME) + "\n"
-        welcome_text += get_text('welcome.points_system', lang, bot_name=COMMUNITY_BOT_NAME) + "\n\n"
-        welcome_text += get_text('welcome.points_usage', lang) + "\n"
-        welcome_text += get_text('welcome.points_usage_1', lang) + "\n"
-        welcome_text += get_text('welcome.points_usage_2', lang) + "\n"
-        welcome_text += get_text('welcome.points_usage_3', lang) + "\n\n"
-        welcome_text += get_text('welcome.bot_guide', lang, bot_name=COMMUNITY_BOT_NAME) + "\n"
-
-        welcome_text += get_text('welcome.guide_1', lang) + "\n"
-        welcome_text += get_text('welcome.guide_2', lang) + "\n"
-        welcome_text += get_text('welcome.guide_3', lang) + "\n"
-        welcome_text += get_text('welcome.guide_4', lang) + "\n"
-        welcome_text += get_text('welcome.guide_5', lang) + "\n"
-        welcome_text += get_text('welcome.guide_6', lang) + "\n"
-        welcome_text += get_text('welcome.guide_7', lang) + "\n"
-        welcome_text += get_text('welcome.guide_8', lang) + "\n"
-
-        if COMMUNITY_TUTORIAL_LINK:
-            welcome_text += f"\n{get_text('welcome.tutorial_link', lang)}\n{COMMUNITY_TUTORIAL_LINK}\n"
-
-        welcome_text += get_text('welcome.auto_delete', lang)
+
+        def render():
+            # Everything below the greeting line is the same for every new member
+            welcome_text = get_text('welcome.community_group', lang, name=COMMUNITY_NAME) + "\n"
+
+            if COMMUNITY_TWITTER_CN:
+                welcome_text += get_text('welcome.twitter_cn', lang, link=COMMUNITY_TWITTER_CN) + "\n"
+            if COMMUNITY_TWITTER_EN:
+                welcome_text += get_text('welcome.twitter_en', lang, link=COMMUNITY_TWITTER_EN) + "\n"
+            if COMMUNITY_INTRO_LINK:
+                welcome_text += get_text('welcome.intro_link', lang, link=COMMUNITY_INTRO_LINK) + "\n"
+
+            welcome_text += f"\n{get_text('welcome.greeting', lang, name=COMMUNITY_NAME)}\n\n"
+            welcome_text += get_text('welcome.bot_welcome', lang, bot_name=COMMUNITY_BOT_NAME) + "\n"
+            welcome_text += get_text('welcome.points_system', lang, bot_name=COMMUNITY_BOT_NAME) + "\n\n"
+            welcome_text += get_text('welcome.points_usage', lang) + "\n"
+            welcome_text += get_text('welcome.points_usage_1', lang) + "\n"
+            welcome_text += get_text('welcome.points_usage_2', lang) + "\n"
+            welcome_text += get_text('welcome.points_usage_3', lang) + "\n\n"
+            welcome_text += get_text('welcome.bot_guide', lang, bot_name=COMMUNITY_BOT_NAME) + "\n"
+
+            welcome_text += get_text('welcome.guide_1', lang) + "\n"
+            welcome_text += get_text('welcome.guide_2', lang) + "\n"
+            welcome_text += get_text('welcome.guide_3', lang) + "\n"
+            welcome_text += get_text('welcome.guide_4', lang) + "\n"
+            welcome_text += get_text('welcome.guide_5', lang) + "\n"
+            welcome_text += get_text('welcome.guide_6', lang) + "\n"
+            welcome_text += get_text('welcome.guide_7', lang) + "\n"
+            welcome_text += get_text('welcome.guide_8', lang) + "\n"
+
+            if COMMUNITY_TUTORIAL_LINK:
+                welcome_text += f"\n{get_text('welcome.tutorial_link', lang)}\n{COMMUNITY_TUTORIAL_LINK}\n"
+
+            welcome_text += get_text('welcome.auto_delete', lang)
+            return welcome_text
+
+        welcome_text += reply_cache.render(('welcome', lang), render)
         try:
             sent_msg = bot.send_message(message.chat.id, welcome_text)
             # Delete welcome message after 60 seconds
-            threading.Timer(60, lambda: safe_delete(message.chat.id, sent_msg.message_id, "Welcome message")).start()
+            schedule_delete(message.chat.id, sent_msg.message_id, 60, "Welcome message")
         except Exception as e:
             print(get_log_text('logs.error_send_welcome', error=str(e)))
 
@@ -691,34 +2365,16 @@ def send_red_packet(message):
         if total_points <= 0 or count <= 0:
             bot.reply_to(message, get_text('redpacket.positive_number', lang))
             return
+        if count > total_points:
+            bot.reply_to(message, get_text('redpacket.count_exceeds_points', lang))
+            return
 
         telegram_id = message.from_user.id
-        conn = sqlite3.connect('telegram_bot.db')
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT unlocked_points FROM users WHERE telegram_id = ?", (telegram_id,))
-        result = cursor.fetchone()
-        if not result or result[0] < total_points:
+        packet_id = create_red_packet(telegram_id, total_points, count)
+        if packet_id is None:
             bot.reply_to(message, get_text('redpacket.insufficient_points', lang))
-            conn.close()
             return
 
-        # Deduct unlocked points
-        cursor.execute('''
-            UPDATE users
-            SET unlocked_points = unlocked_points - ?
-            WHERE telegram_id = ?
-        ''', (total_points, telegram_id))
-
-        packet_id = str(uuid4())
-        cursor.execute('''
-            INSERT INTO red_packets (id, sender_id, total_points, count, created_at, remaining_points)
-            VALUES (?, ?, ?, ?, datetime('now'), ?)
-        ''', (packet_id, telegram_id, total_points, count, total_points))
-
-        conn.commit()
-        conn.close()
-
         markup = InlineKeyboardMarkup()
         markup.add(InlineKeyboardButton(get_text('redpacket.claim_button', lang), callback_data=f"claim_{packet_id}"))
 
@@ -747,68 +2403,17 @@ def claim_red_packet(call):
     telegram_id = call.from_user.id
     packet_id = call.data.replace("claim_", "")
 
-    now = time.time()
-
-    # --- Rate limiting (once per second for same user) ---
+    # --- Rate limiting (once per RATE_LIMIT_SECONDS for same user) ---
     lang = get_user_lang(telegram_id)
-    last_ts = last_claim_click.get(telegram_id, 0)
-    if now - last_ts < RATE_LIMIT_SECONDS:
+    if not claim_click_limiter.allow(telegram_id):
         bot.answer_callback_query(call.id, get_text('redpacket.click_too_fast', lang))
         return
-    last_claim_click[telegram_id] = now
-
-    conn = sqlite3.connect("telegram_bot.db")
-    cursor = conn.cursor()
-
-    # Check if already claimed
-    cursor.execute("SELECT * FROM red_packet_claims WHERE packet_id = ? AND telegram_id = ?", (packet_id, telegram_id))
-    if cursor.fetchone():
-        bot.answer_callback_query(call.id, get_text('redpacket.already_claimed', lang))
-        conn.close()
-        return
 
-    # Check red packet info
-    cursor.execute("SELECT created_at, remaining_points, count, claimed_count, sender_id, expired FROM red_packets WHERE id = ?", (packet_id,))
-    row = cursor.fetchone()
-    if not row:
-        bot.answer_callback_query(call.id, get_text('redpacket.not_found', lang))
-        conn.close()
-        return
-
-    created_at_str, remaining_points, total_count, claimed_count, sender_id, expired = row
-    created_at = datetime.strptime(created_at_str, "%Y-%m-%d %H:%M:%S")
-
-    # Check expiration
-    if expired or (datetime.now() - created_at > timedelta(hours=24)):
-        bot.answer_callback_query(call.id, get_text('redpacket.expired', lang))
-        conn.close()
+    status, claim_amount = claim_red_packet_share(packet_id, telegram_id)
+    if status != 'claimed':
+        bot.answer_callback_query(call.id, get_text(f'redpacket.{status}', lang))
         return
 
-    if claimed_count >= total_count or remaining_points <= 0:
-        bot.answer_callback_query(call.id, get_text('redpacket.empty', lang))
-        conn.close()
-        return
-
-    remaining_count = total_count - claimed_count
-
-    if remaining_count == 1:
-        claim_amount = remaining_points
-    else:
-        avg = remaining_points / remaining_count
-        max_possible = int(avg * 2)
-        claim_amount = random.randint(1, min(max_possible, remaining_points - (remaining_count - 1)))
-
-
-    # Update red packet table
-    cursor.execute("UPDATE red_packets SET claimed_count = claimed_count + 1, remaining_points = remaining_points - ? WHERE id = ?", (claim_amount, packet_id))
-    # Record claimer
-    cursor.execute("INSERT INTO red_packet_claims (packet_id, telegram_id, claimed_points) VALUES (?, ?, ?)", (packet_id, telegram_id, claim_amount))
-    # Increase unlocked points
-    cursor.execute("UPDATE users SET unlocked_points = unlocked_points + ? WHERE telegram_id = ?", (claim_amount, telegram_id))
-
-    conn.commit()
-    conn.close()
-
     bot.answer_callback_query(call.id)
 
     name = call.from_user.first_name or ""
@@ -844,19 +2449,16 @@ def handle_search_user(message):
 
     keyword = args[1].strip().lower()
 
-    conn = sqlite3.connect('telegram_bot.db')
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        SELECT telegram_id, name, custom_id, points, unlocked_points
-        FROM users
-        WHERE LOWER(name) LIKE ? OR LOWER(custom_id) LIKE ?
-        ORDER BY points DESC
-        LIMIT 20
-    ''', (f'%{keyword}%', f'%{keyword}%'))
+    with db_cursor() as cursor:
+        cursor.execute('''
+            SELECT telegram_id, name, custom_id, points, unlocked_points
+            FROM users
+            WHERE LOWER(name) LIKE ? OR LOWER(custom_id) LIKE ?
+            ORDER BY points DESC
+            LIMIT 20
+        ''', (f'%{keyword}%', f'%{keyword}%'))
 
-    rows = cursor.fetchall()
-    conn.close()
+        rows = cursor.fetchall()
 
     if not rows:
         bot.reply_to(message, get_text('admin.search.not_found', lang, keyword=keyword))
@@ -883,66 +2485,158 @@ def handle_help(message):
 
     is_admin = message.from_user.id in ADMIN_IDS
 
-    # Build help text using multilingual strings
-    help_text = get_text('help.title', lang, name=COMMUNITY_NAME) + "\n\n"
-    help_text += get_text('help.user_commands', lang) + "\n"
-    help_text += f"- `/start`：{get_text('help.cmd_start', lang)}\n"
-    help_text += f"- `/me`：{get_text('help.cmd_me', lang)}\n"
-    help_text += f"- `/bind`：{get_text('help.cmd_bind', lang, name=COMMUNITY_ACCOUNT_NAME)}\n"
-    help_text += f"- `/bind_binance <UID>`：{get_text('help.cmd_bind_binance', lang)}\n"
-    help_text += f"- `/bind_twitter @handle`：{get_text('help.cmd_bind_twitter', lang)}\n"
-
-    if COMMUNITY_ACCOUNT_NAME:
-        address_label = get_text('common.address', lang)
-        help_text += f"- `/bind_address <{address_label}>`：{get_text('help.cmd_bind_address', lang, name=COMMUNITY_ACCOUNT_NAME)}\n"
-
-    help_text += f"- `/invites`：{get_text('help.cmd_invites', lang)}\n"
-    help_text += f"- `/submit`：{get_text('help.cmd_submit', lang)}\n"
-    help_text += f"- `/my_submissions`：{get_text('help.cmd_my_submissions', lang)}\n"
-    symbol_label = get_text('common.symbol', lang)
-    help_text += f"- `/price <{symbol_label}>`：{get_text('help.cmd_price', lang)}\n"
-    content_label = get_text('common.content', lang)
-    help_text += f"- `/feedback <{content_label}>`：{get_text('help.cmd_feedback', lang)}\n"
-    amount_label = get_text('common.amount', lang)
-    help_text += f"- `/unlock_points <{amount_label}>`：{get_text('help.cmd_unlock_points', lang)}\n"
-    help_text += f"- `/transfer_points <ID> <{amount_label}>`：{get_text('help.cmd_transfer_points', lang)}\n"
-    help_text += f"- `/recent_points`：{get_text('help.cmd_recent_points', lang)}\n"
-    help_text += f"- `/transfer`：{get_text('help.cmd_transfer', lang)}\n"
-    help_text += f"- `/faq`: {get_text('help.cmd_faq', lang)}\n\n"
-
-    help_text += get_text('help.group_commands', lang) + "\n"
-    help_text += f"- `/signinword`：{get_text('help.cmd_signinword', lang)}\n"
-    help_text += f"- `/ranking`：{get_text('help.cmd_ranking', lang)}\n"
-    help_text += f"- `/active`：{get_text('help.cmd_active', lang)}\n"
-    help_text += f"- `/price` <{symbol_label}>：{get_text('help.cmd_price_group', lang)}\n"
-    send_signin_label = get_text('common.send_signin', lang)
-    help_text += f"- *{send_signin_label}*：{get_text('help.cmd_send_signin', lang)}\n"
-
-    if is_admin:
-        help_text += "\n" + get_text('help.admin_commands', lang) + "\n"
-        help_text += f"- `/add_points <ID> <{amount_label}>`：{get_text('help.cmd_add_points', lang)}\n"
-        help_text += f"- `/add_unlock_points <ID> <{amount_label}>`：{get_text('help.cmd_add_unlock_points', lang)}\n"
-        upload_label = get_text('common.upload', lang, default='Upload')
-        help_text += f"- {upload_label} `batch_points.csv`：{get_text('help.cmd_batch_points', lang)}\n"
-        help_text += f"- {upload_label} `campaigns.json` : {get_text('help.cmd_upload_campaigns', lang)}\n"
-        help_text += f"- {upload_label} `faq.json` : {get_text('help.cmd_upload_faq', lang)}\n"
-        help_text += f"- {upload_label} `quiz_bank.json` : {get_text('help.cmd_upload_quiz', lang)}\n"
-        help_text += f"- `/quiz_send {{json}}`：{get_text('help.cmd_quiz_send', lang)}\n"
-        word_label = get_text('common.word', lang)
-        help_text += f"- `/add_sensitive <{word_label}>`：{get_text('help.cmd_add_sensitive', lang)}\n"
-        help_text += f"- `/export_users`：{get_text('help.cmd_export_users', lang)}\n"
-        help_text += f"- `/export_submissions`：{get_text('help.cmd_export_submissions', lang)}\n"
-        campaign_id_label = get_text('common.campaign_id', lang)
-        help_text += f"- `/export_submissions_by_campaign <{campaign_id_label}>` ：{get_text('help.cmd_export_submissions_by_campaign', lang)}\n"
-        help_text += f"- `/get_group_id`：{get_text('help.cmd_get_group_id', lang)}\n"
-        help_text += f"- `/export_feedback`：{get_text('help.cmd_export_feedback', lang)}\n"
-        help_text += f"- `/search_user`：{get_text('help.cmd_search_user', lang)}\n"
+    def render():
+        # Build help text using multilingual strings
+        help_text = get_text('help.title', lang, name=COMMUNITY_NAME) + "\n\n"
+        help_text += get_text('help.user_commands', lang) + "\n"
+        help_text += f"- `/start`：{get_text('help.cmd_start', lang)}\n"
+        help_text += f"- `/me`：{get_text('help.cmd_me', lang)}\n"
+        help_text += f"- `/bind`：{get_text('help.cmd_bind', lang, name=COMMUNITY_ACCOUNT_NAME)}\n"
+        help_text += f"- `/bind_binance <UID>`：{get_text('help.cmd_bind_binance', lang)}\n"
+        help_text += f"- `/bind_twitter @handle`：{get_text('help.cmd_bind_twitter', lang)}\n"
+
+        if COMMUNITY_ACCOUNT_NAME:
+            address_label = get_text('common.address', lang)
+            help_text += f"- `/bind_address <{address_label}>`：{get_text('help.cmd_bind_address', lang, name=COMMUNITY_ACCOUNT_NAME)}\n"
+
+        help_text += f"- `/invites`：{get_text('help.cmd_invites', lang)}\n"
+        help_text += f"- `/submit`：{get_text('help.cmd_submit', lang)}\n"
+        help_text += f"- `/my_submissions`：{get_text('help.cmd_my_submissions', lang)}\n"
+        symbol_label = get_text('common.symbol', lang)
+        help_text += f"- `/price <{symbol_label}>`：{get_text('help.cmd_price', lang)}\n"
+        content_label = get_text('common.content', lang)
+        help_text += f"- `/feedback <{content_label}>`：{get_text('help.cmd_feedback', lang)}\n"
         amount_label = get_text('common.amount', lang)
-        help_text += f"- `/draw <{amount_label}> 1001,1002,1003,1004` ：{get_text('help.cmd_draw', lang)}\n"
-        help_text += f"- `/export_month_rank <YYYY-MM>`：{get_text('help.cmd_export_month_rank', lang)}\n"
-
-    help_text += "\n" + get_text('help.feedback', lang)
-    bot.reply_to(message, help_text, parse_mode="Markdown")
+        help_text += f"- `/unlock_points <{amount_label}>`：{get_text('help.cmd_unlock_points', lang)}\n"
+        help_text += f"- `/transfer_points <ID> <{amount_label}>`：{get_text('help.cmd_transfer_points', lang)}\n"
+        help_text += f"- `/recent_points`：{get_text('help.cmd_recent_points', lang)}\n"
+        help_text += f"- `/transfer`：{get_text('help.cmd_transfer', lang)}\n"
+        help_text += f"- `/faq`: {get_text('help.cmd_faq', lang)}\n\n"
+
+        help_text += get_text('help.group_commands', lang) + "\n"
+        help_text += f"- `/signinword`：{get_text('help.cmd_signinword', lang)}\n"
+        help_text += f"- `/ranking`：{get_text('help.cmd_ranking', lang)}\n"
+        help_text += f"- `/active`：{get_text('help.cmd_active', lang)}\n"
+        help_text += f"- `/price` <{symbol_label}>：{get_text('help.cmd_price_group', lang)}\n"
+        send_signin_label = get_text('common.send_signin', lang)
+        help_text += f"- *{send_signin_label}*：{get_text('help.cmd_send_signin', lang)}\n"
+
+        if is_admin:
+            help_text += "\n" + get_text('help.admin_commands', lang) + "\n"
+            help_text += f"- `/add_points <ID> <{amount_label}>`：{get_text('help.cmd_add_points', lang)}\n"
+            help_text += f"- `/add_unlock_points <ID> <{amount_label}>`：{get_text('help.cmd_add_unlock_points', lang)}\n"
+            upload_label = get_text('common.upload', lang, default='Upload')
+            help_text += f"- {upload_label} `batch_points.csv`：{get_text('help.cmd_batch_points', lang)}\n"
+            help_text += f"- {upload_label} `campaigns.json` : {get_text('help.cmd_upload_campaigns', lang)}\n"
+            help_text += f"- {upload_label} `faq.json` : {get_text('help.cmd_upload_faq', lang)}\n"
+            help_text += f"- {upload_label} `quiz_bank.json` : {get_text('help.cmd_upload_quiz', lang)}\n"
+            help_text += f"- `/quiz_send {{json}}`：{get_text('help.cmd_quiz_send', lang)}\n"
+            word_label = get_text('common.word', lang)
+            help_text += f"- `/add_sensitive <{word_label}>`：{get_text('help.cmd_add_sensitive', lang)}\n"
+            help_text += f"- `/export_users`：{get_text('help.cmd_export_users', lang)}\n"
+            help_text += f"- `/export_submissions`：{get_text('help.cmd_export_submissions', lang)}\n"
+            campaign_id_label = get_text('common.campaign_id', lang)
+            help_text += f"- `/export_submissions_by_campaign <{campaign_id_label}>` ：{get_text('help.cmd_export_submissions_by_campaign', lang)}\n"
+            help_text += f"- `/get_group_id`：{get_text('help.cmd_get_group_id', lang)}\n"
+            help_text += f"- `/export_feedback`：{get_text('help.cmd_export_feedback', lang)}\n"
+            help_text += f"- `/search_user`：{get_text('help.cmd_search_user', lang)}\n"
+            amount_label = get_text('common.amount', lang)
+            help_text += f"- `/draw <{amount_label}> 1001,1002,1003,1004` ：{get_text('help.cmd_draw', lang)}\n"
+            help_text += f"- `/export_month_rank <YYYY-MM>`：{get_text('help.cmd_export_month_rank', lang)}\n"
+
+        help_text += "\n" + get_text('help.feedback', lang)
+        return help_text
+
+    bot.reply_to(message, reply_cache.render(('help', lang, is_admin), render), parse_mode="Markdown")
+
+# ===== CSV export pipeline =====
+# Exports stream rows from the cursor in chunks into a spooled temp file (kept in memory while small, moved to disk
+# when it grows) and are built and sent on the async runtime, so the handler thread returns immediately.
+EXPORT_FETCH_SIZE = config.get('EXPORT_FETCH_SIZE', 1000)  # Rows read from the database per chunk
+EXPORT_SPOOL_MAX_MB = config.get('EXPORT_SPOOL_MAX_MB', 4)  # Exports larger than this are buffered on disk instead of in memory
+TELEGRAM_UPLOAD_LIMIT_BYTES = 50 * 1024 * 1024  # Bot API limit for uploaded documents
+
+def _new_export_file():
+    return tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_MB * 1024 * 1024, mode='w+b')
+
+def write_csv_export(chunks, header_rows=(), bom=False):
+    """
+    Write row chunks as UTF-8 CSV into a spooled temp file, encoding one chunk at a time
+    :param chunks: Iterable of lists of rows
+    :param header_rows: Rows written before the data
+    :param bom: Start the file with a UTF-8 BOM (for Excel)
+    :return: (file positioned at the start, number of data rows)
+    """
+    export_file = _new_export_file()
+    if bom:
+        export_file.write(codecs.BOM_UTF8)
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(header_rows)
+    count = 0
+    try:
+        for rows in chunks:
+            writer.writerows(rows)
+            count += len(rows)
+            export_file.write(buffer.getvalue().encode('utf-8'))
+            buffer.seek(0)
+            buffer.truncate()
+    finally:
+        # Release a generator's resources now rather than when it is garbage-collected
+        getattr(chunks, 'close', lambda: None)()
+    export_file.write(buffer.getvalue().encode('utf-8'))
+    export_file.seek(0)
+    return export_file, count
+
+def stream_csv_export(query, params=(), header_rows=(), bom=False):
+    """Run query and write its rows as CSV (see write_csv_export), reading EXPORT_FETCH_SIZE rows at a time"""
+    def chunks():
+        # A connection of its own: the read stays open across yields, which must not leave the thread's
+        # db_cursor() transaction open if the consumer stops early
+        conn = open_db_connection()
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            conn.close()
+    return write_csv_export(chunks(), header_rows, bom)
+
+def send_export(chat_id, export_file, file_name, caption):
+    """Send an export file as a document, gzip-compressing it first if it exceeds Telegram's upload limit"""
+    size = export_file.seek(0, os.SEEK_END)
+    export_file.seek(0)
+    if size > TELEGRAM_UPLOAD_LIMIT_BYTES:
+        compressed = _new_export_file()
+        with gzip.GzipFile(filename=file_name, mode='wb', fileobj=compressed) as gz:
+            shutil.copyfileobj(export_file, gz)
+        export_file.close()
+        export_file = compressed
+        export_file.seek(0)
+        file_name += '.gz'
+    with export_file:
+        bot.send_document(chat_id, export_file, visible_file_name=file_name, caption=caption)
+
+def submit_export(message, lang, build, file_name, caption, empty_text=None, empty_parse_mode=None):
+    """
+    Build and send an export on the async runtime
+    :param build: Function returning (file, row count), e.g. a stream_csv_export call; runs on a DB worker thread
+    :param empty_text: Reply sent instead of the file when the export has no rows
+    """
+    async def export():
+        try:
+            export_file, count = await async_runtime.run_db(build)
+            if count == 0 and empty_text:
+                export_file.close()
+                await async_runtime.run_blocking(bot.reply_to, message, empty_text, parse_mode=empty_parse_mode)
+                return
+            await async_runtime.run_blocking(send_export, message.chat.id, export_file, file_name, caption)
+        except Exception as e:
+            await async_runtime.run_blocking(bot.reply_to, message, get_text('admin.export.error', lang, error=str(e)))
+    return async_runtime.submit(export())
 
 @bot.message_handler(commands=['export_feedback'])
 def export_feedback_csv(message):
@@ -964,22 +2658,17 @@ def export_feedback_csv(message):
         bot.reply_to(message, get_text('feedback.empty_records', lang))
         return
 
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            content = f.read()
-
+    def build():
+        export_file = _new_export_file()
         # Add UTF-8 BOM header to avoid Excel encoding issues
-        byte_content = '\ufeff' + content
-        byte_io = BytesIO(byte_content.encode("utf-8"))
-        byte_io.seek(0)
-
-        file_name = f"feedback_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        bot.send_document(message.chat.id, byte_io, visible_file_name=file_name, caption=get_text('feedback.export_success', lang))
-        byte_io.close()
+        export_file.write(codecs.BOM_UTF8)
+        with open(file_path, "rb") as f:
+            shutil.copyfileobj(f, export_file)
+        export_file.seek(0)
+        return export_file, None
 
-    except Exception as e:
-        lang = get_user_lang(message.from_user.id)
-        bot.reply_to(message, get_text('admin.export.error', lang, error=str(e)))
+    file_name = f"feedback_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    submit_export(message, lang, build, file_name, get_text('feedback.export_success', lang))
 
 
 
@@ -1006,8 +2695,8 @@ def handle_feedback(message):
 
     custom_id = ""
     user = get_user(telegram_id)
-    if user and len(user) >= 10 and user[9]:  # custom_id field
-        custom_id = user[9]
+    if user and user.custom_id:
+        custom_id = user.custom_id
 
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
@@ -1044,9 +2733,9 @@ def handle_add_points(message):
             bot.reply_to(message, get_text('admin.add_points.user_not_found', lang, id=target_id))
             return
 
-        new_points = user[2] + points_to_add
-        update_user(target_id, 'points', new_points)
-        add_monthly_points(target_id, points_to_add)
+        with db_cursor():
+            new_points = increment_user_field(target_id, 'points', points_to_add)
+            add_monthly_points(target_id, points_to_add)
 
         with open(LOG_FILE, 'a', encoding='utf-8') as log_file:
             log_file.write(f"[{datetime.now()}] Admin {message.from_user.id} added {points_to_add} points for user {target_id}\n")
@@ -1088,8 +2777,7 @@ def handle_add_unlock_points(message):
             bot.reply_to(message, get_text('admin.add_unlock_points.user_not_found', lang))
             return
 
-        new_points = (user[11] or 0) + points
-        update_user(target_id, 'unlocked_points', new_points)
+        new_points = increment_user_field(target_id, 'unlocked_points', points)
 
         # Notify via private message
         try:
@@ -1138,7 +2826,7 @@ def handle_quiz_bank_json(message):
         file_info = bot.get_file(message.document.file_id)
         file_bytes = bot.download_file(file_info.file_path)
 
-        with open("quiz_bank.json", "wb") as f:
+        with open(QUIZ_BANK_FILE, "wb") as f:
             f.write(file_bytes)
 
         # Try to parse and validate
@@ -1170,8 +2858,8 @@ def handle_faq_json(message):
         with open("faq.json", "wb") as f:
             f.write(file_bytes)
 
-        load_faq()
-        bot.reply_to(message, get_text('faq.upload_success', lang, count=len(faq_data.get('categories', []))))
+        data = load_faq()
+        bot.reply_to(message, get_text('faq.upload_success', lang, count=len(data.get('categories', []))))
     except Exception as e:
         bot.reply_to(message, get_text('admin.upload.upload_error', lang, error=str(e)))
 
@@ -1179,11 +2867,9 @@ def handle_campaigns_json(message):
     lang = get_user_lang(message.from_user.id)
     try:
         # Get campaign_id used in database
-        conn = sqlite3.connect('telegram_bot.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT DISTINCT campaign_id FROM submissions WHERE campaign_id IS NOT NULL")
-        used_ids = {str(row[0]) for row in cursor.fetchall()}
-        conn.close()
+        with db_cursor() as cursor:
+            cursor.execute("SELECT DISTINCT campaign_id FROM submissions WHERE campaign_id IS NOT NULL")
+            used_ids = {str(row[0]) for row in cursor.fetchall()}
 
         # Download uploaded file
         file_info = bot.get_file(message.document.file_id)
@@ -1224,7 +2910,7 @@ def handle_campaigns_json(message):
             return
 
         # Write to campaigns.json
-        with open("campaigns.json", "w", encoding="utf-8") as f:
+        with open(CAMPAIGNS_FILE, "w", encoding="utf-8") as f:
             json.dump(new_list, f, ensure_ascii=False, indent=2)
 
         # Reply with preview content
@@ -1238,55 +2924,207 @@ def handle_campaigns_json(message):
     except Exception as e:
         bot.reply_to(message, get_text('admin.upload.upload_error', lang, error=str(e)))
 
-def handle_batch_points_csv(message):
+# ===== Batch points engine =====
+# batch_points.csv is validated as a whole and applied in one transaction. Reward notifications are stored in
+# batch_notify_items and sent by a background job that reports progress to the admin and resumes after a restart.
+BATCH_NOTIFY_PER_SECOND = config.get('BATCH_NOTIFY_PER_SECOND', 10)  # Reward notifications sent per second
+BATCH_PROGRESS_INTERVAL_SECONDS = config.get('BATCH_PROGRESS_INTERVAL_SECONDS', 15)  # How often the admin's progress message is updated
+
+def parse_batch_points_csv(data):
+    """
+    Validate a batch_points.csv upload
+    :return: (rows, errors) - rows is [(telegram_id, points)], errors is [(line_no, row, reason)]
+    """
+    rows, errors = [], []
+    for line_no, row in enumerate(csv.reader(StringIO(data.decode('utf-8-sig'))), 1):
+        if not any(cell.strip() for cell in row):
+            continue
+        try:
+            rows.append((int(row[0]), int(row[1])))
+        except (ValueError, IndexError) as e:
+            if line_no == 1 and not row[0].strip().lstrip('-').isdigit():
+                continue  # Header line, e.g. telegram_id,points
+            errors.append((line_no, row, str(e)))
+    return rows, errors
+
+def apply_batch_points(rows, admin_id, lang):
+    """
+    Apply all point changes and queue the reward notifications in one transaction
+    :return: (job_id or None, applied, missing) - applied is [(telegram_id, points, new_total)] in file order,
+             missing is [telegram_id] of rows whose user does not exist
+    """
+    now = datetime.now()
+    month_str = now.strftime('%Y-%m')
+    with db_cursor(immediate=True) as cursor:
+        ids = list({telegram_id for telegram_id, _ in rows})
+        balances = {}
+        for i in range(0, len(ids), SQLITE_MAX_VARIABLES):
+            chunk = ids[i:i + SQLITE_MAX_VARIABLES]
+            cursor.execute(f'SELECT telegram_id, points FROM users WHERE telegram_id IN ({",".join("?" * len(chunk))})', chunk)
+            balances.update(cursor.fetchall())
+
+        applied, missing = [], []
+        for telegram_id, points in rows:
+            if telegram_id not in balances:
+                missing.append(telegram_id)
+                continue
+            balances[telegram_id] = (balances[telegram_id] or 0) + points
+            applied.append((telegram_id, points, balances[telegram_id]))
+        if not applied:
+            return None, applied, missing
+
+        cursor.executemany('UPDATE users SET points = points + ? WHERE telegram_id = ?',
+                           [(points, telegram_id) for telegram_id, points, _ in applied])
+        invalidate_cached_users(telegram_id for telegram_id, _, _ in applied)
+        record_monthly_points(cursor, [(telegram_id, month_str, points) for telegram_id, points, _ in applied if points > 0])
+
+        cursor.execute('''
+            INSERT INTO batch_notify_jobs (admin_id, lang, total, created_at)
+            VALUES (?, ?, ?, ?)
+        ''', (admin_id, lang, len(applied), now.strftime('%Y-%m-%d %H:%M:%S')))
+        job_id = cursor.lastrowid
+        cursor.executemany('INSERT INTO batch_notify_items (job_id, telegram_id, points, total) VALUES (?, ?, ?, ?)',
+                           [(job_id, telegram_id, points, total) for telegram_id, points, total in applied])
+    return job_id, applied, missing
+
+class BatchNotifier:
+    """
+    Sends queued batch reward notifications one job at a time, paced to BATCH_NOTIFY_PER_SECOND.
+    Progress is saved after every message, so a restart continues with the next unsent notification.
+    """
+    def __init__(self, per_second, progress_interval):
+        self.interval = 1.0 / per_second
+        self.progress_interval = progress_interval
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def start(self):
+        """Queue unfinished jobs from a previous run and start the worker thread (once per process)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            with db_cursor() as cursor:
+                cursor.execute('SELECT id FROM batch_notify_jobs WHERE finished_at IS NULL ORDER BY id')
+                pending = [row[0] for row in cursor.fetchall()]
+            if pending:
+                print(get_log_text('logs.batch_notify_resumed', count=len(pending)))
+            for job_id in pending:
+                self._jobs.put(job_id)
+            threading.Thread(target=self._run, name='batch-notifier', daemon=True).start()
+            self._pid = os.getpid()
+
+    def submit(self, job_id, status_message_id=None):
+        if status_message_id is not None:
+            with db_cursor() as cursor:
+                cursor.execute('UPDATE batch_notify_jobs SET status_message_id = ? WHERE id = ?', (status_message_id, job_id))
+        self.start()
+        self._jobs.put(job_id)
+
+    def _run(self):
+        while True:
+            job_id = self._jobs.get()
+            try:
+                self._run_job(job_id)
+            except Exception as e:
+                print(get_log_text('logs.batch_notify_job_failed', job_id=job_id, error=str(e)))
+
+    def _run_job(self, job_id):
+        with db_cursor() as cursor:
+            cursor.execute('''
+                SELECT admin_id, lang, status_message_id, total, sent, failed, last_item_id, finished_at
+                FROM batch_notify_jobs WHERE id = ?
+            ''', (job_id,))
+            job = cursor.fetchone()
+        if job is None or job[7]:
+            return  # Already finished (e.g. queued twice while resuming)
+        admin_id, lang, status_message_id, total, sent, failed, last_item_id, _ = job
+        last_report = time.monotonic()
+
+        while True:
+            with db_cursor() as cursor:
+                cursor.execute('''
+                    SELECT id, telegram_id, points, total FROM batch_notify_items
+                    WHERE job_id = ? AND id > ? ORDER BY id LIMIT 200
+                ''', (job_id, last_item_id))
+                items = cursor.fetchall()
+            if not items:
+                break
+            for item_id, telegram_id, points, new_total in items:
+                started = time.monotonic()
+                try:
+                    # Use default language for notification
+                    with outbound_lane(OUTBOUND_LANE_BROADCAST):
+                        bot.send_message(telegram_id, get_text('admin.batch.reward_message', DEFAULT_LANGUAGE, points=points, total=new_total))
+                    sent += 1
+                except Exception as e:
+                    failed += 1
+                    print(get_log_text('logs.batch_notify_failed', user_id=telegram_id, error=str(e)))
+                last_item_id = item_id
+                with db_cursor() as cursor:
+                    cursor.execute('UPDATE batch_notify_jobs SET sent = ?, failed = ?, last_item_id = ? WHERE id = ?',
+                                   (sent, failed, last_item_id, job_id))
+                if time.monotonic() - last_report >= self.progress_interval:
+                    self._report(admin_id, status_message_id, get_text('admin.batch.notify_progress', lang, done=sent + failed, total=total))
+                    last_report = time.monotonic()
+                time.sleep(max(0, self.interval - (time.monotonic() - started)))
+
+        with db_cursor() as cursor:
+            cursor.execute('UPDATE batch_notify_jobs SET finished_at = ? WHERE id = ?', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), job_id))
+            cursor.execute('DELETE FROM batch_notify_items WHERE job_id = ?', (job_id,))
+        self._report(admin_id, status_message_id, get_text('admin.batch.notify_done', lang, sent=sent, failed=failed, total=total))
+
+    @staticmethod
+    def _report(admin_id, status_message_id, text):
+        try:
+            with outbound_lane(OUTBOUND_LANE_COSMETIC):
+                if status_message_id:
+                    bot.edit_message_text(text, chat_id=admin_id, message_id=status_message_id)
+                else:
+                    bot.send_message(admin_id, text)
+        except Exception:
+            # Progress message deleted or text unchanged, ignore
+            pass
+
+batch_notifier = BatchNotifier(BATCH_NOTIFY_PER_SECOND, BATCH_PROGRESS_INTERVAL_SECONDS)
+
+@async_handler
+async def handle_batch_points_csv(message):
+    run_blocking, run_db = async_runtime.run_blocking, async_runtime.run_db
     try:
+        lang = get_user_lang(message.from_user.id)
+
         # Download file
-        file_info = bot.get_file(message.document.file_id)
-        downloaded_file = bot.download_file(file_info.file_path)
+        file_info = await run_blocking(bot.get_file, message.document.file_id)
+        downloaded_file = await run_blocking(bot.download_file, file_info.file_path)
 
         # Save local file
         with open('batch_points.csv', 'wb') as f:
             f.write(downloaded_file)
 
-        # Execute batch points addition
-        success = 0
-        failed = 0
-        log_lines = []
-
-        decoded = downloaded_file.decode('utf-8')
-        reader = csv.reader(StringIO(decoded))
-        for row in reader:
-            try:
-                telegram_id = int(row[0])
-                points = int(row[1])
-                user = get_user(telegram_id)
-                if user:
-                    new_points = user[2] + points
-
-                    update_user(telegram_id, 'points', new_points)
-                    add_monthly_points(telegram_id, points)
-
-                    lang_user = DEFAULT_LANGUAGE  # Use default language for notification
-                    bot.send_message(telegram_id, get_text('admin.batch.reward_message', lang_user, points=points, total=new_points))
-                    time.sleep(2)
-                    log_lines.append(f"[{datetime.now()}] Admin {message.from_user.id} added {points} points for user {telegram_id}")
-                    success += 1
-                else:
-                    log_lines.append(f"[{datetime.now()}] ❌ User {telegram_id} does not exist")
-                    failed += 1
-            except Exception as e:
-                failed += 1
-                log_lines.append(f"[{datetime.now()}] ❌ Error processing row: {row}, Error: {e}")
+        # Validate every row first, then apply all valid rows at once
+        rows, errors = parse_batch_points_csv(downloaded_file)
+        job_id, applied, missing = await run_db(apply_batch_points, rows, message.from_user.id, lang)
 
+        now = datetime.now()
+        log_lines = [f"[{now}] Admin {message.from_user.id} added {points} points for user {telegram_id}" for telegram_id, points, _ in applied]
+        log_lines += [f"[{now}] ❌ User {telegram_id} does not exist" for telegram_id in missing]
+        log_lines += [f"[{now}] ❌ Error processing row {line_no}: {row}, Error: {error}" for line_no, row, error in errors]
         with open('add_points_log.txt', 'a', encoding='utf-8') as log_file:
             log_file.write("\n".join(log_lines) + "\n")
 
-        lang = get_user_lang(message.from_user.id)
-        bot.reply_to(message, get_text('admin.batch.success', lang, success=success, failed=failed))
+        reply = get_text('admin.batch.success', lang, success=len(applied), failed=len(missing) + len(errors))
+        await run_blocking(bot.reply_to, message, reply)
+        if job_id is None:
+            return
+        status = await run_blocking(bot.send_message, message.chat.id, get_text('admin.batch.notify_progress', lang, done=0, total=len(applied)))
+        await run_db(batch_notifier.submit, job_id, status.message_id)
 
     except Exception as e:
         lang = get_user_lang(message.from_user.id)
-        bot.reply_to(message, get_text('admin.batch.error', lang, error=str(e)))
+        await run_blocking(bot.reply_to, message, get_text('admin.batch.error', lang, error=str(e)))
 
 
 @bot.message_handler(commands=['price'])
@@ -1299,13 +3137,11 @@ def handle_price(message):
             return
 
         symbol = parts[1].upper()
-        url = f"{PRICE_API_BASE_URL}?symbol={symbol}USDT"
-
-        response = requests.get(url, timeout=5)
-        data = response.json()
-        print (data)
-        if 'price' in data:
-            price = float(data['price'])
+        pair = f"{symbol}USDT"
+        price, error = get_price_quotes([pair])[pair]
+        if error:
+            raise RuntimeError(error)
+        if price is not None:
             bot.reply_to(message, get_text('price.price_message', lang, symbol=symbol, price=price), parse_mode='Markdown')
         else:
             bot.reply_to(message, get_text('price.invalid', lang, symbol=symbol), parse_mode='Markdown')
@@ -1323,43 +3159,29 @@ def export_submissions_by_campaign(message):
         bot.reply_to(message, get_text('commands.admin_only', lang))
         return
 
-    try:
-        parts = message.text.strip().split()
-        if len(parts) != 2:
-            bot.reply_to(message, get_text('admin.export.format_error', lang))
-            return
-
-        campaign_id = parts[1]
+    parts = message.text.strip().split()
+    if len(parts) != 2:
+        bot.reply_to(message, get_text('admin.export.format_error', lang))
+        return
 
-        conn = sqlite3.connect('telegram_bot.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT telegram_id, type, link 
+    campaign_id = parts[1]
+    build = functools.partial(
+        stream_csv_export,
+        '''
+            SELECT telegram_id, type, link
             FROM submissions
             WHERE campaign_id = ?
-        ''', (campaign_id,))
-        rows = cursor.fetchall()
-        conn.close()
-
-        if not rows:
-            bot.reply_to(message, get_text('admin.export.empty_submissions', lang, id=campaign_id), parse_mode="Markdown")
-            return
-
-        # Write CSV
-        string_io = StringIO()
-        writer = csv.writer(string_io)
-        writer.writerow(["Telegram ID", "Type", "Link"])
-        for row in rows:
-            writer.writerow(row)
-
-        byte_io = BytesIO(string_io.getvalue().encode('utf-8'))
-        byte_io.seek(0)
-        file_name = f"submissions_{campaign_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        bot.send_document(message.chat.id, byte_io, visible_file_name=file_name, caption=get_text('admin.export.export_success_submissions', lang, id=campaign_id))
-        byte_io.close()
-
-    except Exception as e:
-        bot.reply_to(message, get_text('admin.export.error', lang, error=str(e)))
+        ''',
+        (campaign_id,),
+        header_rows=[["Telegram ID", "Type", "Link"]]
+    )
+    file_name = f"submissions_{campaign_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    submit_export(
+        message, lang, build, file_name,
+        get_text('admin.export.export_success_submissions', lang, id=campaign_id),
+        empty_text=get_text('admin.export.empty_submissions', lang, id=campaign_id),
+        empty_parse_mode="Markdown"
+    )
 
 
 
@@ -1376,33 +3198,17 @@ def export_submissions_csv(message):
         bot.reply_to(message, get_text('commands.admin_only', lang))
         return
 
-    try:
-        conn = sqlite3.connect('telegram_bot.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT telegram_id, type, link FROM submissions")
-        rows = cursor.fetchall()
-        conn.close()
-
-        if not rows:
-            bot.reply_to(message, get_text('admin.export.empty_submissions_all', lang))
-            return
-
-        # Use StringIO to write text content, then encode to bytes
-        string_io = StringIO()
-        writer = csv.writer(string_io)
-        writer.writerow(["Telegram ID", "Type", "Link"])
-        for row in rows:
-            writer.writerow(row)
-
-        byte_io = BytesIO(string_io.getvalue().encode('utf-8'))
-        byte_io.seek(0)
-
-        file_name = f"submissions_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        bot.send_document(message.chat.id, byte_io, visible_file_name=file_name, caption=get_text('admin.export.export_success_all', lang))
-        byte_io.close()
-
-    except Exception as e:
-        bot.reply_to(message, get_text('admin.export.error', lang, error=str(e)))
+    build = functools.partial(
+        stream_csv_export,
+        "SELECT telegram_id, type, link FROM submissions",
+        header_rows=[["Telegram ID", "Type", "Link"]]
+    )
+    file_name = f"submissions_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    submit_export(
+        message, lang, build, file_name,
+        get_text('admin.export.export_success_all', lang),
+        empty_text=get_text('admin.export.empty_submissions_all', lang)
+    )
 
 @bot.message_handler(commands=['export_users'])
 def export_users_csv(message):
@@ -1417,40 +3223,25 @@ def export_users_csv(message):
         bot.reply_to(message, get_text('commands.admin_only', lang))
         return
 
-    try:
-        conn = sqlite3.connect('telegram_bot.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT 
-                telegram_id, last_signin, points, binance_uid, twitter_handle, 
+    build = functools.partial(
+        stream_csv_export,
+        '''
+            SELECT
+                telegram_id, last_signin, points, binance_uid, twitter_handle,
                 a_account, invited_by, joined_group, name, custom_id, last_bonus_date, unlocked_points
             FROM users
-        ''')
-        rows = cursor.fetchall()
-        conn.close()
-
-        if not rows:
-            bot.reply_to(message, get_text('admin.export.empty_users', lang))
-            return
-
-        # Write CSV format
-        string_io = StringIO()
-        writer = csv.writer(string_io)
-        writer.writerow([
-            "Telegram ID", "Last Sign-in", "Points", "Binance UID", "X Account", 
+        ''',
+        header_rows=[[
+            "Telegram ID", "Last Sign-in", "Points", "Binance UID", "X Account",
             "A Account", "Inviter ID", "Joined Group", "Name", "Custom ID", "Last Bonus Date", "Unlocked Points"
-        ])
-        for row in rows:
-            writer.writerow(row)
-
-        byte_io = BytesIO(string_io.getvalue().encode("utf-8"))
-        byte_io.seek(0)
-        filename = f"users_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        bot.send_document(message.chat.id, byte_io, visible_file_name=filename, caption=get_text('admin.export.export_success_users', lang))
-        byte_io.close()
-
-    except Exception as e:
-        bot.reply_to(message, get_text('admin.export.error', lang, error=str(e)))
+        ]]
+    )
+    filename = f"users_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    submit_export(
+        message, lang, build, filename,
+        get_text('admin.export.export_success_users', lang),
+        empty_text=get_text('admin.export.empty_users', lang)
+    )
 
 
 @bot.message_handler(commands=['quiz_send'])
@@ -1463,8 +3254,7 @@ def send_quiz(message):
     try:
         if message.text.strip() == "/quiz_send":
             # Read from quiz bank file
-            with open('quiz_bank.json', 'r', encoding='utf-8') as f:
-                quiz_list = json.load(f)
+            quiz_list = quiz_bank_file.require()
             if not quiz_list:
                 bot.reply_to(message, get_text('quiz.empty', lang))
                 return
@@ -1496,7 +3286,7 @@ def send_quiz(message):
 
         sent_msg = bot.send_message(ALLOWED_GROUP_ID, get_text('quiz.quiz_message', lang, question=question), reply_markup=markup)
 
-        threading.Timer(1800, lambda: disable_quiz(quiz_id)).start()
+        schedule_quiz_close(quiz_id, 1800)
 
     except Exception as e:
         bot.reply_to(message, get_text('quiz.format_error', lang, error=str(e)))
@@ -1523,8 +3313,7 @@ def handle_submit(message):
         pass
 
     try:
-        with open("campaigns.json", "r", encoding="utf-8") as f:
-            campaigns = json.load(f)
+        campaigns = campaigns_file.require()
     except Exception as e:
         bot.reply_to(message, get_text('submit.no_config', lang, error=str(e)))
         return
@@ -1559,8 +3348,7 @@ def handle_campaign_selection(call):
     lang = get_user_lang(call.from_user.id)
     # Load campaign configuration file
     try:
-        with open("campaigns.json", "r", encoding="utf-8") as f:
-            campaigns = json.load(f)
+        campaigns = campaigns_file.require()
     except Exception as e:
         bot.send_message(call.message.chat.id, get_text('submit.no_config', lang, error=str(e)))
         return
@@ -1676,10 +3464,9 @@ def process_submission_with_campaign(message, submit_type, telegram_id, campaign
         return
 
     # Write to database (avoid duplicates)
-    conn = sqlite3.connect('telegram_bot.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM submissions WHERE telegram_id = ? AND type = ? AND link = ?", (telegram_id, submit_type, link))
-    exists = cursor.fetchone()
+    with db_cursor() as cursor:
+        cursor.execute("SELECT 1 FROM submissions WHERE telegram_id = ? AND type = ? AND link = ?", (telegram_id, submit_type, link))
+        exists = cursor.fetchone()
 
     if exists:
         bot.reply_to(message, get_text('submit.duplicate', lang))
@@ -1688,20 +3475,17 @@ def process_submission_with_campaign(message, submit_type, telegram_id, campaign
         markup.add(types.InlineKeyboardButton(get_text('submit.continue_activity', lang), callback_data=f"select_campaign_{campaign_id}"))
         markup.add(types.InlineKeyboardButton(get_text('submit.back_activities', lang), callback_data="back_to_submit"))
         bot.send_message(message.chat.id, get_text('submit.continue_prompt', lang), reply_markup=markup)
-        conn.close()
         return
 
     try:
-        cursor.execute(
-            "INSERT INTO submissions (telegram_id, type, link, campaign_id) VALUES (?, ?, ?, ?)",
-            (telegram_id, submit_type, link, campaign_id)
-        )
-        conn.commit()
+        with db_cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO submissions (telegram_id, type, link, campaign_id) VALUES (?, ?, ?, ?)",
+                (telegram_id, submit_type, link, campaign_id)
+            )
         bot.reply_to(message, get_text('submit.success', lang, campaign_id=campaign_id))
     except Exception as e:
         bot.reply_to(message, get_text('submit.save_error', lang, error=str(e)))
-    finally:
-        conn.close()
 
     # After submission, provide next step options
     markup = types.InlineKeyboardMarkup()
@@ -1728,13 +3512,14 @@ def handle_add_sensitive(message):
         return
 
     try:
-        with open('sensitive_words.txt', 'a+', encoding='utf-8') as f:
+        with open(SENSITIVE_WORDS_FILE, 'a+', encoding='utf-8') as f:
             f.seek(0)
             existing_words = [line.strip().lower() for line in f.readlines()]
             if new_word in existing_words:
                 bot.reply_to(message, get_text('admin.sensitive.exists', lang, word=new_word))
                 return
             f.write(new_word + '\n')
+        sensitive_words_file.reload()  # Pick up the new word immediately so the matcher is rebuilt
         bot.reply_to(message, get_text('admin.sensitive.success', lang, word=new_word))
     except Exception as e:
         bot.reply_to(message, get_text('admin.sensitive.error', lang, error=str(e)))
@@ -1742,16 +3527,13 @@ def handle_add_sensitive(message):
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith("quiz_"))
 def handle_quiz_answer(call):
-    global last_click_times
     telegram_id = call.from_user.id
-    now = time.time()
 
     # Rate limiting: no clicking again within 2 seconds
-    if telegram_id in last_click_times and now - last_click_times[telegram_id] < RATE_LIMIT_SECONDS:
+    if not quiz_click_limiter.allow(telegram_id):
         lang = get_user_lang(telegram_id)
         bot.answer_callback_query(call.id, get_text('quiz.click_too_fast', lang))
         return
-    last_click_times[telegram_id] = now
 
     parts = call.data.split("_")
     quiz_id, choice = parts[1], int(parts[2])
@@ -1766,34 +3548,28 @@ def handle_quiz_answer(call):
       except:
         pass  # Prevent callback_query timeout exception
 
-    # Check if already answered in database
-    conn = sqlite3.connect('telegram_bot.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM quiz_answers WHERE quiz_id = ? AND telegram_id = ?", (quiz_id, telegram_id))
-    if cursor.fetchone():
-        conn.close()
+    # Record the answer; the primary key makes a second answer a no-op
+    with db_cursor() as cursor:
+        cursor.execute("INSERT OR IGNORE INTO quiz_answers (quiz_id, telegram_id) VALUES (?, ?)", (quiz_id, telegram_id))
+        already_answered = cursor.rowcount == 0
+
+    if already_answered:
         name = call.from_user.first_name or ""
         bot.send_message(call.message.chat.id, get_text('quiz.already_answered', lang, name=name))
         return
 
-    # Insert quiz answer record
-    cursor.execute("INSERT INTO quiz_answers (quiz_id, telegram_id) VALUES (?, ?)", (quiz_id, telegram_id))
-    conn.commit()
-
     # Check if answer is correct
     name = call.from_user.first_name or ""
     if choice == current_quiz.get("answer"):
-        user = get_user(telegram_id)
-
-        update_user(telegram_id, 'points', user[2] + QUIZ_CORRECT_POINTS)
-        add_monthly_points(telegram_id, QUIZ_CORRECT_POINTS)
+        with db_cursor():
+            if increment_user_field(telegram_id, 'points', QUIZ_CORRECT_POINTS) is not None:
+                add_monthly_points(telegram_id, QUIZ_CORRECT_POINTS)
 
        # bot.answer_callback_query(call.id, "✅ 回答正确！积分 +1")
         bot.send_message(call.message.chat.id, get_text('quiz.correct', lang, name=name))
     else:
         # bot.answer_callback_query(call.id, "❌ 回答错误")
         bot.send_message(call.message.chat.id, get_text('quiz.wrong', lang, name=name))
-    conn.close()
 
 @bot.message_handler(commands=['active'])
 def handle_active_ranking(message):
@@ -1801,7 +3577,7 @@ def handle_active_ranking(message):
     if message.chat.type == 'private':
         # When using in private chat, require user to have joined group
         user = get_user(message.from_user.id)
-        if not user or user[7] != 1:
+        if not user or user.joined_group != 1:
             bot.reply_to(message, get_text('active.not_in_group', lang))
             return
     else:
@@ -1810,55 +3586,27 @@ def handle_active_ranking(message):
             return
 
     target_month = datetime.now().strftime('%Y-%m')
-
-    # Get users with current points ≥ configured value
-    conn = sqlite3.connect('telegram_bot.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT telegram_id, name, custom_id FROM users WHERE points >= ?", (MIN_ACTIVE_POINTS,))
-    user_info = {}
-    for row in cursor.fetchall():
-     tid = str(row[0])
-     if int(tid) in ADMIN_IDS:
-        continue  # Exclude admins
-     user_info[tid] = {
-        'name': row[1] or '',
-        'custom_id': row[2] or ''
-    }
-
-    conn.close()
-
-    log_path = "group_messages.log"
-    pattern = re.compile(r'\[(\d{4}-\d{2}-\d{2}) \d{2}:\d{2}:\d{2}\] .*?\[User: (.*?) \((\d+)\)\]')
-    activity = defaultdict(int)
-
-    lang = get_user_lang(message.from_user.id)
-    if not os.path.exists(log_path):
-        bot.reply_to(message, get_text('active.no_log', lang))
-        return
-
-    with open(log_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            match = pattern.search(line)
-            if not match:
-                continue
-            date_str, _, tid = match.groups()
-            if not date_str.startswith(target_month):
-                continue
-            if tid not in user_info:
-                continue
-            activity[tid] += 1
-
-    sorted_activity = sorted(activity.items(), key=lambda x: x[1], reverse=True)[:20]
+    flush_activity_counts()
+
+    # Top users this month among those with current points ≥ configured value, admins excluded.
+    # Not cached like /ranking: the points filter changes with every points update, which the counts don't track.
+    ranked = activity_leaderboard.ranked(target_month)
+    sorted_activity = []
+    for i in range(0, len(ranked), 100):
+        chunk = ranked[i:i + 100]
+        users = get_user_columns([tid for tid, _ in chunk], 'name, points')
+        for tid, count in chunk:
+            if tid in users and (users[tid][1] or 0) >= MIN_ACTIVE_POINTS:
+                sorted_activity.append((tid, users[tid][0], count))
+        if len(sorted_activity) >= LEADERBOARD_SIZE:
+            break
 
     if not sorted_activity:
         bot.reply_to(message, get_text('active.empty', lang, min=MIN_ACTIVE_POINTS))
         return
-
     msg = get_text('active.title', lang, month=target_month, min=MIN_ACTIVE_POINTS)
-    for idx, (tid, count) in enumerate(sorted_activity, 1):
-        info = user_info.get(tid, {})
-        msg += get_text('active.item', lang, rank=idx, name=info['name'], id=tid, count=count)
-
+    for idx, (tid, name, count) in enumerate(sorted_activity[:LEADERBOARD_SIZE], 1):
+        msg += get_text('active.item', lang, rank=idx, name=name or '', id=tid, count=count)
     bot.reply_to(message, msg)
 
 @bot.message_handler(commands=['ranking'])
@@ -1867,7 +3615,7 @@ def handle_ranking(message):
     if message.chat.type == 'private':
         # When using in private chat, require user to have joined group
         user = get_user(message.from_user.id)
-        if not user or user[7] != 1:
+        if not user or user.joined_group != 1:
             bot.reply_to(message, get_text('active.not_in_group', lang))
             return
     else:
@@ -1877,32 +3625,16 @@ def handle_ranking(message):
 
     month_str = datetime.now().strftime('%Y-%m')
 
-    conn = sqlite3.connect('telegram_bot.db')
-    cur = conn.cursor()
-    cur.execute('''
-        SELECT u.telegram_id, u.name, COALESCE(m.earned, 0) AS earned
-        FROM users u
-        LEFT JOIN monthly_points m
-          ON m.telegram_id = u.telegram_id AND m.month = ?
-        WHERE COALESCE(m.earned, 0) > 0
-        ORDER BY earned DESC
-        LIMIT 20
-    ''', (month_str,))
-    rows = cur.fetchall()
-    conn.close()
+    def render():
+        top = points_leaderboard.ranked(month_str, limit=LEADERBOARD_SIZE)  # Admins already excluded
+        names = get_user_columns([tid for tid, _ in top], 'name')
+        msg = get_text('ranking.title', lang)
+        for rank, (tid, earned) in enumerate(top, 1):
+            clean_name_str = clean_name(names.get(tid, (None,))[0]) or get_text('common.unknown', lang)
+            msg += get_text('ranking.item', lang, rank=rank, name=clean_name_str, id=tid, points=earned)
+        return msg
 
-    lang = get_user_lang(message.from_user.id)
-    msg = get_text('ranking.title', lang)
-    rank = 1
-    for tid, name, earned in rows:
-        if int(tid) in ADMIN_IDS:
-            continue  # Exclude admins
-        clean_name_str = clean_name(name) or get_text('common.unknown', lang)
-        msg += get_text('ranking.item', lang, rank=rank, name=clean_name_str, id=tid, points=earned)
-        rank += 1
-        if rank > 20:  # Limit to top 20
-            break
-    bot.reply_to(message, msg)
+    bot.reply_to(message, points_leaderboard.render(month_str, ('ranking', lang), render))
 
 
 # /start command (private chat only)
@@ -1937,16 +3669,18 @@ def handle_start(message):
     update_user_name_and_custom_id(telegram_id, name.strip(), custom_id)
 
 
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=False)
-    markup.add('/start', '/bind', '/me', '/invites','/submit')
-
     lang = get_user_lang(telegram_id)
-    invite_link = f"https://t.me/{bot.get_me().username}?start={telegram_id}"
-    group_link_text = f"{get_text('start.join_group', lang)}\n{COMMUNITY_GROUP_LINK}\n" if COMMUNITY_GROUP_LINK else ""
-    start_msg = get_text('start.start_message', lang, 
-                        group_link=group_link_text,
-                        invite_link=invite_link)
-    bot.send_message(message.chat.id, start_msg, reply_markup=ReplyKeyboardRemove())
+
+    def render():
+        group_link_text = f"{get_text('start.join_group', lang)}\n{COMMUNITY_GROUP_LINK}\n" if COMMUNITY_GROUP_LINK else ""
+        start_msg = get_text('start.start_message', lang,
+                            group_link=group_link_text,
+                            invite_link=INVITE_LINK_PLACEHOLDER)
+        return start_msg, ReplyKeyboardRemove().to_json()
+
+    start_msg, markup = reply_cache.render(('start', lang), render)
+    invite_link = f"https://t.me/{get_bot_username()}?start={telegram_id}"
+    bot.send_message(message.chat.id, start_msg.replace(INVITE_LINK_PLACEHOLDER, invite_link), reply_markup=markup)
 
 @bot.message_handler(commands=['signinword'])
 def handle_sign_in_word(message):
@@ -1954,9 +3688,11 @@ def handle_sign_in_word(message):
     if message.chat.id != ALLOWED_GROUP_ID:
         bot.reply_to(message, get_text('signinword.group_only', lang))
         return
-    if current_signin_word:
-        msg = f"{get_text('signin.word_today', lang)}\n\n`{current_signin_word}`\n\n{get_text('signin.ranking_info', lang)}\n\n{get_text('signin.bonus_info', lang)}"
-        bot.reply_to(message, msg, parse_mode="Markdown")
+    word = current_signin_word
+    if word:
+        def render():
+            return f"{get_text('signin.word_today', lang)}\n\n`{word}`\n\n{get_text('signin.ranking_info', lang)}\n\n{get_text('signin.bonus_info', lang)}"
+        bot.reply_to(message, reply_cache.render(('signinword', lang, word), render), parse_mode="Markdown")
     else:
         bot.reply_to(message, get_text('signin.word_not_set', lang))
 
@@ -1971,12 +3707,10 @@ def handle_invites(message):
         )
         return
     telegram_id = str(message.from_user.id)
-    conn = sqlite3.connect('telegram_bot.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM users WHERE invited_by = ? AND joined_group = 1", (telegram_id,))
-    count = cursor.fetchone()[0]
-    conn.close()
-    invite_link = f"https://t.me/{bot.get_me().username}?start={telegram_id}"
+    with db_cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM users WHERE invited_by = ? AND joined_group = 1", (telegram_id,))
+        count = cursor.fetchone()[0]
+    invite_link = f"https://t.me/{get_bot_username()}?start={telegram_id}"
 
     bot.reply_to(message, get_text('invites.count', lang, count=count, link=invite_link))
  
@@ -2057,26 +3791,27 @@ def handle_me(message):
         bot.reply_to(message, get_text('me.not_found', lang))
         return
 
-    conn = sqlite3.connect('telegram_bot.db')
-    cur = conn.cursor()
-    # Invite count
-    cur.execute("SELECT COUNT(*) FROM users WHERE invited_by = ? AND joined_group = 1", (str(telegram_id),))
-    invite_count = cur.fetchone()[0]
+    with db_cursor() as cur:
+        # Invite count
+        cur.execute("SELECT COUNT(*) FROM users WHERE invited_by = ? AND joined_group = 1", (str(telegram_id),))
+        invite_count = cur.fetchone()[0]
 
-    # Monthly earned
-    month_str = datetime.now().strftime('%Y-%m')
-    cur.execute("SELECT COALESCE(earned,0) FROM monthly_points WHERE telegram_id = ? AND month = ?", (telegram_id, month_str))
-    row = cur.fetchone()
-    month_points = row[0] if row else 0
-    conn.close()
+        # Monthly earned
+        month_str = datetime.now().strftime('%Y-%m')
+        cur.execute("SELECT COALESCE(earned,0) FROM monthly_points WHERE telegram_id = ? AND month = ?", (telegram_id, month_str))
+        row = cur.fetchone()
+        month_points = row[0] if row else 0
 
-    current_points = user[2]
-    unlocked_points = user[11] or 0
+    # Include chat points accrued but not flushed yet
+    pending_chat_points = chat_points.pending_points(telegram_id)
+    month_points += pending_chat_points
+    current_points = user.points + pending_chat_points
+    unlocked_points = user.unlocked_points or 0
 
     account_display_name = COMMUNITY_ACCOUNT_NAME or get_text('bind.address_name', lang)
-    binance = user[3] or get_text('common.not_bound', lang)
-    twitter = user[4] or get_text('common.not_bound', lang)
-    address_value = user[5] or get_text('common.not_bound', lang) if COMMUNITY_ACCOUNT_NAME else ""
+    binance = user.binance_uid or get_text('common.not_bound', lang)
+    twitter = user.twitter_handle or get_text('common.not_bound', lang)
+    address_value = user.a_account or get_text('common.not_bound', lang) if COMMUNITY_ACCOUNT_NAME else ""
     
     # Build message
     msg = f"{get_text('me.telegram_id', lang)}{telegram_id}\n"
@@ -2087,7 +3822,7 @@ def handle_me(message):
     msg += f"{get_text('me.twitter_account', lang)}{twitter}\n"
     if COMMUNITY_ACCOUNT_NAME:
         msg += f"{get_text('me.address', lang, name=account_display_name)}{address_value}\n"
-    invite_link = f"https://t.me/{bot.get_me().username}?start={telegram_id}"
+    invite_link = f"https://t.me/{get_bot_username()}?start={telegram_id}"
     msg += f"{get_text('me.invited_count', lang)}{invite_count}\n"
     msg += f"{get_text('me.invite_link_label', lang)}{invite_link}"
     bot.reply_to(message, msg)
@@ -2103,11 +3838,9 @@ def handle_my_submissions(message):
         return
 
     telegram_id = message.from_user.id
-    conn = sqlite3.connect('telegram_bot.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT type, link FROM submissions WHERE telegram_id = ?", (telegram_id,))
-    results = cursor.fetchall()
-    conn.close()
+    with db_cursor() as cursor:
+        cursor.execute("SELECT type, link FROM submissions WHERE telegram_id = ?", (telegram_id,))
+        results = cursor.fetchall()
 
     if not results:
         bot.reply_to(message, get_text('my_submissions.empty', lang))
@@ -2190,17 +3923,13 @@ def handle_transfer_points(message):
         if not recipient:
             bot.reply_to(message, get_text('transfer.target_not_found', lang))
             return
-        if sender[11] < amount:
-            bot.reply_to(message, get_text('transfer.insufficient', lang, points=sender[11]))
+        # Update database (the balance is checked by the UPDATE itself)
+        done, remaining = transfer_unlocked_points(sender_id, recipient_id, amount)
+        if not done:
+            bot.reply_to(message, get_text('transfer.insufficient', lang, points=remaining))
             return
 
-        # Update database
-        update_user(sender_id, 'unlocked_points', sender[11] - amount)
-        update_user(recipient_id, 'unlocked_points', recipient[11] + amount)
-
-        log_transfer(sender_id, recipient_id, amount)
-
-        bot.reply_to(message, get_text('transfer.success', lang, amount=amount, id=recipient_id, remaining=sender[11] - amount))
+        bot.reply_to(message, get_text('transfer.success', lang, amount=amount, id=recipient_id, remaining=remaining))
     except ValueError:
         bot.reply_to(message, get_text('transfer.invalid_id', lang))
     except Exception as e:
@@ -2230,25 +3959,24 @@ def handle_unlock_points(message):
         bot.reply_to(message, get_text('unlock.format_error', lang))
         return
 
-    total_points = user[2]
-    unlocked = user[11]  # unlocked_points is the 12th column in users table (index starts from 0)
-
-    if total_points < amount:
+    # Update database (only if the points are still there)
+    with db_cursor() as cursor:
+        cursor.execute('''
+            UPDATE users
+            SET points = points - ?, unlocked_points = COALESCE(unlocked_points, 0) + ?
+            WHERE telegram_id = ? AND points >= ?
+        ''', (amount, amount, telegram_id, amount))
+        unlocked_now = cursor.rowcount > 0
+        if unlocked_now:
+            invalidate_cached_users([telegram_id])
+        cursor.execute('SELECT points, COALESCE(unlocked_points, 0) FROM users WHERE telegram_id = ?', (telegram_id,))
+        total_points, unlocked = cursor.fetchone()
+
+    if not unlocked_now:
         bot.reply_to(message, get_text('unlock.insufficient', lang, total=total_points, amount=amount))
         return
 
-    # Update database
-    conn = sqlite3.connect('telegram_bot.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE users
-        SET points = points - ?, unlocked_points = unlocked_points + ?
-        WHERE telegram_id = ?
-    ''', (amount, amount, telegram_id))
-    conn.commit()
-    conn.close()
-
-    bot.reply_to(message, get_text('unlock.success', lang, amount=amount, unlocked=unlocked + amount))
+    bot.reply_to(message, get_text('unlock.success', lang, amount=amount, unlocked=unlocked))
 
 @bot.message_handler(commands=['transfers'])
 def handle_all_transfers(message):
@@ -2261,22 +3989,19 @@ def handle_all_transfers(message):
         return
 
     telegram_id = message.from_user.id
-    conn = sqlite3.connect('telegram_bot.db')
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        SELECT sender_id, recipient_id, amount, timestamp
-        FROM transfers
-        WHERE sender_id = ? OR recipient_id = ?
-        ORDER BY timestamp DESC
-    ''', (telegram_id, telegram_id))
+    with db_cursor() as cursor:
+        cursor.execute('''
+            SELECT sender_id, recipient_id, amount, timestamp
+            FROM transfers
+            WHERE sender_id = ? OR recipient_id = ?
+            ORDER BY timestamp DESC
+        ''', (telegram_id, telegram_id))
 
-    records = cursor.fetchall()
+        records = cursor.fetchall()
 
     lang = get_user_lang(telegram_id)
     if not records:
         bot.reply_to(message, get_text('transfers.empty', lang))
-        conn.close()
         return
 
     # Query all related users' name and custom_id (avoid duplicate queries)
@@ -2286,14 +4011,13 @@ def handle_all_transfers(message):
         user_ids.add(rid)
 
     placeholders = ",".join("?" for _ in user_ids)
-    cursor.execute(f'''
-        SELECT telegram_id, name, custom_id FROM users
-        WHERE telegram_id IN ({placeholders})
-    ''', tuple(user_ids))
-    lang = get_user_lang(telegram_id)
-    user_info = {row[0]: (row[1] or get_text('common.unknown', lang), row[2] or "") for row in cursor.fetchall()}
-
-    conn.close()
+    with db_cursor() as cursor:
+        cursor.execute(f'''
+            SELECT telegram_id, name, custom_id FROM users
+            WHERE telegram_id IN ({placeholders})
+        ''', tuple(user_ids))
+        lang = get_user_lang(telegram_id)
+        user_info = {row[0]: (row[1] or get_text('common.unknown', lang), row[2] or "") for row in cursor.fetchall()}
 
     def format_user(uid):
         name, cid = user_info.get(uid, (get_text('common.unknown', lang), ""))
@@ -2352,16 +4076,12 @@ def process_transfer_amount(message, recipient_id):
         if not recipient:
             bot.reply_to(message, get_text('transfer.target_not_found_sender', lang))
             return
-        if sender[11] < amount:
-            bot.reply_to(message, get_text('transfer.insufficient_sender', lang, points=sender[11]))
+        # Execute transfer (the balance is checked by the UPDATE itself)
+        done, remaining = transfer_unlocked_points(sender_id, recipient_id, amount)
+        if not done:
+            bot.reply_to(message, get_text('transfer.insufficient_sender', lang, points=remaining))
             return
 
-        # Execute transfer
-        update_user(sender_id, 'unlocked_points', sender[11] - amount)
-        update_user(recipient_id, 'unlocked_points', recipient[11] + amount)
-
-        log_transfer(sender_id, recipient_id, amount)
-
         bot.reply_to(message, get_text('transfer.success_sender', lang, amount=amount, id=recipient_id))
     except:
         bot.reply_to(message, get_text('common.invalid_input', lang, default='❌ Invalid input, please start over.'))
@@ -2486,58 +4206,59 @@ def select_daily_signin_word():
     try:
         lang = DEFAULT_LANGUAGE
         signin_msg = f"{get_text('signin.word_today', lang)}\n\n`{current_signin_word}`\n\n{get_text('signin.word_prompt', lang)}"
-        sent = bot.send_message(ALLOWED_GROUP_ID, signin_msg, parse_mode="Markdown")
-        bot.pin_chat_message(ALLOWED_GROUP_ID, sent.message_id, disable_notification=False)
-        threading.Timer(300, lambda: bot.unpin_chat_message(ALLOWED_GROUP_ID, message_id=sent.message_id)).start()
+        with outbound_lane(OUTBOUND_LANE_BROADCAST):
+            sent = bot.send_message(ALLOWED_GROUP_ID, signin_msg, parse_mode="Markdown")
+            bot.pin_chat_message(ALLOWED_GROUP_ID, sent.message_id, disable_notification=False)
+        schedule_unpin(ALLOWED_GROUP_ID, sent.message_id, 300)
         print(get_log_text('logs.signin_task_sent', group_id=ALLOWED_GROUP_ID))
     except Exception as e:
         print(get_log_text('logs.signin_error_send_failed', error=str(e)))
 
 @bot.message_handler(func=lambda m: m.chat.type in ['group', 'supergroup'])
 def handle_custom_signin_word(message):
-    content = message.text if message.text else get_log_text('logs.non_text_message')
-    print(get_log_text('logs.message_received', group_id=message.chat.id, user_id=message.from_user.id, content=content))
-    
-    try:
-        with open(MESSAGE_LOG_FILE, 'a', encoding='utf-8') as log_file:
-            log_file.write(
-                f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
-                f"[Group: {message.chat.title} | Group ID: {message.chat.id}] "
-                f"[User: {message.from_user.first_name} ({message.from_user.id})] "
-                f"{message.text.strip() if message.text else '[Non-text message]'}\n"
-            )
-    except Exception as e:
-        print(get_log_text('logs.error_write_log', error=str(e)))
-    
-    load_activities()
-
-    # Check sensitive words first
-    sensitive_words = load_sensitive_words()
+    if VERBOSE_MESSAGE_LOGS:
+        content = message.text if message.text else get_log_text('logs.non_text_message')
+        debug_log('logs.message_received', group_id=message.chat.id, user_id=message.from_user.id, content=content)
+
+    message_log.write({
+        "ts": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "chat_id": message.chat.id,
+        "chat_title": message.chat.title,
+        "user_id": message.from_user.id,
+        "user_name": message.from_user.first_name,
+        "type": message.content_type,
+        "text": message.text.strip() if message.text else None,
+    })
+    record_message_activity(message.from_user.id)
+
+    activities, sensitive_words, matcher = get_keyword_matcher()
     text = message.text.lower() if message.text else ""
+    hits = matcher.find_all(text)
 
-    for act in activities:
-        for kw in act.get("match", []):
-            if kw.lower() in text:
-                lang = get_user_lang(message.from_user.id)
-                bot.reply_to(message, get_text('activity.welcome', lang, title=act['title'], default=f"Welcome to join {act['title']}"))
+    # Welcome reply once per matched activity, in configuration order
+    for idx in sorted(i for kind, i in hits if kind == 'activity'):
+        act = activities[idx]
+        lang = get_user_lang(message.from_user.id)
+        droppable_reply(message, get_text('activity.welcome', lang, title=act['title'], default=f"Welcome to join {act['title']}"))
 
-    for word in sensitive_words:
-        if word in text:
-            try:
-                bot.delete_message(message.chat.id, message.message_id)
-                name_tmp = message.from_user.first_name or ""
-                if message.from_user.last_name:
-                    name_tmp += " " + message.from_user.last_name
-                lang = DEFAULT_LANGUAGE  # Use default language for sensitive word warning
-                warn = bot.send_message(
-                    message.chat.id,
-                    get_text('admin.sensitive.triggered', lang, username=message.from_user.username or '', name=name_tmp, id=message.from_user.id)
-                )
-                threading.Timer(15, lambda: bot.delete_message(message.chat.id, warn.message_id)).start()
-                print(get_log_text('logs.sensitive_word_triggered', word=word, username=message.from_user.username or '', name=name_tmp, id=message.from_user.id))
-            except Exception as e:
-                print(get_log_text('logs.error_delete_sensitive', error=str(e)))
-            return  # Return directly after hitting sensitive word
+    sensitive_hits = [i for kind, i in hits if kind == 'sensitive']
+    if sensitive_hits:
+        word = sensitive_words[min(sensitive_hits)]
+        try:
+            bot.delete_message(message.chat.id, message.message_id)
+            name_tmp = message.from_user.first_name or ""
+            if message.from_user.last_name:
+                name_tmp += " " + message.from_user.last_name
+            lang = DEFAULT_LANGUAGE  # Use default language for sensitive word warning
+            warn = bot.send_message(
+                message.chat.id,
+                get_text('admin.sensitive.triggered', lang, username=message.from_user.username or '', name=name_tmp, id=message.from_user.id)
+            )
+            schedule_delete(message.chat.id, warn.message_id, 15, "Sensitive word warning")
+            print(get_log_text('logs.sensitive_word_triggered', word=word, username=message.from_user.username or '', name=name_tmp, id=message.from_user.id))
+        except Exception as e:
+            print(get_log_text('logs.error_delete_sensitive', error=str(e)))
+        return  # Return directly after hitting sensitive word
 
     telegram_id = message.from_user.id
     create_user_if_not_exist(telegram_id)
@@ -2550,117 +4271,66 @@ def handle_custom_signin_word(message):
     update_user_name_and_custom_id(telegram_id, name.strip(), custom_id)
 
     # Only allow specified group
-    global current_signin_word, last_chat_points_time
-    print(get_log_text('logs.signin_debug_check_group', msg_group_id=message.chat.id, allowed_group_id=ALLOWED_GROUP_ID))
+    global current_signin_word
+    debug_log('logs.signin_debug_check_group', msg_group_id=message.chat.id, allowed_group_id=ALLOWED_GROUP_ID)
     if message.chat.id != ALLOWED_GROUP_ID:
-        print(get_log_text('logs.signin_debug_group_mismatch'))
+        debug_log('logs.signin_debug_group_mismatch')
         return
     
     # Award chat points (if enabled and rate limit allows, includes admins)
     if CHAT_POINTS > 0 and message.text:  # Only for text messages
         try:
-            now_ts = time.time()
-            last_time = last_chat_points_time.get(telegram_id, 0)
             # Rate limit: 1 minute between chat points
-            if now_ts - last_time >= 60:
-                user = get_user(telegram_id)
-                if user:
-                    current_points = user[2]
-                    new_points = current_points + CHAT_POINTS
-                    update_user(telegram_id, 'points', new_points)
-                    add_monthly_points(telegram_id, CHAT_POINTS)
-                    last_chat_points_time[telegram_id] = now_ts
+            if chat_points_limiter.allow(telegram_id):
+                # The user row was created above; points are written in batches by chat_points.flush()
+                chat_points.accrue(telegram_id, CHAT_POINTS)
         except Exception as e:
             print(get_log_text('logs.error_chat_points', error=str(e), default=f"[Error] Failed to award chat points: {e}"))
     
-    print(get_log_text('logs.signin_debug_current_word', word=current_signin_word))
+    debug_log('logs.signin_debug_current_word', word=current_signin_word)
     if not current_signin_word:
-        print(get_log_text('logs.signin_debug_word_empty', group_id=message.chat.id, user_id=message.from_user.id))
+        debug_log('logs.signin_debug_word_empty', group_id=message.chat.id, user_id=message.from_user.id)
         return
 
     # Only enter when message matches sign-in word (improved matching: strip whitespace and compare case-insensitively)
     if not message.text:
-        print(get_log_text('logs.signin_debug_not_text'))
+        debug_log('logs.signin_debug_not_text')
         return
         
     msg_text_clean = message.text.strip().lower()
     signin_word_clean = current_signin_word.strip().lower()
-    print(get_log_text('logs.signin_debug_received', message=message.text, cleaned=msg_text_clean, word=current_signin_word, word_cleaned=signin_word_clean))
+    debug_log('logs.signin_debug_received', message=message.text, cleaned=msg_text_clean, word=current_signin_word, word_cleaned=signin_word_clean)
     
     if msg_text_clean == signin_word_clean:
-        print(get_log_text('logs.signin_debug_match_success'))
+        debug_log('logs.signin_debug_match_success')
         try:
-            user = get_user(telegram_id)  # Get current user first, to get joined_group / invited_by etc.
-            now = datetime.now()
-            today_str = now.strftime('%Y-%m-%d')
-            last_signin = user[1]           # last_signin
-            current_points = user[2]        # points
-            invited_by = user[6]            # invited_by (string or None)
-            joined_group_old = (user[7] or 0)  # joined_group old value (0/1)
-            last_bonus_date = user[10]      # last_bonus_date
-
-            # Check if already signed in (today)
-            if last_signin:
-                try:
-                    last_signin_date = datetime.strptime(last_signin, '%Y-%m-%d %H:%M:%S').date()
-                    if last_signin_date == now.date():
-                        lang = get_user_lang(telegram_id)
-                        msg = bot.reply_to(message, get_text('signin.already_signed', lang))
-                        threading.Timer(30, lambda: bot.delete_message(message.chat.id, msg.message_id)).start()
-                        return
-                except Exception as e:
-                    print(get_log_text('logs.error_parse_date', error=str(e)))
-
-            # Record this sign-in
-            update_user(telegram_id, 'last_signin', now.strftime('%Y-%m-%d %H:%M:%S'))
-            new_points = current_points + SIGNIN_POINTS
-            monthly_points_add = SIGNIN_POINTS
-
-            # Record sign-in history (by date)
-            record_signin_history(telegram_id, today_str)
+            result = process_signin(telegram_id)
+            lang = get_user_lang(telegram_id)
 
-            # Reward for 7 consecutive days within 7 days
-            bonus_text = ""
-            try:
-                if count_signins_last_7_days(telegram_id) >= 7:
-                    if (not last_bonus_date) or (datetime.strptime(last_bonus_date, "%Y-%m-%d") <= now - timedelta(days=7)):
-                        new_points += SIGNIN_BONUS_POINTS
-                        monthly_points_add += SIGNIN_BONUS_POINTS
-                        lang = get_user_lang(telegram_id)
-                        bonus_text = get_text('signin.bonus_reward', lang)
-                        update_user(telegram_id, 'last_bonus_date', today_str)
-            except Exception as e:
-                print(get_log_text('logs.error_calculate_bonus', error=str(e)))
+            if result['status'] == 'user_not_found':
+                print(get_log_text('logs.signin_user_not_found', user_id=telegram_id))
+                bot.reply_to(message, get_text('signin.error', lang, default="签到处理失败，请稍后重试"))
+                return
 
-            # Update points
-            update_user(telegram_id, 'points', new_points)
-            add_monthly_points(telegram_id, monthly_points_add)
+            if result['status'] == 'already_signed':
+                msg = droppable_reply(message, get_text('signin.already_signed', lang))
+                if msg:
+                    schedule_delete(message.chat.id, msg.message_id, 30, "Sign-in reply")
+                return
 
-            # —— Key logic: First "valid group join" (first group sign-in completion) sets flag and rewards inviter ——
-            # Only triggered when joined_group changes from 0 -> 1, ensuring reward is given only once
-            if joined_group_old == 0:
-                try:
-                    update_user(telegram_id, 'joined_group', 1)
-                    if invited_by:
-                        inviter_id = int(invited_by)
-                        inviter = get_user(inviter_id)
-                        if inviter:
-                            inviter_points = inviter[2] + INVITE_REWARD_POINTS
-                            update_user(inviter_id, 'points', inviter_points)
-                            add_monthly_points(inviter_id, INVITE_REWARD_POINTS)
-                            print(get_log_text('logs.invite_reward_success', inviter_id=inviter_id, invitee_id=telegram_id, points=INVITE_REWARD_POINTS))
-                except Exception as e:
-                    print(get_log_text('logs.invite_reward_failed', invitee_id=telegram_id, error=str(e)))
+            if result['inviter_id']:
+                print(get_log_text('logs.invite_reward_success', inviter_id=result['inviter_id'], invitee_id=telegram_id, points=INVITE_REWARD_POINTS))
 
             # Feedback message (auto cleanup)
-            lang = get_user_lang(telegram_id)
+            bonus_text = get_text('signin.bonus_reward', lang) if result['bonus'] else ""
             try:
-                msg = bot.reply_to(
+                msg = droppable_reply(
                     message,
-                    get_text('signin.success', lang, points=new_points) + (f"\n{bonus_text}" if bonus_text else "")
+                    get_text('signin.success', lang, points=result['total']) + (f"\n{bonus_text}" if bonus_text else "")
                 )
-                threading.Timer(30, lambda: bot.delete_message(message.chat.id, msg.message_id)).start()
-                print(get_log_text('logs.signin_success', user_id=message.from_user.id, points=monthly_points_add, total=new_points))
+                if msg:
+                    schedule_delete(message.chat.id, msg.message_id, 30, "Sign-in reply")
+                print(get_log_text('logs.signin_success', user_id=message.from_user.id, points=result['earned'], total=result['total']))
             except Exception as e:
                 print(get_log_text('logs.signin_error_send_failed', error=str(e)))
                 import traceback
@@ -2674,9 +4344,9 @@ def handle_custom_signin_word(message):
                 bot.reply_to(message, get_text('signin.error', lang, default="签到处理失败，请稍后重试"))
             except:
                 pass
-        else:
-            # Debug: Log when message doesn't match
-            print(get_log_text('logs.signin_debug_no_match', input=message.text, word=current_signin_word))
+    else:
+        # Debug: Log when message doesn't match
+        debug_log('logs.signin_debug_no_match', input=message.text, word=current_signin_word)
 
 
 def safe_delete(chat_id, msg_id, label=""):
@@ -2686,6 +4356,296 @@ def safe_delete(chat_id, msg_id, label=""):
         print(get_log_text('logs.error_delete_message', label=label, msg_id=msg_id, error=str(e)))
 
 
+# ===== Shared HTTP session =====
+# Outbound HTTP calls reuse pooled keep-alive connections instead of a new connection per request.
+HTTP_POOL_SIZE = config.get('HTTP_POOL_SIZE', 16)  # Keep-alive connections kept per host
+HTTP_TIMEOUT_SECONDS = config.get('HTTP_TIMEOUT_SECONDS', 5)  # Timeout for outbound API requests
+
+def new_http_session():
+    """requests session keeping up to HTTP_POOL_SIZE keep-alive connections per host"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+http_session = new_http_session()
+
+# ===== Outbound Telegram dispatcher =====
+# Every Telegram API call that sends, edits or deletes goes through one dispatcher (hooked in via
+# apihelper.CUSTOM_REQUEST_SENDER). It hands out send slots by priority lane while respecting a global token
+# bucket and one bucket per chat, waits out 429 retry_after automatically and coalesces queued edits of the same message.
+# The calling thread still performs its own HTTP request once it gets a slot, so callers keep their return values.
+# Handler threads only wait a bounded time for a slot: a reply that cannot be sent in time raises OutboundDropped,
+# and replies marked droppable (sign-in confirmations, keyword replies) give up almost at once when their group
+# is out of tokens. Broadcast and cosmetic lanes run on background threads and wait as long as it takes.
+OUTBOUND_GLOBAL_PER_SECOND = config.get('OUTBOUND_GLOBAL_PER_SECOND', 30)  # Telegram-wide send limit
+OUTBOUND_GROUP_PER_MINUTE = config.get('OUTBOUND_GROUP_PER_MINUTE', 20)  # Send limit per group
+OUTBOUND_PRIVATE_PER_SECOND = config.get('OUTBOUND_PRIVATE_PER_SECOND', 1)  # Send limit per private chat (short bursts of 3 allowed)
+OUTBOUND_MAX_RETRIES = config.get('OUTBOUND_MAX_RETRIES', 3)  # Retries of a request rejected with 429
+OUTBOUND_REPLY_WAIT_SECONDS = config.get('OUTBOUND_REPLY_WAIT_SECONDS', 10)  # Longest a handler waits for a reply slot
+OUTBOUND_DROPPABLE_WAIT_SECONDS = config.get('OUTBOUND_DROPPABLE_WAIT_SECONDS', 1)  # Longest a droppable reply waits
+OUTBOUND_BUCKET_SWEEP_SECONDS = 60  # How often per-chat buckets that are full again are forgotten
+
+OUTBOUND_LANE_REPLY = 0      # Direct answers to users
+OUTBOUND_LANE_BROADCAST = 1  # Scheduled broadcasts and bulk notifications
+OUTBOUND_LANE_COSMETIC = 2   # Animations and other edits that may lag or be merged
+
+# Methods that count against the per-chat limits; other throttled methods only use the global bucket
+_CHAT_LIMITED_PREFIXES = ('send', 'edit', 'copy', 'forward')
+_THROTTLED_PREFIXES = _CHAT_LIMITED_PREFIXES + ('delete', 'pin', 'unpin')
+_COALESCED_METHODS = {'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup'}
+
+_outbound_local = threading.local()
+
+class OutboundDropped(Exception):
+    """A Telegram call given up because its chat had no send slot in time"""
+
+@contextmanager
+def outbound_lane(lane):
+    """Send the Telegram calls made inside the block on the given priority lane"""
+    previous = getattr(_outbound_local, 'lane', OUTBOUND_LANE_REPLY)
+    _outbound_local.lane = lane
+    try:
+        yield
+    finally:
+        _outbound_local.lane = previous
+
+@contextmanager
+def outbound_droppable():
+    """Telegram calls made inside the block are low-value and dropped when their chat has no slot free"""
+    previous = getattr(_outbound_local, 'droppable', False)
+    _outbound_local.droppable = True
+    try:
+        yield
+    finally:
+        _outbound_local.droppable = previous
+
+def droppable_reply(message, text, **kwargs):
+    """bot.reply_to for low-value group replies; None if the reply was dropped"""
+    try:
+        with outbound_droppable():
+            return bot.reply_to(message, text, **kwargs)
+    except OutboundDropped:
+        return None
+
+def in_outbound_lane(lane, func, *args, **kwargs):
+    """Call func inside outbound_lane(lane); handy with async_runtime.run_blocking"""
+    with outbound_lane(lane):
+        return func(*args, **kwargs)
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'paused_until')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def wait_time(self, now):
+        """Seconds until a token is available (0 if one is available now)"""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def is_full(self, now):
+        """True if the bucket is back in the state of a new one, so it can be forgotten"""
+        return now >= self.paused_until and self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+class _OutboundRequest:
+    __slots__ = ('lane', 'method_name', 'chat_id', 'coalesce_key', 'granted', 'done', 'response', 'superseded_by')
+
+    def __init__(self, lane, method_name, chat_id, coalesce_key):
+        self.lane = lane
+        self.method_name = method_name
+        self.chat_id = chat_id
+        self.coalesce_key = coalesce_key
+        self.granted = threading.Event()
+        self.done = threading.Event()
+        self.response = None
+        self.superseded_by = None
+
+    def result(self):
+        request = self
+        while True:
+            request.done.wait()
+            if request.superseded_by is None:
+                return request.response
+            request = request.superseded_by
+
+class OutboundDispatcher:
+    def __init__(self, global_rate, group_per_minute, private_rate, max_retries):
+        self.group_per_minute = group_per_minute
+        self.private_rate = private_rate
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chat_buckets = {}
+        self._lanes = (deque(), deque(), deque())
+        self._queued_edits = {}  # {coalesce_key: request waiting in a lane}
+        self._cond = threading.Condition()
+        self._pid = None
+        self._next_sweep = 0.0
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._run, name='outbound-dispatcher', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            is_group = str(chat_id).startswith(('-', '@'))
+            if is_group:
+                bucket = TokenBucket(self.group_per_minute / 60.0, self.group_per_minute)
+            else:
+                bucket = TokenBucket(self.private_rate, max(1, self.private_rate * 3))
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def send(self, method, url, params=None, files=None, **kwargs):
+        """CUSTOM_REQUEST_SENDER hook: same signature and return value as requests.Session.request"""
+        method_name = url.rsplit('/', 1)[-1]
+        if not method_name.startswith(_THROTTLED_PREFIXES):
+            return http_session.request(method, url, params=params, files=files, **kwargs)
+
+        self._ensure_started()
+        chat_id = params.get('chat_id') if params else None
+        if chat_id is not None and not method_name.startswith(_CHAT_LIMITED_PREFIXES):
+            chat_id = None
+        coalesce_key = None
+        if method_name in _COALESCED_METHODS and params and params.get('message_id'):
+            coalesce_key = (method_name, params.get('chat_id'), params.get('message_id'))
+        request = _OutboundRequest(getattr(_outbound_local, 'lane', OUTBOUND_LANE_REPLY), method_name, chat_id, coalesce_key)
+        if getattr(_outbound_local, 'droppable', False):
+            timeout = OUTBOUND_DROPPABLE_WAIT_SECONDS
+        elif request.lane == OUTBOUND_LANE_REPLY:
+            timeout = OUTBOUND_REPLY_WAIT_SECONDS
+        else:
+            timeout = None
+
+        self._enqueue(request)
+        response = None
+        for attempt in range(self.max_retries + 1):
+            if not request.granted.wait(timeout) and self._withdraw(request):
+                print(get_log_text('logs.outbound_dropped', method=method_name, chat_id=params.get('chat_id'), seconds=timeout))
+                raise OutboundDropped(method_name)
+            if request.superseded_by is not None:
+                response = request.result()
+                if response is None:
+                    raise OutboundDropped(method_name)
+                return response
+            if files and attempt:
+                for value in files.values():
+                    stream = value[1] if isinstance(value, tuple) else value
+                    if hasattr(stream, 'seek'):
+                        stream.seek(0)
+            response = http_session.request(method, url, params=params, files=files, **kwargs)
+            retry_after = self._retry_after(response)
+            if retry_after is None or attempt == self.max_retries:
+                break
+            print(get_log_text('logs.outbound_rate_limited', method=method_name, chat_id=params.get('chat_id'), seconds=retry_after))
+            request.granted.clear()
+            self._enqueue(request, retry_after=retry_after)
+
+        request.response = response
+        request.done.set()
+        return response
+
+    @staticmethod
+    def _retry_after(response):
+        if response.status_code != 429:
+            return None
+        try:
+            return float(response.json().get('parameters', {}).get('retry_after', 1))
+        except Exception:
+            return 1.0
+
+    def _withdraw(self, request):
+        """Take a request that timed out off its lane; False if it was granted in the meantime"""
+        with self._cond:
+            if request.granted.is_set():
+                return False
+            lane = self._lanes[request.lane]
+            if request in lane:
+                lane.remove(request)
+            if request.coalesce_key and self._queued_edits.get(request.coalesce_key) is request:
+                del self._queued_edits[request.coalesce_key]
+            request.done.set()
+            return True
+
+    def _sweep(self, now):
+        """Forget per-chat buckets that have refilled; a new bucket starts in the same state"""
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items() if bucket.is_full(now)]:
+            del self._chat_buckets[chat_id]
+        self._next_sweep = now + OUTBOUND_BUCKET_SWEEP_SECONDS
+
+    def _enqueue(self, request, retry_after=None):
+        with self._cond:
+            lane = self._lanes[request.lane]
+            if retry_after is not None:
+                bucket = self._chat_bucket(request.chat_id) if request.chat_id is not None else self._global
+                bucket.paused_until = max(bucket.paused_until, time.monotonic() + retry_after)
+                lane.appendleft(request)
+            else:
+                previous = self._queued_edits.get(request.coalesce_key) if request.coalesce_key else None
+                if previous is not None and previous.lane == request.lane:
+                    # The newer edit replaces the queued one; its caller gets the newer edit's response
+                    lane[lane.index(previous)] = request
+                    previous.superseded_by = request
+                    previous.granted.set()
+                    previous.done.set()
+                else:
+                    lane.append(request)
+            if request.coalesce_key:
+                self._queued_edits[request.coalesce_key] = request
+            self._cond.notify()
+
+    def _run(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if now >= self._next_sweep:
+                    self._sweep(now)
+                wait = self._global.wait_time(now)
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                picked, next_wake = self._pick(now)
+                if picked is None:
+                    self._cond.wait(next_wake)
+                    continue
+                self._global.take()
+                if picked.chat_id is not None:
+                    self._chat_bucket(picked.chat_id).take()
+                if picked.coalesce_key and self._queued_edits.get(picked.coalesce_key) is picked:
+                    del self._queued_edits[picked.coalesce_key]
+                picked.granted.set()
+
+    def _pick(self, now):
+        """Highest-priority queued request whose chat can send now, or (None, seconds until one can)"""
+        next_wake = None
+        for lane in self._lanes:
+            for request in lane:
+                wait = self._chat_bucket(request.chat_id).wait_time(now) if request.chat_id is not None else 0.0
+                if wait <= 0:
+                    lane.remove(request)
+                    return request, None
+                next_wake = wait if next_wake is None else min(next_wake, wait)
+        return None, next_wake
+
+outbound = OutboundDispatcher(OUTBOUND_GLOBAL_PER_SECOND, OUTBOUND_GROUP_PER_MINUTE, OUTBOUND_PRIVATE_PER_SECOND, OUTBOUND_MAX_RETRIES)
+telebot.apihelper.CUSTOM_REQUEST_SENDER = outbound.send
 
 def load_rss_sources(file_path='rss_sources.json', lang=None):
     """
@@ -2730,47 +4690,132 @@ def load_rss_sources(file_path='rss_sources.json', lang=None):
         print(get_log_text('logs.rss_failed_load_config', error=str(e)))
         return []
 
-def fetch_rss_news():
-    if not NEWS_ENABLED:
-        print(get_log_text('logs.scheduled_task_news_disabled'))
-        return
-    print(get_log_text('logs.scheduled_task_executing_news', datetime=datetime.now()))
-    
-    # Use default language to load RSS sources
+# ===== RSS ingestion =====
+# Feeds are pre-fetched on a rolling schedule into rss_entries; the daily broadcast only reads pending rows.
+RSS_PREFETCH_INTERVAL_MINUTES = config.get('RSS_PREFETCH_INTERVAL_MINUTES', 30)  # How often feeds are polled for new entries
+RSS_FETCH_WORKERS = config.get('RSS_FETCH_WORKERS', 8)  # Feeds fetched in parallel
+RSS_FEED_TIMEOUT_SECONDS = config.get('RSS_FEED_TIMEOUT_SECONDS', 10)  # Timeout for a single feed request
+RSS_MAX_AGE_HOURS = config.get('RSS_MAX_AGE_HOURS', 24)  # Pending entries older than this are no longer broadcast
+RSS_RETENTION_DAYS = config.get('RSS_RETENTION_DAYS', 90)  # How long seen entries are remembered for de-duplication
+RSS_ENTRIES_PER_FEED = 5
+RSS_ENTRIES_PER_BROADCAST = 8
+
+def _fetch_feed(url, etag=None, last_modified=None):
+    """
+    Conditional GET of one feed
+    :return: (entries, etag, last_modified); entries is None when the feed is unchanged (304)
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    response = http_session.get(url, headers=headers, timeout=RSS_FEED_TIMEOUT_SECONDS)
+    if response.status_code == 304:
+        return None, etag, last_modified
+    response.raise_for_status()
+    feed = feedparser.parse(response.content)
+    return feed.entries, response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+def prefetch_rss_entries():
+    """Fetch all configured feeds in parallel and store entries not seen before; returns the number of new entries"""
     feeds = load_rss_sources(lang=DEFAULT_LANGUAGE)
     if not feeds:
         print(get_log_text('logs.scheduled_task_rss_empty'))
-        return
-    news_items = []
+        return 0
 
-    for feed_url in feeds:
-        try:
-            feed = feedparser.parse(feed_url)
+    with db_cursor() as cursor:
+        cursor.execute('SELECT url, etag, last_modified FROM rss_feed_state')
+        state = {url: (etag, last_modified) for url, etag, last_modified in cursor.fetchall()}
 
-            if not feed.entries or not all(hasattr(entry, 'title') and hasattr(entry, 'link') for entry in feed.entries):
-                print(get_log_text('logs.rss_source_invalid', url=feed_url))
+    def fetch(url):
+        try:
+            return url, _fetch_feed(url, *state.get(url, (None, None)))
+        except Exception as e:
+            print(get_log_text('logs.rss_fetch_failed', url=url, error=str(e)))
+            return url, None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(RSS_FETCH_WORKERS, len(feeds)))) as pool:
+        results = list(pool.map(fetch, feeds))
+
+    now = datetime.now()
+    now_str = now.strftime('%Y-%m-%d %H:%M:%S')
+    new_entries = 0
+    with db_cursor(immediate=True) as cursor:
+        for url, result in results:
+            if result is None:
+                continue
+            entries, etag, last_modified = result
+            cursor.execute('''
+                INSERT INTO rss_feed_state (url, etag, last_modified, last_fetched)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    last_fetched = excluded.last_fetched
+            ''', (url, etag, last_modified, now_str))
+            if entries is None:
+                continue  # Not modified since the last fetch
+
+            if not entries or not all(hasattr(entry, 'title') and hasattr(entry, 'link') for entry in entries):
+                print(get_log_text('logs.rss_source_invalid', url=url))
                 continue
 
-            for entry in feed.entries[:5]:
-                title = entry.title
-                link = entry.link
-                # Use title directly without translation
-                news_items.append(f"• [{title}]({link})")
+            for entry in entries[:RSS_ENTRIES_PER_FEED]:
+                # An entry counts as seen if either its id or its link was stored before
+                cursor.execute('''
+                    INSERT OR IGNORE INTO rss_entries (entry_key, feed_url, title, link, fetched_at)
+                    SELECT ?, ?, ?, ?, ?
+                    WHERE NOT EXISTS (SELECT 1 FROM rss_entries WHERE link = ?)
+                ''', (entry.get('id') or entry.link, url, entry.title, entry.link, now_str, entry.link))
+                new_entries += cursor.rowcount
+
+        cutoff = (now - timedelta(days=RSS_RETENTION_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+        cursor.execute('DELETE FROM rss_entries WHERE fetched_at < ?', (cutoff,))
+
+    print(get_log_text('logs.rss_prefetch_done', feeds=len(feeds), new=new_entries))
+    return new_entries
+
+def get_pending_rss_entries(limit=RSS_ENTRIES_PER_BROADCAST):
+    """Entries fetched recently that have not been broadcast yet, oldest first"""
+    cutoff = (datetime.now() - timedelta(hours=RSS_MAX_AGE_HOURS)).strftime('%Y-%m-%d %H:%M:%S')
+    with db_cursor() as cursor:
+        cursor.execute('''
+            SELECT id, title, link FROM rss_entries
+            WHERE broadcast_at IS NULL AND fetched_at >= ?
+            ORDER BY id
+            LIMIT ?
+        ''', (cutoff, limit))
+        return cursor.fetchall()
 
-        except Exception as e:
-            print(get_log_text('logs.rss_fetch_failed', url=feed_url, error=str(e)))
-            continue
+def fetch_rss_news():
+    if not NEWS_ENABLED:
+        print(get_log_text('logs.scheduled_task_news_disabled'))
+        return
+    print(get_log_text('logs.scheduled_task_executing_news', datetime=datetime.now()))
 
-    news_items = news_items[:8]
+    entries = get_pending_rss_entries()
+    if not entries:
+        # Nothing prepared yet (e.g. right after startup), fetch now
+        prefetch_rss_entries()
+        entries = get_pending_rss_entries()
 
-    if news_items:
+    if entries:
+        news_items = [f"• [{title}]({link})" for _, title, link in entries]
         # Use multilingual text for news title
         news_title = get_text('rss_news.daily_title', DEFAULT_LANGUAGE, default='📰 *Daily Crypto News Selection:*')
         message = f"{news_title}\n\n" + "\n".join(news_items)
         try:
-            bot.send_message(ALLOWED_GROUP_ID, message, parse_mode='Markdown', disable_web_page_preview=True)
+            with outbound_lane(OUTBOUND_LANE_BROADCAST):
+                bot.send_message(ALLOWED_GROUP_ID, message, parse_mode='Markdown', disable_web_page_preview=True)
         except Exception as e:
             print(get_log_text('logs.rss_send_failed', error=str(e)))
+            return
+        with db_cursor() as cursor:
+            cursor.executemany(
+                'UPDATE rss_entries SET broadcast_at = ? WHERE id = ?',
+                [(datetime.now().strftime('%Y-%m-%d %H:%M:%S'), entry_id) for entry_id, _, _ in entries]
+            )
     else:
         print(get_log_text('logs.rss_unable_fetch'))
 
@@ -2783,22 +4828,123 @@ def load_watchlist():
     except:
         return ["BTCUSDT"]
 
+# ===== Price service =====
+# Prices are cached per symbol for a few seconds; concurrent requests for the same symbol share one upstream call.
+PRICE_CACHE_TTL_SECONDS = config.get('PRICE_CACHE_TTL_SECONDS', 5)  # How long a fetched price (or failure) is reused
+PRICE_FETCH_WORKERS = config.get('PRICE_FETCH_WORKERS', 8)  # Parallel requests when the batch endpoint cannot be used
+PRICE_CACHE_MAX_ENTRIES = config.get('PRICE_CACHE_MAX_ENTRIES', 1000)  # Symbols kept in the price cache (memory ceiling)
+
+# {symbol: (fetched_at, price or None, error or None)}, oldest fetch first; expired entries are dropped whenever
+# new ones are stored, so symbols looked up once (including invalid ones) do not stay around
+_price_entries = OrderedDict()
+_price_inflight = {}  # {symbol: threading.Event} set when the in-progress fetch finishes
+_price_lock = threading.Lock()
+
+def _request_price(symbol):
+    response = http_session.get(PRICE_API_BASE_URL, params={'symbol': symbol}, timeout=HTTP_TIMEOUT_SECONDS)
+    data = response.json()
+    return float(data['price']) if 'price' in data else None
+
+def _request_prices_batch(symbols):
+    """One request for several symbols via the symbols=[...] form of the ticker endpoint"""
+    response = http_session.get(
+        PRICE_API_BASE_URL,
+        params={'symbols': json.dumps(symbols, separators=(',', ':'))},
+        timeout=HTTP_TIMEOUT_SECONDS
+    )
+    data = response.json()
+    if not isinstance(data, list):
+        raise ValueError(data)
+    prices = {item['symbol']: float(item['price']) for item in data if 'price' in item}
+    return {symbol: prices.get(symbol) for symbol in symbols}
+
+def _fetch_price_entries(symbols):
+    """
+    Fetch symbols upstream, returning {symbol: (price, error)}
+    Tries the batch endpoint first and falls back to parallel single-symbol requests,
+    e.g. when the API rejects the whole batch because one symbol is invalid.
+    """
+    if len(symbols) > 1:
+        try:
+            return {symbol: (price, None) for symbol, price in _request_prices_batch(symbols).items()}
+        except Exception as e:
+            print(get_log_text('logs.price_batch_failed', count=len(symbols), error=str(e)))
+
+    def fetch_one(symbol):
+        try:
+            return symbol, (_request_price(symbol), None)
+        except Exception as e:
+            print(get_log_text('logs.error_get_price', symbol=symbol, error=str(e)))
+            return symbol, (None, str(e))
+
+    if len(symbols) == 1:
+        return dict([fetch_one(symbols[0])])
+    with ThreadPoolExecutor(max_workers=min(PRICE_FETCH_WORKERS, len(symbols))) as pool:
+        return dict(pool.map(fetch_one, symbols))
+
+def _prune_price_entries(now):
+    """Drop expired entries and, beyond PRICE_CACHE_MAX_ENTRIES, the oldest ones (caller holds _price_lock)"""
+    while _price_entries:
+        fetched_at = next(iter(_price_entries.values()))[0]
+        if len(_price_entries) <= PRICE_CACHE_MAX_ENTRIES and now - fetched_at < PRICE_CACHE_TTL_SECONDS:
+            break
+        _price_entries.popitem(last=False)
+
+def get_price_quotes(symbols):
+    """
+    Return {symbol: (price or None, error or None)} for the given symbols
+    Fresh cache entries are served directly, symbols already being fetched by another
+    thread are waited on, and the remaining ones are fetched together.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    now = time.monotonic()
+    quotes, to_fetch, to_wait = {}, [], []
+    with _price_lock:
+        for symbol in symbols:
+            entry = _price_entries.get(symbol)
+            if entry and now - entry[0] < PRICE_CACHE_TTL_SECONDS:
+                quotes[symbol] = entry[1:]
+            elif symbol in _price_inflight:
+                to_wait.append((symbol, _price_inflight[symbol]))
+            else:
+                _price_inflight[symbol] = threading.Event()
+                to_fetch.append(symbol)
+
+    if to_fetch:
+        fetched = {}
+        try:
+            fetched = _fetch_price_entries(to_fetch)
+        finally:
+            with _price_lock:
+                fetched_at = time.monotonic()
+                for symbol in to_fetch:
+                    price, error = fetched.get(symbol, (None, 'price fetch aborted'))
+                    _price_entries.pop(symbol, None)
+                    _price_entries[symbol] = (fetched_at, price, error)
+                    quotes[symbol] = (price, error)
+                    _price_inflight.pop(symbol).set()
+                _prune_price_entries(fetched_at)
+
+    for symbol, event in to_wait:
+        event.wait(HTTP_TIMEOUT_SECONDS * 2)
+        entry = _price_entries.get(symbol)
+        quotes[symbol] = entry[1:] if entry else (None, 'price fetch timed out')
+    return quotes
+
+def fetch_prices(symbols):
+    """Return {symbol: price or None}; failures are logged, not raised"""
+    return {symbol: price for symbol, (price, _) in get_price_quotes(symbols).items()}
+
 def fetch_price(symbol):
-    url = f"{PRICE_API_BASE_URL}?symbol={symbol}"
-    try:
-        response = requests.get(url, timeout=5)
-        data = response.json()
-        return float(data['price']) if 'price' in data else None
-    except Exception as e:
-        print(get_log_text('logs.error_get_price', symbol=symbol, error=str(e)))
-        return None
+    return fetch_prices([symbol])[symbol]
 
 def update_daily_open_prices():
     global price_cache
     watchlist = load_watchlist()
     print(get_log_text('logs.scheduled_task_update_prices', datetime=datetime.now()))
+    prices = fetch_prices(watchlist)
     for symbol in watchlist:
-        price = fetch_price(symbol)
+        price = prices.get(symbol)
         if price:
             price_cache[symbol] = price
             print(get_log_text('logs.price_open_price', symbol=symbol, price=price))
@@ -2819,8 +4965,9 @@ def broadcast_price_changes():
     watchlist = load_watchlist()
     messages = []
     print(get_log_text('logs.scheduled_task_broadcast_prices', datetime=datetime.now()))
+    prices = fetch_prices(watchlist)
     for symbol in watchlist:
-        current_price = fetch_price(symbol)
+        current_price = prices.get(symbol)
         if not current_price:
             continue
         open_price = price_cache.get(symbol)
@@ -2841,7 +4988,8 @@ def broadcast_price_changes():
         full_msg = "\n".join(messages)
         full_msg += "\n\n" + get_text('price.broadcast_hint', lang)
         try:
-            bot.send_message(ALLOWED_GROUP_ID, full_msg)
+            with outbound_lane(OUTBOUND_LANE_BROADCAST):
+                bot.send_message(ALLOWED_GROUP_ID, full_msg)
         except Exception as e:
             print(get_log_text('logs.price_broadcast_failed', error=str(e)))
 
@@ -2907,8 +5055,8 @@ def _format_user_display(tid):
 
     lang = DEFAULT_LANGUAGE  # Use default language for user display
     if user:
-        name = user[8] or get_text('common.unknown', lang)
-        custom = user[9] or ""
+        name = user.name or get_text('common.unknown', lang)
+        custom = user.custom_id or ""
         if custom:
             return f"{name} (@{custom} | ID:{tid})"
         else:
@@ -2916,7 +5064,7 @@ def _format_user_display(tid):
     else:
         return f"ID:{tid}"
 
-def _animate_and_pick(chat_id, orig_msg_id, candidates, winner, rounds=30, speed_base=0.05):
+async def _animate_and_pick(chat_id, orig_msg_id, candidates, winner, rounds=30, speed_base=0.05):
     """
     Highlight items in candidates list one by one, finally stop at winner.
     rounds: base steps (larger = longer animation); speed_base: minimum delay (seconds).
@@ -2934,29 +5082,34 @@ def _animate_and_pick(chat_id, orig_msg_id, candidates, winner, rounds=30, speed
         extra = (target_index - (start_idx + total_steps) % n) % n
         total_steps = total_steps + extra
 
+        # Animation frames are not awaited: frames the chat has no slot for yet are merged by the outbound
+        # dispatcher, so only the latest one is sent
+        frames = []
         for step in range(total_steps + 1):
             cur_idx = (start_idx + step) % n
             display = _window_display(candidates, cur_idx, window_size=9)
             footer = "\n\n" + get_text('admin.draw.in_progress', lang)
-            try:
-                bot.edit_message_text(chat_id=chat_id,
-                                      message_id=orig_msg_id,
-                                      text=display + footer,
-                                      parse_mode='Markdown')
-            except Exception:
-                # Edit may fail due to rate limit or message deleted, ignore and continue
-                pass
+            frames.append(asyncio.ensure_future(async_runtime.run_blocking(
+                in_outbound_lane, OUTBOUND_LANE_COSMETIC, bot.edit_message_text,
+                chat_id=chat_id,
+                message_id=orig_msg_id,
+                text=display + footer,
+                parse_mode='Markdown')))
 
             # Delay gradually increases -> simulate deceleration
             t = speed_base * (1 + (step / (total_steps if total_steps else 1)) * 5.0)
-            time.sleep(t)
+            await asyncio.sleep(t)
 
         # Final stop: format winner display with database info
         final_display = _window_display(candidates, candidates.index(winner), window_size=9)
-        winner_label = _format_user_display(winner)
+        winner_label = await async_runtime.run_db(_format_user_display, winner)
         final_text = final_display + "\n\n" + get_text('admin.draw.selected', lang, winner=winner_label)
+        # Let pending frames land first so none of them overwrites the result; edits may fail due to rate limit
+        # or message deleted, which is ignored
+        await asyncio.gather(*frames, return_exceptions=True)
         try:
-            bot.edit_message_text(chat_id=chat_id, message_id=orig_msg_id, text=final_text, parse_mode='Markdown')
+            await async_runtime.run_blocking(in_outbound_lane, OUTBOUND_LANE_BROADCAST, bot.edit_message_text,
+                                             chat_id=chat_id, message_id=orig_msg_id, text=final_text, parse_mode='Markdown')
         except Exception:
             pass
 
@@ -2979,40 +5132,31 @@ def export_month_rank_csv(message):
         return
 
     month_str = args[1]
-    conn = sqlite3.connect('telegram_bot.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT u.telegram_id, u.name, u.custom_id, m.earned
-        FROM monthly_points m
-        JOIN users u ON u.telegram_id = m.telegram_id
-        WHERE m.month = ?
-        ORDER BY m.earned DESC
-    ''', (month_str,))
-    rows = cursor.fetchall()
-    conn.close()
-
-    if not rows:
-        bot.reply_to(message, get_text('admin.export.empty_month', lang, month=month_str))
-        return
-
-    # Write CSV
-    string_io = StringIO()
-    writer = csv.writer(string_io)
-    writer.writerow([f"{month_str} Ranking"])
-    writer.writerow(["Rank", "Telegram ID", "Name", "Custom ID", "Points"])
-    for idx, (tid, name, custom_id, earned) in enumerate(rows, 1):
-        writer.writerow([idx, tid, name or get_text('common.unknown', lang), custom_id or "", earned])
-
-    byte_io = BytesIO(string_io.getvalue().encode('utf-8-sig'))
-    byte_io.seek(0)
-    file_name = f"monthly_rank_{month_str}.csv"
-    bot.send_document(
-        message.chat.id,
-        byte_io,
-        visible_file_name=file_name,
-        caption=get_text('admin.export.export_success_month', lang, month=month_str)
+    unknown = get_text('common.unknown', lang)
+
+    def build():
+        ranked = points_leaderboard.ranked(month_str, include_admins=True)
+
+        def chunks():
+            # Like the former JOIN users: scores without a users row are left out and not counted as a rank
+            rank = 0
+            for i in range(0, len(ranked), EXPORT_FETCH_SIZE):
+                chunk = ranked[i:i + EXPORT_FETCH_SIZE]
+                users = get_user_columns([tid for tid, _ in chunk], 'name, custom_id')
+                rows = []
+                for tid, earned in chunk:
+                    if tid in users:
+                        rank += 1
+                        name, custom_id = users[tid]
+                        rows.append([rank, tid, name or unknown, custom_id or "", earned])
+                yield rows
+
+        return write_csv_export(chunks(), [[f"{month_str} Ranking"], ["Rank", "Telegram ID", "Name", "Custom ID", "Points"]], bom=True)
+    submit_export(
+        message, lang, build, f"monthly_rank_{month_str}.csv",
+        get_text('admin.export.export_success_month', lang, month=month_str),
+        empty_text=get_text('admin.export.empty_month', lang, month=month_str)
     )
-    byte_io.close()
 
 
 @bot.message_handler(commands=['draw'])
@@ -3050,20 +5194,20 @@ def cmd_draw(message):
     draw_count = min(count, len(uniq_ids))
     winners = random.sample(uniq_ids, draw_count)
 
-    # Send placeholder message first, then use thread to play animation and announce final summary
+    # Send placeholder message first, then play the animation on the async runtime and announce final summary
     try:
         sent = bot.send_message(message.chat.id, get_text('admin.draw.start', lang))
     except Exception as e:
         bot.reply_to(message, get_text('admin.draw.error', lang, error=str(e)))
         return
 
-    def worker():
+    async def worker():
         candidates = uniq_ids[:]  # Copy candidate list
         selected = []
         for w in winners:
-            _animate_and_pick(message.chat.id, sent.message_id, candidates, w, rounds=28, speed_base=0.04)
+            await _animate_and_pick(message.chat.id, sent.message_id, candidates, w, rounds=28, speed_base=0.04)
             selected.append(w)
-            time.sleep(0.8)
+            await asyncio.sleep(0.8)
             # Remove from candidates after selection to avoid duplicate selection (comment next line if you want to allow duplicates)
             try:
                 candidates.remove(w)
@@ -3073,19 +5217,19 @@ def cmd_draw(message):
         # Final summary and send in current session: print name + custom_id from DB
         summary = get_text('admin.draw.end', lang)
         for i, s in enumerate(selected, 1):
-            summary += f"{i}. {_format_user_display(s)}\n"
+            summary += f"{i}. {await async_runtime.run_db(_format_user_display, s)}\n"
 
         if count > len(uniq_ids):
             summary += get_text('admin.draw.note', lang, requested=count, available=len(uniq_ids))
 
         try:
-            bot.send_message(message.chat.id, summary)
+            await async_runtime.run_blocking(in_outbound_lane, OUTBOUND_LANE_BROADCAST, bot.send_message, message.chat.id, summary)
         except Exception:
             # Fallback: if sending fails, send simple ID list
             fallback = "Draw ended, selected IDs:\n" + "\n".join(str(x) for x in selected)
-            bot.send_message(message.chat.id, fallback)
+            await async_runtime.run_blocking(in_outbound_lane, OUTBOUND_LANE_BROADCAST, bot.send_message, message.chat.id, fallback)
 
-    threading.Thread(target=worker, daemon=True).start()
+    async_runtime.submit(worker())
 
 # ===== /recent_points View recent points records (private chat) =====
 @bot.message_handler(commands=['recent_points'])
@@ -3109,37 +5253,33 @@ def handle_recent_points(message):
         limit = 10
 
     try:
-        conn = sqlite3.connect('telegram_bot.db')
-        cur = conn.cursor()
-
-        # Recent records (sorted by time descending)
-        cur.execute('''
-            SELECT amount, COALESCE(reason, ''), created_at
-            FROM points_log
-            WHERE telegram_id = ?
-            ORDER BY id DESC
-            LIMIT ?
-        ''', (telegram_id, limit))
-        rows = cur.fetchall()
-
-        # Statistics for last 7/30 days total
-        cur.execute('''
-            SELECT COALESCE(SUM(amount),0)
-            FROM points_log
-            WHERE telegram_id = ?
-              AND datetime(created_at) >= datetime('now','-7 days')
-        ''', (telegram_id,))
-        last7 = cur.fetchone()[0] or 0
-
-        cur.execute('''
-            SELECT COALESCE(SUM(amount),0)
-            FROM points_log
-            WHERE telegram_id = ?
-              AND datetime(created_at) >= datetime('now','-30 days')
-        ''', (telegram_id,))
-        last30 = cur.fetchone()[0] or 0
-
-        conn.close()
+        with db_cursor() as cur:
+            # Recent records (sorted by time descending)
+            cur.execute('''
+                SELECT amount, COALESCE(reason, ''), created_at
+                FROM points_log
+                WHERE telegram_id = ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (telegram_id, limit))
+            rows = cur.fetchall()
+
+            # Statistics for last 7/30 days total
+            cur.execute('''
+                SELECT COALESCE(SUM(amount),0)
+                FROM points_log
+                WHERE telegram_id = ?
+                  AND datetime(created_at) >= datetime('now','-7 days')
+            ''', (telegram_id,))
+            last7 = cur.fetchone()[0] or 0
+
+            cur.execute('''
+                SELECT COALESCE(SUM(amount),0)
+                FROM points_log
+                WHERE telegram_id = ?
+                  AND datetime(created_at) >= datetime('now','-30 days')
+            ''', (telegram_id,))
+            last30 = cur.fetchone()[0] or 0
 
         if not rows:
             bot.reply_to(message, get_text('recent_points.empty', lang))
@@ -3162,9 +5302,494 @@ def handle_recent_points(message):
         bot.reply_to(message, get_text('recent_points.error', lang, error=str(e)))
 
 
+# ===== Ordered update dispatch =====
+# Handlers run on DISPATCH_LANES worker threads. Each update is routed to a lane by user (or chat, for updates without
+# a user), so one user's updates are handled strictly in order while different users are handled in parallel.
+# The pool replaces pyTelegramBotAPI's shared worker pool, so polling and webhook mode both go through it.
+DISPATCH_LANES = config.get('DISPATCH_LANES', 8)  # Handler threads; a user's updates always run on the same one
+
+def update_lane_key(update):
+    """User id an update belongs to (chat id if it has no user), None if neither is known"""
+    user = getattr(update, 'from_user', None) or getattr(update, 'user', None)
+    if user is not None:
+        return user.id
+    chat = getattr(update, 'chat', None)
+    if chat is not None:
+        return chat.id
+    return None
+
+class OrderedWorkerPool:
+    """
+    Worker pool with the interface TeleBot expects (put, raise_exceptions, clear_exceptions, close):
+    one queue and one thread per lane. Threads are started per process (checked by pid).
+    """
+    def __init__(self, telebot_instance, lanes):
+        self.telebot = telebot_instance
+        self.exception_event = threading.Event()
+        self.exception_info = None
+        self._lanes = [queue.Queue() for _ in range(lanes)]
+        self._threads = []
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._threads = [threading.Thread(target=self._run, args=(lane,), name=f'update-lane-{i}', daemon=True)
+                             for i, lane in enumerate(self._lanes)]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def put(self, func, *args, **kwargs):
+        self._ensure_started()
+        key = update_lane_key(args[0]) if args else None
+        index = key % len(self._lanes) if key is not None else random.randrange(len(self._lanes))
+        self._lanes[index].put((func, args, kwargs))
+
+    def _run(self, lane):
+        while True:
+            task = lane.get()
+            if task is None:
+                return
+            func, args, kwargs = task
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                self._on_exception(e)
+
+    def _on_exception(self, exception):
+        # Same contract as telebot's ThreadPool: the exception handler, else re-raised by the polling loop
+        handled = self.telebot.exception_handler.handle(exception) if self.telebot.exception_handler is not None else False
+        if not handled:
+            self.exception_info = exception
+            self.exception_event.set()
+
+    def raise_exceptions(self):
+        if self.exception_event.is_set():
+            raise self.exception_info
+
+    def clear_exceptions(self):
+        self.exception_info = None
+        self.exception_event.clear()
+
+    def close(self):
+        """Stop the lane threads once they have run everything queued so far"""
+        for lane in self._lanes:
+            lane.put(None)
+        if self._pid == os.getpid():
+            for thread in self._threads:
+                if thread is not threading.current_thread():
+                    thread.join()
+
+bot.worker_pool.close()
+bot.worker_pool = OrderedWorkerPool(bot, DISPATCH_LANES)
+
+# ===== Worker processes =====
+# With WORKER_PROCESSES > 1 group messages (handle_custom_signin_word, the hot path) are handled by forked worker
+# processes, so keyword matching, JSON and formatting use more than one core. This process stays the supervisor:
+# it receives all updates, runs every other handler and all scheduled jobs, and routes group messages by a
+# consistent hash of the sender's telegram_id, so a user always lands on the same worker.
+# Each worker has its own database connection, user cache, chat points journal and outbound rate budget. Changes the
+# supervisor keeps in memory (leaderboard scores, delayed deletes, name changes) are sent back to it as events.
+# /me is routed the same way, since only the user's worker knows their chat points that are not written yet.
+# Workers are not forked from the supervisor but from a spawner process, which is forked here, before the bot starts
+# any thread. fork() copies only the calling thread, so a child of a process with other threads running can inherit a
+# lock one of them held (SQLite, stdout, cache locks) and hang on it. The spawner never starts a thread, so every
+# worker it forks, at startup or to replace a dead one, is a clean copy. Each worker gets two pipes of its own, one
+# for messages and one for events; the supervisor hands their ends to the spawner with the fork request.
+WORKER_PROCESSES = config.get('WORKER_PROCESSES', 1)  # Processes handling group messages (1: everything in this process)
+WORKER_HASH_REPLICAS = 64  # Points per worker on the hash ring
+WORKER_POLL_SECONDS = 5  # Longest a message waits for a dead worker's replacement; least time between restarts of one worker
+
+class ConsistentHashRing:
+    """Maps keys to nodes; adding or removing a node only moves the keys that belong to it"""
+    def __init__(self, nodes, replicas=WORKER_HASH_REPLICAS):
+        points = sorted((self._hash(f'{node}:{i}'), node) for node in nodes for i in range(replicas))
+        self._hashes = [h for h, _ in points]
+        self._nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+
+    def node_for(self, key):
+        return self._nodes[bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)]
+
+def worker_journal_path(index):
+    """Chat points journal of worker index, e.g. chat_points.worker0.journal"""
+    root, ext = os.path.splitext(CHAT_POINTS_JOURNAL_FILE)
+    return f'{root}.worker{index}{ext}'
+
+def recover_worker_journals(active):
+    """Replay journals of workers that no longer exist (index >= active), e.g. after WORKER_PROCESSES was lowered"""
+    root, ext = os.path.splitext(CHAT_POINTS_JOURNAL_FILE)
+    pattern = re.compile(re.escape(root) + r'\.worker(\d+)' + re.escape(ext) + r'(\.\d+)?')  # Live or rotated journal
+    stale = set()
+    for path in glob.glob(glob.escape(root) + '.worker*'):
+        match = pattern.fullmatch(path)
+        if match and int(match.group(1)) >= active:
+            stale.add(int(match.group(1)))
+    for index in sorted(stale):
+        ChatPointsAccrual(worker_journal_path(index), name=f'chat_points.worker{index}').recover()
+
+class _SupervisorProxy:
+    """
+    Stand-in for a supervisor-owned object in a worker process: calls are sent to the supervisor and run there
+    Works for method calls (proxy.add(...)) and for plain functions (proxy(...)); return values are not passed back.
+    """
+    def __init__(self, events, index, target):
+        self._events = events
+        self._index = index
+        self._target = target
+
+    def __getattr__(self, method):
+        return functools.partial(self._call, method)
+
+    def __call__(self, *args):
+        self._call(None, *args)
+
+    def _call(self, method, *args):
+        self._events.put((self._target, method, args))
+
+class _EventPipe:
+    """Sending end of a worker's event pipe, shared by the worker's threads"""
+    def __init__(self, connection):
+        self._connection = connection
+        self._lock = threading.Lock()
+
+    def put(self, event):
+        with self._lock:
+            self._connection.send(event)
+
+# Supervisor objects workers may call through _SupervisorProxy
+WORKER_PROXIED = ('points_leaderboard', 'activity_leaderboard', 'delayed_actions', 'note_user_name_changed')
+
+def _init_worker_process(index, count, events):
+    """Replace state inherited from the supervisor with this worker's own (runs in the forked child)"""
+    global user_cache, chat_points, chat_points_limiter, _activity_buffer, _activity_lock
+    global http_session, outbound, points_leaderboard, activity_leaderboard, delayed_actions, note_user_name_changed
+    user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+    user_cache_listeners[:] = [lambda telegram_ids: events.put(('user_cache', 'invalidate', (telegram_ids,)))]
+    chat_points_limiter = RateLimiter(1, CHAT_POINTS_INTERVAL_SECONDS)
+    _activity_buffer = defaultdict(int)
+    _activity_lock = threading.Lock()
+    chat_points = ChatPointsAccrual(worker_journal_path(index), name=f'chat_points.worker{index}')
+
+    # Pooled connections are shared with the parent after fork; Telegram limits are shared out among the workers
+    http_session = new_http_session()
+    outbound = OutboundDispatcher(OUTBOUND_GLOBAL_PER_SECOND / count, OUTBOUND_GROUP_PER_MINUTE / count,
+                                  OUTBOUND_PRIVATE_PER_SECOND, OUTBOUND_MAX_RETRIES)
+    telebot.apihelper.CUSTOM_REQUEST_SENDER = outbound.send
+    bot.worker_pool = OrderedWorkerPool(bot, DISPATCH_LANES)
+
+    points_leaderboard = _SupervisorProxy(events, index, 'points_leaderboard')
+    activity_leaderboard = _SupervisorProxy(events, index, 'activity_leaderboard')
+    delayed_actions = _SupervisorProxy(events, index, 'delayed_actions')
+    note_user_name_changed = _SupervisorProxy(events, index, 'note_user_name_changed')
+    # After the proxies: replayed points must reach the supervisor's leaderboard
+    chat_points.recover()
+
+def _read_signin_word(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read().strip()
+
+def _worker_main(index, count, tasks, events):
+    """Worker process: handle the messages routed here (tasks pipe) until told to stop, reporting on the events pipe"""
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())  # Finish the message at hand, flush, exit
+    _init_worker_process(index, count, _EventPipe(events))
+    # The supervisor picks the sign-in word and saves it to TEMP_SIGNIN_FILE; workers follow the file
+    signin_word_file = CachedFile(TEMP_SIGNIN_FILE, _read_signin_word, "")
+
+    # Only upkeep of this worker's own state runs here; all other scheduled jobs run in the supervisor
+    jobs = schedule.Scheduler()
+    jobs.every(ACTIVITY_FLUSH_INTERVAL_SECONDS).seconds.do(flush_activity_counts)
+    jobs.every(CHAT_POINTS_FLUSH_INTERVAL_SECONDS).seconds.do(chat_points.flush)
+    jobs.every(LOCALES_RELOAD_SECONDS).seconds.do(load_locales)
+
+    def run_jobs():
+        while True:
+            jobs.run_pending()
+            time.sleep(1)
+    threading.Thread(target=run_jobs, name='worker-flush', daemon=True).start()
+
+    def receive():
+        """Next task; None when the supervisor said stop or is gone"""
+        try:
+            return tasks.recv()
+        except EOFError:
+            return None
+
+    def run(task):
+        global current_signin_word
+        kind, payload = task
+        if kind == 'message':
+            current_signin_word = signin_word_file.get()
+            # The spawner was forked before the router was installed, so this is the bot's own dispatch
+            bot.process_new_messages([telebot.types.Message.de_json(payload)])
+        elif kind == 'invalidate':
+            user_cache.invalidate(payload)
+
+    try:
+        # Only read once a task is waiting, so SIGTERM never interrupts a read halfway
+        while not stopping.is_set():
+            if tasks.poll(1):
+                task = receive()
+                if task is None:
+                    return
+                run(task)
+        # Terminated: handle what was already sent, then close the pipe so the supervisor resends to the replacement
+        while tasks.poll(0):
+            task = receive()
+            if task is None:
+                break
+            run(task)
+        tasks.close()
+    finally:
+        bot.worker_pool.close()
+        flush_activity_counts()
+        chat_points.flush()
+        message_log.flush()
+
+def _run_forked_child(target, *args):
+    """Body of a process made with os.fork(): run target, then exit without the parent's atexit handlers"""
+    code = 0
+    try:
+        target(*args)
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        code = 1
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except Exception:
+                pass
+        os._exit(code)
+
+class WorkerSpawner:
+    """
+    Single-threaded process that forks the worker processes (see the section comment)
+    Requests carry the index and the worker's two pipe ends (as file descriptors) over a Unix socket; the spawner
+    answers with the new worker's pid. Create it before any thread is started.
+    """
+    def __init__(self, count):
+        self._socket, spawner_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._replies = self._socket.makefile('rb')
+        self._lock = threading.Lock()
+        self.pid = os.fork()
+        if self.pid == 0:
+            self.close()
+            _run_forked_child(self._serve, spawner_socket, count)
+        spawner_socket.close()
+
+    def spawn(self, index, tasks, events):
+        """Fork worker index reading from the tasks Connection and writing to the events one; returns its pid"""
+        with self._lock:
+            socket.send_fds(self._socket, [f'{index}\n'.encode()], [tasks.fileno(), events.fileno()])
+            return int(self._replies.readline())
+
+    def close(self):
+        """The spawner exits once its socket is closed; running workers are not affected"""
+        self._replies.close()  # Holds the socket open otherwise
+        self._socket.close()
+
+    @staticmethod
+    def _serve(sock, count):
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C stops the supervisor, which then stops the workers
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # Exited workers are reaped by the system
+        while True:
+            data, fds, _, _ = socket.recv_fds(sock, 16, 2)
+            if not data:
+                return  # Supervisor is gone
+            pid = os.fork()
+            if pid == 0:
+                sock.close()
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                _run_forked_child(_worker_main, int(data), count, multiprocessing.connection.Connection(fds[0]),
+                                  multiprocessing.connection.Connection(fds[1]))
+            for fd in fds:
+                os.close(fd)
+            sock.sendall(f'{pid}\n'.encode())
+
+class WorkerSupervisor:
+    """Starts the worker processes through the spawner, routes messages to them, applies their events and replaces workers that die"""
+    def __init__(self, count):
+        self.count = count
+        self.ring = ConsistentHashRing(range(count))
+        self._spawner = WorkerSpawner(count)
+        self._tasks = [None] * count    # Connection each worker's messages are sent on
+        self._events = [None] * count   # Connection each worker's events arrive on
+        self._pids = [None] * count
+        self._started = [0.0] * count   # time.monotonic() each worker was started at
+        self._exited = [threading.Event() for _ in range(count)]
+        self._send_locks = [threading.Lock() for _ in range(count)]
+        self._replaced = threading.Condition()
+        self._stopping = False
+
+    def start(self):
+        for index in range(self.count):
+            self._start_worker(index)
+        user_cache_listeners.append(self._forward_invalidation)
+        threading.Thread(target=self._run, name='worker-events', daemon=True).start()
+        print(get_log_text('logs.workers_started', count=self.count))
+
+    def _start_worker(self, index):
+        # New pipes for every worker, so a replacement never reads what a dead worker left half-read
+        tasks_reader, tasks_writer = multiprocessing.Pipe(duplex=False)
+        events_reader, events_writer = multiprocessing.Pipe(duplex=False)
+        pid = self._spawner.spawn(index, tasks_reader, events_writer)
+        tasks_reader.close()
+        events_writer.close()
+        with self._replaced:
+            self._tasks[index], self._events[index], self._pids[index] = tasks_writer, events_reader, pid
+            self._started[index] = time.monotonic()
+            self._exited[index].clear()
+            self._replaced.notify_all()
+
+    def route(self, key, task):
+        index = self.ring.node_for(key)
+        self._send(index, task)
+
+    def _send(self, index, task):
+        for _ in range(2):
+            connection = self._tasks[index]
+            try:
+                with self._send_locks[index]:
+                    connection.send(task)
+                return
+            except OSError:
+                # The worker is gone: wait for the event thread to replace it and send to the new one
+                with self._replaced:
+                    self._replaced.wait_for(lambda: self._tasks[index] is not connection or self._stopping, WORKER_POLL_SECONDS)
+        print(get_log_text('logs.worker_task_dropped', index=index))
+
+    def _forward_invalidation(self, telegram_ids, source=None):
+        by_worker = defaultdict(list)
+        for telegram_id in telegram_ids:
+            index = self.ring.node_for(telegram_id)
+            if index != source:
+                by_worker[index].append(telegram_id)
+        for index, ids in by_worker.items():
+            self._send(index, ('invalidate', ids))
+
+    def _run(self):
+        while True:
+            watched = {connection: index for index, connection in enumerate(self._events) if not connection.closed}
+            for connection in multiprocessing.connection.wait(list(watched), WORKER_POLL_SECONDS):
+                index = watched[connection]
+                try:
+                    target, method, args = connection.recv()
+                except (EOFError, OSError):
+                    # Every event the worker sent has been applied; its pipe closes when it exits
+                    self._worker_exited(index, connection)
+                    continue
+                try:
+                    self._apply(index, target, method, args)
+                except Exception as e:
+                    print(get_log_text('logs.worker_event_failed', error=repr(e)))
+
+    def _worker_exited(self, index, events):
+        events.close()
+        with self._send_locks[index]:
+            self._tasks[index].close()
+        self._exited[index].set()
+        if not self._stopping:
+            print(get_log_text('logs.worker_restarted', index=index, pid=self._pids[index]))
+            # A worker that dies right after starting would otherwise be restarted in a tight loop
+            delay = self._started[index] + WORKER_POLL_SECONDS - time.monotonic()
+            if delay > 0:
+                threading.Timer(delay, self._start_worker, (index,)).start()
+            else:
+                self._start_worker(index)
+
+    def _apply(self, source, target, method, args):
+        if target == 'user_cache':
+            telegram_ids = args[0]
+            user_cache.invalidate(telegram_ids)
+            self._forward_invalidation(telegram_ids, source=source)
+            return
+        if target not in WORKER_PROXIED:
+            raise ValueError(f'unexpected event target {target}')
+        obj = globals()[target]
+        (getattr(obj, method) if method else obj)(*args)
+
+    def stop(self, timeout=15):
+        """Let the workers finish their queued messages and flush their buffers (registered with atexit)"""
+        self._stopping = True
+        with self._replaced:
+            self._replaced.notify_all()
+        for index in range(self.count):
+            try:
+                with self._send_locks[index]:
+                    self._tasks[index].send(None)
+            except OSError:
+                pass
+        deadline = time.monotonic() + timeout
+        for index, exited in enumerate(self._exited):
+            if not exited.wait(max(0, deadline - time.monotonic())):
+                try:
+                    os.kill(self._pids[index], signal.SIGTERM)  # Makes it flush and exit
+                except OSError:
+                    pass
+        self._spawner.close()
+
+class ShardedMessageRouter:
+    """
+    Takes the place of the bot's process_new_messages: messages whose handler is sharded go to the worker processes,
+    which dispatch them through their own copy of the bot; the rest are dispatched here as usual
+    """
+    def __init__(self, telebot_instance, supervisor, handlers):
+        self.telebot = telebot_instance
+        self.supervisor = supervisor
+        self.handlers = set(handlers)
+        self._dispatch_here = telebot_instance.process_new_messages
+
+    def install(self):
+        self.telebot.process_new_messages = self.process_new_messages
+
+    def _handler_for(self, message):
+        """Handler the bot would run for message (the first one whose filters match), None if there is none"""
+        for handler in self.telebot.message_handlers:
+            if self.telebot._test_message_handler(handler, message):
+                return handler['function']
+        return None
+
+    def process_new_messages(self, new_messages):
+        # Next step handlers (replies in /transfer, /submit...) are registered in this process: they see messages first
+        self.telebot._notify_next_handlers(new_messages)
+        local = []
+        for message in new_messages:
+            if getattr(message, 'json', None) is not None and self._handler_for(message) in self.handlers:
+                self.supervisor.route(update_lane_key(message), ('message', message.json))
+            else:
+                local.append(message)
+        if local:
+            self._dispatch_here(local)
+
+worker_supervisor = None
+if WORKER_PROCESSES > 1 and not hasattr(socket, 'send_fds'):
+    print(get_log_text('logs.workers_unavailable'))
+elif WORKER_PROCESSES > 1:
+    if threading.active_count() > 1:
+        print(get_log_text('logs.workers_threads_running', threads=', '.join(t.name for t in threading.enumerate())))
+    message_log.lock_path = MESSAGE_LOG_FILE + '.lock'
+    worker_supervisor = WorkerSupervisor(WORKER_PROCESSES)
+recover_worker_journals(WORKER_PROCESSES if worker_supervisor else 0)
+if worker_supervisor:
+    worker_supervisor.start()
+    atexit.register(worker_supervisor.stop)
+    ShardedMessageRouter(bot, worker_supervisor, [handle_custom_signin_word, handle_me]).install()
+
 # Enable news broadcasting scheduled task based on configuration
 if NEWS_ENABLED:
     schedule.every().day.at(NEWS_BROADCAST_TIME).do(fetch_rss_news)
+    schedule.every(RSS_PREFETCH_INTERVAL_MINUTES).minutes.do(prefetch_rss_entries)
 
 # Enable sign-in word scheduled task based on configuration
 if SIGNIN_WORD_ENABLED:
@@ -3173,6 +5798,19 @@ if SIGNIN_WORD_ENABLED:
 # Enable price update scheduled task (always enabled for price cache)
 schedule.every().day.at(PRICE_UPDATE_TIME).do(update_daily_open_prices)
 
+# Refund expired red packets
+schedule.every().day.at(REDPACKET_REFUND_TIME).do(red_packet_refunds.request_sweep)
+
+# Pick up edits of locales.json
+schedule.every(LOCALES_RELOAD_SECONDS).seconds.do(load_locales)
+
+# Flush buffered group activity counters and chat points
+schedule.every(ACTIVITY_FLUSH_INTERVAL_SECONDS).seconds.do(flush_activity_counts)
+schedule.every(CHAT_POINTS_FLUSH_INTERVAL_SECONDS).seconds.do(chat_points.flush)
+atexit.register(flush_activity_counts)
+atexit.register(chat_points.flush)
+atexit.register(message_log.flush)
+
 # Broadcast price at configured interval based on configuration
 if PRICE_BROADCAST_ENABLED:
     schedule.every(PRICE_BROADCAST_INTERVAL_HOURS).hours.do(broadcast_price_changes)
@@ -3190,6 +5828,12 @@ except Exception as e:
 
 #broadcast_price_changes()
 
+# Seed /active counters from the existing message log (first start only)
+try:
+    backfill_activity_counts()
+except Exception as e:
+    print(get_log_text('logs.activity_backfill_failed', error=str(e)))
+
 # Execute once on startup
 if not os.path.exists(TEMP_SIGNIN_FILE):
     print(get_log_text('logs.startup_no_temp_file'))
@@ -3215,6 +5859,11 @@ def run_schedule():
 # Start scheduler thread
 threading.Thread(target=run_schedule, daemon=True).start()
 
+# Resume delayed deletes/unpins, batch reward notifications and red packet refunds left over from the previous run
+delayed_actions.start()
+batch_notifier.start()
+red_packet_refunds.start()
+
 # Set bot commands with multilingual descriptions
 commands = [
     telebot.types.BotCommand("start", get_text('commands.bot_commands.start', DEFAULT_LANGUAGE)),
@@ -3237,32 +5886,179 @@ commands = [
 bot.set_my_commands(commands)
 
 
-# Start Telegram Bot (main thread)
-print(get_log_text('logs.bot_running'))
-
-try:
-    while True:
+# ===== Webhook ingestion =====
+# With UPDATE_MODE "webhook", Telegram POSTs updates to an embedded HTTP server instead of the bot long-polling.
+# Requests are checked against the secret token and handed to the bot's handler pool, and the server answers at once.
+# Locally, recorded update JSON can be POSTed to the endpoint with the X-Telegram-Bot-Api-Secret-Token header.
+UPDATE_MODE = config.get('UPDATE_MODE', 'polling')  # How updates are received: 'polling' or 'webhook'
+WEBHOOK_URL = config.get('WEBHOOK_URL', '')  # Public HTTPS URL registered with Telegram (empty: not registered, e.g. local testing)
+WEBHOOK_LISTEN = config.get('WEBHOOK_LISTEN', '0.0.0.0')  # Address the webhook server binds to
+WEBHOOK_PORT = config.get('WEBHOOK_PORT', 8443)  # Port the webhook server listens on
+WEBHOOK_PATH = config.get('WEBHOOK_PATH', '/telegram-webhook')  # Request path updates are POSTed to
+WEBHOOK_SECRET_TOKEN = config.get('WEBHOOK_SECRET_TOKEN', '')  # Secret Telegram sends with every update (empty: random per start)
+WEBHOOK_SSL_CERT = config.get('WEBHOOK_SSL_CERT', '')  # Certificate file to serve HTTPS directly (empty: plain HTTP behind a proxy)
+WEBHOOK_SSL_KEY = config.get('WEBHOOK_SSL_KEY', '')  # Private key file for WEBHOOK_SSL_CERT
+WEBHOOK_MAX_CONNECTIONS = config.get('WEBHOOK_MAX_CONNECTIONS', 40)  # Parallel connections Telegram may open (1-100)
+WEBHOOK_STATS_INTERVAL_SECONDS = config.get('WEBHOOK_STATS_INTERVAL_SECONDS', 60)  # How often the ingest rate is logged
+WEBHOOK_MAX_BODY_BYTES = 1024 * 1024  # Larger requests are not Telegram updates
+
+class _WebhookRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, so Telegram can reuse its connections
+
+    def do_POST(self):
+        server = self.server
+        # Rejections come before the body is read, so they close the connection: on keep-alive the unread body
+        # would otherwise be parsed as the next request
+        if self.path != server.webhook_path:
+            return self._reply(404, close=True)
+        if not server.check_secret(self.headers.get('X-Telegram-Bot-Api-Secret-Token', '')):
+            return self._reply(403, close=True)
+        length = int(self.headers.get('Content-Length') or 0)
+        if not 0 < length <= WEBHOOK_MAX_BODY_BYTES:
+            return self._reply(413 if length else 400, close=True)
         try:
-            bot.polling(none_stop=True, timeout=60, long_polling_timeout=60)
-        except KeyboardInterrupt:
-            print(get_log_text('logs.info_interrupt_received'))
-            bot.stop_polling()
-            break
-        except telebot.apihelper.ApiTelegramException as e:
-            if e.error_code == 502:
-                print(get_log_text('logs.warning_telegram_502'))
-                time.sleep(5)
-                continue  # Continue loop directly, don't exit
-            else:
-                print(get_log_text('logs.error_telegram_api', error=str(e)))
-                time.sleep(5)
+            update = telebot.types.Update.de_json(self.rfile.read(length).decode('utf-8'))
         except Exception as e:
-            print(get_log_text('logs.error_unknown_exception', error=str(e)))
-            time.sleep(5)
-except KeyboardInterrupt:
-    print(get_log_text('logs.info_interrupt_received'))
+            print(get_log_text('logs.webhook_bad_update', error=str(e)))
+            return self._reply(400)
+        server.note_received()
+        # With a threaded bot this only queues the update for the handler pool
+        bot.process_new_updates([update])
+        self._reply(200)
+
+    def do_GET(self):
+        # Ingest statistics, for checking the endpoint by hand
+        if self.path != self.server.webhook_path or not self.server.check_secret(self.headers.get('X-Telegram-Bot-Api-Secret-Token', '')):
+            return self._reply(404)
+        self._reply(200, json.dumps(self.server.stats()).encode('utf-8'))
+
+    def _reply(self, status, body=b'', close=False):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        if close:
+            self.send_header('Connection', 'close')  # Also sets self.close_connection
+        if body:
+            self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # One line per update is too much; report_rate() logs the totals
+
+class WebhookServer(ThreadingHTTPServer):
+    """Threaded HTTP server receiving Telegram updates, optionally over TLS, counting what it ingests"""
+    daemon_threads = True
+    request_queue_size = 128  # Listen backlog; Telegram may open up to 100 connections at once
+
+    def __init__(self, address, webhook_path, secret_token, ssl_cert='', ssl_key=''):
+        super().__init__(address, _WebhookRequestHandler)
+        self.webhook_path = webhook_path
+        self.secret_token = secret_token
+        if ssl_cert:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(ssl_cert, ssl_key or None)
+            # Handshake in the request thread, so a slow client cannot stall accept()
+            self.socket = context.wrap_socket(self.socket, server_side=True, do_handshake_on_connect=False)
+        self.received = 0
+        self.rejected = 0
+        self.started = time.monotonic()
+        self._window_count = 0
+        self._window_start = self.started
+        self._lock = threading.Lock()
+
+    def check_secret(self, token):
+        if hmac.compare_digest(token.encode('utf-8'), self.secret_token.encode('utf-8')):
+            return True
+        with self._lock:
+            self.rejected += 1
+        return False
+
+    def note_received(self):
+        with self._lock:
+            self.received += 1
+            self._window_count += 1
+
+    def stats(self):
+        with self._lock:
+            uptime = time.monotonic() - self.started
+            return {
+                'received': self.received,
+                'rejected': self.rejected,
+                'uptime_seconds': round(uptime),
+                'per_second': round(self.received / uptime, 2) if uptime else 0,
+            }
+
+    def report_rate(self):
+        """Scheduled: log updates received since the last report"""
+        with self._lock:
+            now = time.monotonic()
+            count, elapsed = self._window_count, now - self._window_start
+            self._window_count, self._window_start = 0, now
+            rejected = self.rejected
+        if count or rejected:
+            print(get_log_text('logs.webhook_ingest_rate', count=count, seconds=round(elapsed), rate=f"{count / elapsed:.2f}", rejected=rejected))
+
+def run_webhook():
+    if not WEBHOOK_URL and not WEBHOOK_SECRET_TOKEN:
+        # A random secret would only be known to Telegram, which is not told about this server: every POST would get 403
+        print(get_log_text('logs.webhook_secret_required'))
+        return
+    secret_token = WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32)
+    server = WebhookServer((WEBHOOK_LISTEN, WEBHOOK_PORT), WEBHOOK_PATH, secret_token, WEBHOOK_SSL_CERT, WEBHOOK_SSL_KEY)
+    schedule.every(WEBHOOK_STATS_INTERVAL_SECONDS).seconds.do(server.report_rate)
+    if WEBHOOK_URL:
+        bot.set_webhook(url=WEBHOOK_URL, secret_token=secret_token, max_connections=WEBHOOK_MAX_CONNECTIONS)
+        print(get_log_text('logs.webhook_registered', url=WEBHOOK_URL))
+    else:
+        print(get_log_text('logs.webhook_not_registered'))
+    print(get_log_text('logs.webhook_listening', host=WEBHOOK_LISTEN, port=WEBHOOK_PORT, path=WEBHOOK_PATH))
     try:
-        bot.stop_polling()
-    except:
-        pass
-    print(get_log_text('logs.info_bot_stopped'))
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(get_log_text('logs.info_interrupt_received'))
+    finally:
+        server.server_close()
+        print(get_log_text('logs.info_bot_stopped'))
+
+def run_polling():
+    # A webhook left over from webhook mode makes getUpdates fail
+    try:
+        bot.remove_webhook()
+    except Exception as e:
+        print(get_log_text('logs.error_telegram_api', error=str(e)))
+
+    try:
+        while True:
+            try:
+                bot.polling(none_stop=True, timeout=60, long_polling_timeout=60)
+            except KeyboardInterrupt:
+                print(get_log_text('logs.info_interrupt_received'))
+                bot.stop_polling()
+                break
+            except telebot.apihelper.ApiTelegramException as e:
+                if e.error_code == 502:
+                    print(get_log_text('logs.warning_telegram_502'))
+                    time.sleep(5)
+                    continue  # Continue loop directly, don't exit
+                else:
+                    print(get_log_text('logs.error_telegram_api', error=str(e)))
+                    time.sleep(5)
+            except Exception as e:
+                print(get_log_text('logs.error_unknown_exception', error=str(e)))
+                time.sleep(5)
+    except KeyboardInterrupt:
+        print(get_log_text('logs.info_interrupt_received'))
+        try:
+            bot.stop_polling()
+        except:
+            pass
+        print(get_log_text('logs.info_bot_stopped'))
+
+
+# Start Telegram Bot (main thread)
+print(get_log_text('logs.bot_running'))
+
+if UPDATE_MODE == 'webhook':
+    run_webhook()
+else:
+    run_polling()
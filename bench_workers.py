@@ -0,0 +1,113 @@
+"""
+Group message throughput benchmark for WORKER_PROCESSES
+
+Posts synthetic group messages to a running bot's webhook endpoint and measures how fast they are handled, by
+watching group_messages.log grow (every handled group message adds one line). Run it once per WORKER_PROCESSES
+value and compare the rates.
+
+Setup (use a test bot token and a copy of the database: the synthetic users are created in it):
+  config.jsonc: "UPDATE_MODE": "webhook", "WEBHOOK_URL": "", "WEBHOOK_SECRET_TOKEN": "<secret>",
+                "WORKER_PROCESSES": N, "VERBOSE_MESSAGE_LOGS": false,
+                "MESSAGE_LOG_MAX_MB": 0, "MESSAGE_LOG_ROTATE_HOURS": 0
+  python Matrix_bot.py
+  python bench_workers.py --secret <secret> --chat-id <ALLOWED_GROUP_ID>
+
+The log must not be rotated during a run (hence the two 0 settings); the benchmark stops with an error if it is.
+Only the standard library is used. The messages contain no keywords, so the bot sends nothing to Telegram while
+handling them; the measured work is parsing, routing, keyword matching, logging and chat points.
+"""
+import argparse
+import glob
+import http.client
+import json
+import os
+import random
+import string
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+def make_update(update_id, chat_id, user_id):
+    words = [''.join(random.choices(string.ascii_lowercase, k=random.randint(3, 9))) for _ in range(random.randint(3, 15))]
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup", "title": "bench"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"bench{user_id}"},
+            "text": "bench " + " ".join(words),
+        },
+    }
+
+def rotated_files(path):
+    """The log's archives and its file being archived, named path.<...>"""
+    return set(glob.glob(glob.escape(path) + '.*'))
+
+def count_lines(path, offset, known_rotated):
+    """Lines appended to path since byte offset; exits if the log was rotated meanwhile"""
+    rotated = rotated_files(path) - known_rotated
+    try:
+        with open(path, 'rb') as f:
+            if not rotated and os.fstat(f.fileno()).st_size >= offset:
+                f.seek(offset)
+                return sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b''))
+    except FileNotFoundError:
+        if not rotated:
+            return 0
+    sys.exit(f"{path} was rotated during the run, so handled messages cannot be counted; "
+             f"set MESSAGE_LOG_MAX_MB and MESSAGE_LOG_ROTATE_HOURS to 0 for the benchmark")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8443, help='WEBHOOK_PORT')
+    parser.add_argument('--path', default='/telegram-webhook', help='WEBHOOK_PATH')
+    parser.add_argument('--secret', required=True, help='WEBHOOK_SECRET_TOKEN')
+    parser.add_argument('--chat-id', type=int, required=True, help='ALLOWED_GROUP_ID')
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=500, help='Distinct senders (spread over the workers by id)')
+    parser.add_argument('--connections', type=int, default=8, help='Parallel HTTP connections posting updates')
+    parser.add_argument('--log', default='group_messages.log', help="The bot's group message log")
+    parser.add_argument('--timeout', type=float, default=300)
+    args = parser.parse_args()
+
+    updates = [json.dumps(make_update(i + 1, args.chat_id, 900000000 + random.randrange(args.users))).encode()
+               for i in range(args.messages)]
+    headers = {'Content-Type': 'application/json', 'X-Telegram-Bot-Api-Secret-Token': args.secret}
+    local = threading.local()
+    failed = []
+
+    def post(body):
+        if not hasattr(local, 'connection'):
+            local.connection = http.client.HTTPConnection(args.host, args.port, timeout=30)
+        local.connection.request('POST', args.path, body, headers)
+        response = local.connection.getresponse()
+        response.read()
+        if response.status != 200:
+            failed.append(response.status)
+
+    offset = os.path.getsize(args.log) if os.path.exists(args.log) else 0
+    known_rotated = rotated_files(args.log)
+    start = time.monotonic()
+    with ThreadPoolExecutor(args.connections) as pool:
+        list(pool.map(post, updates))
+    posted = time.monotonic() - start
+    if failed:
+        print(f"{len(failed)} updates rejected (status {failed[0]}); check --secret, --path and --port")
+        return
+
+    # The log is written in batches, so the last lines arrive up to MESSAGE_LOG_FLUSH_INTERVAL_SECONDS late
+    handled = 0
+    deadline = start + args.timeout
+    while handled < args.messages and time.monotonic() < deadline:
+        time.sleep(0.2)
+        handled = count_lines(args.log, offset, known_rotated)
+    elapsed = time.monotonic() - start
+    print(f"posted {args.messages} updates in {posted:.2f}s ({args.messages / posted:.0f}/s)")
+    print(f"handled {handled} in {elapsed:.2f}s ({handled / elapsed:.0f}/s)"
+          + ("" if handled >= args.messages else f"; timed out waiting for {args.messages - handled}"))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Point update stress test for the ordered dispatch lanes
+
+Drives a running bot through its webhook endpoint with many users at once. Every user sends a sequence of
+/transfer_points to other users, each followed by /bind_binance with its position in the sequence, while an admin
+keeps adding unlocked points to the same users with /add_unlock_points. Afterwards the database must show:
+no transfer or increment lost, the total of unlocked points conserved, every balance equal to its start plus what
+it was given and received minus what it sent, and each user's transfers and bindings in the order they were sent.
+
+Setup (use a test bot token and a copy of the database: the synthetic users are created in it):
+  config.jsonc: "UPDATE_MODE": "webhook", "WEBHOOK_URL": "", "WEBHOOK_SECRET_TOKEN": "<secret>",
+                "DISPATCH_LANES": 32, "ADMIN_IDS": [..., <made-up admin id>],
+                "OUTBOUND_GLOBAL_PER_SECOND": 100000, "OUTBOUND_PRIVATE_PER_SECOND": 100000
+  python Matrix_bot.py
+  python loadtest_points.py --secret <secret> --chat-id <ALLOWED_GROUP_ID> --admin-id <made-up admin id>
+
+The bot answers every command in the sender's private chat; the raised outbound limits and made-up user ids make
+those replies fail at once, so the test measures the updates rather than Telegram's pacing. The resulting
+Telegram errors in the bot's output are expected.
+Run it next to telegram_bot.db (or pass --db). Only the standard library is used.
+"""
+import argparse
+import http.client
+import json
+import random
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+FIRST_USER_ID = 920000000  # Synthetic users are FIRST_USER_ID, FIRST_USER_ID + 1, ...
+START_POINTS = 1000  # Unlocked points every user starts with
+SETTLE_SECONDS = 10  # Updates are considered handled once the database has not changed for this long
+
+def message_update(update_id, chat_id, chat_type, user_id, text):
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": chat_type},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"loadtest{user_id}"},
+        "text": text,
+    }
+    if text.startswith('/'):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+class WebhookClient:
+    """Posts updates to the bot's webhook, one keep-alive connection per thread"""
+    def __init__(self, host, port, path, secret):
+        self.host, self.port, self.path = host, port, path
+        self.headers = {'Content-Type': 'application/json', 'X-Telegram-Bot-Api-Secret-Token': secret}
+        self._local = threading.local()
+
+    def post(self, update):
+        if not hasattr(self._local, 'connection'):
+            self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        self._local.connection.request('POST', self.path, json.dumps(update).encode(), self.headers)
+        response = self._local.connection.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f"webhook answered {response.status}; check --secret, --path and --port")
+
+def wait_for(description, check, timeout):
+    deadline = time.monotonic() + timeout
+    while not check():
+        if time.monotonic() > deadline:
+            sys.exit(f"timed out waiting for {description}")
+        time.sleep(0.2)
+
+def wait_until_settled(db, users, expected_transfers, placeholders):
+    """Wait for all transfers to be logged, or for the database to stop changing"""
+    state, last_change = None, time.monotonic()
+    while time.monotonic() - last_change < SETTLE_SECONDS:
+        time.sleep(0.2)
+        current = db.execute(f'''
+            SELECT (SELECT COUNT(*) FROM transfers WHERE sender_id IN ({placeholders})),
+                   (SELECT COALESCE(SUM(unlocked_points), 0) FROM users WHERE telegram_id IN ({placeholders}))
+        ''', users + users).fetchone()
+        if current != state:
+            state, last_change = current, time.monotonic()
+        elif current[0] >= expected_transfers:
+            time.sleep(1)  # Let the admin's last increments land
+            return
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8443, help='WEBHOOK_PORT')
+    parser.add_argument('--path', default='/telegram-webhook', help='WEBHOOK_PATH')
+    parser.add_argument('--secret', required=True, help='WEBHOOK_SECRET_TOKEN')
+    parser.add_argument('--chat-id', type=int, required=True, help='ALLOWED_GROUP_ID (users are created by a message there)')
+    parser.add_argument('--admin-id', type=int, required=True, help='An id in ADMIN_IDS that sends /add_unlock_points')
+    parser.add_argument('--db', default='telegram_bot.db', help="The bot's database")
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--transfers', type=int, default=10, help='Transfers (and bindings) per user')
+    parser.add_argument('--admin-rounds', type=int, default=2, help='Times the admin adds 1 point to every user')
+    parser.add_argument('--connections', type=int, default=64, help='Users posting at the same time')
+    parser.add_argument('--timeout', type=float, default=60)
+    args = parser.parse_args()
+    if args.transfers * (args.transfers + 1) // 2 > START_POINTS:
+        sys.exit(f"--transfers too large: users start with {START_POINTS} points")
+
+    client = WebhookClient(args.host, args.port, args.path, args.secret)
+    db = sqlite3.connect(args.db, timeout=30)
+    users = list(range(FIRST_USER_ID, FIRST_USER_ID + args.users))
+    placeholders = ','.join('?' * len(users))
+    update_ids = iter(range(random.randrange(1 << 30), 1 << 31))
+
+    # A group message from each user makes the bot create their account
+    with ThreadPoolExecutor(args.connections) as pool:
+        list(pool.map(lambda user_id: client.post(message_update(next(update_ids), args.chat_id, 'supergroup', user_id, 'loadtest')), users))
+    wait_for("the users to be created",
+             lambda: db.execute(f'SELECT COUNT(*) FROM users WHERE telegram_id IN ({placeholders})', users).fetchone()[0] == len(users),
+             args.timeout)
+    with db:
+        db.execute(f"UPDATE users SET unlocked_points = ?, binance_uid = NULL WHERE telegram_id IN ({placeholders})",
+                   [START_POINTS] + users)
+    last_transfer = db.execute('SELECT COALESCE(MAX(id), 0) FROM transfers').fetchone()[0]
+
+    # Transfer k of a user moves k points and is followed by binding uid k, so each user's order can be read back.
+    # A user posts the next command only after the webhook has accepted the previous one.
+    recipients = {user_id: [random.choice([u for u in users if u != user_id]) for _ in range(args.transfers)] for user_id in users}
+
+    def run_user(user_id):
+        for k, recipient_id in enumerate(recipients[user_id], 1):
+            client.post(message_update(next(update_ids), user_id, 'private', user_id, f'/transfer_points {recipient_id} {k}'))
+            client.post(message_update(next(update_ids), user_id, 'private', user_id, f'/bind_binance {k}'))
+
+    def run_admin():
+        for _ in range(args.admin_rounds):
+            for user_id in users:
+                client.post(message_update(next(update_ids), args.admin_id, 'private', args.admin_id, f'/add_unlock_points {user_id} 1'))
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(args.connections + 1) as pool:
+        admin = pool.submit(run_admin)
+        list(pool.map(run_user, users))
+        admin.result()
+    posted = time.monotonic() - start
+    expected_transfers = args.users * args.transfers
+    wait_until_settled(db, users, expected_transfers, placeholders)
+    updates = args.users * (2 * args.transfers) + args.admin_rounds * args.users
+    print(f"{updates} updates from {args.users} users and an admin posted in {posted:.2f}s, "
+          f"settled after {time.monotonic() - start:.2f}s")
+
+    transfers = db.execute(f'SELECT sender_id, recipient_id, amount FROM transfers WHERE id > ? AND sender_id IN ({placeholders}) ORDER BY id',
+                           [last_transfer] + users).fetchall()
+    balances = dict(db.execute(f'SELECT telegram_id, unlocked_points FROM users WHERE telegram_id IN ({placeholders})', users))
+    bindings = dict(db.execute(f'SELECT telegram_id, binance_uid FROM users WHERE telegram_id IN ({placeholders})', users))
+
+    expected = {user_id: START_POINTS + args.admin_rounds for user_id in users}
+    sent = {user_id: [] for user_id in users}
+    for sender_id, recipient_id, amount in transfers:
+        expected[sender_id] -= amount
+        expected[recipient_id] += amount
+        sent[sender_id].append((recipient_id, amount))
+    out_of_order = [user_id for user_id in users
+                    if sent[user_id] != [(recipient_id, k) for k, recipient_id in enumerate(recipients[user_id], 1)]]
+    wrong_balance = [user_id for user_id in users if balances[user_id] != expected[user_id]]
+    wrong_binding = [user_id for user_id in users if bindings[user_id] != str(args.transfers)]
+    total = sum(balances.values())
+    expected_total = args.users * (START_POINTS + args.admin_rounds)
+
+    checks = [
+        ("transfers", len(transfers) == expected_transfers, f"{len(transfers)} logged, expected {expected_transfers}"),
+        ("total conserved", total == expected_total, f"{total} unlocked points, expected {expected_total}"),
+        ("balances", not wrong_balance, f"{len(wrong_balance)} users off, e.g. {wrong_balance[:1]}"),
+        ("transfer order", not out_of_order, f"{len(out_of_order)} users' transfers out of order or missing, e.g. {out_of_order[:1]}"),
+        ("binding order", not wrong_binding, f"{len(wrong_binding)} users did not end on binding {args.transfers}, "
+                                              f"e.g. {[(u, bindings[u]) for u in wrong_binding[:1]]}"),
+    ]
+    failed = 0
+    for name, ok, detail in checks:
+        print(f"{'PASS' if ok else 'FAIL'} {name}" + ("" if ok else f": {detail}"))
+        failed += not ok
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
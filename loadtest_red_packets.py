@@ -0,0 +1,169 @@
+"""
+Red packet claim load test
+
+Sends one red packet through a running bot's webhook endpoint, fires many simultaneous claim clicks at it from
+many users, then checks the database: every claim is unique, no more shares were handed out than the packet has,
+the claimed shares and what is left add up to the packet, and every balance moved by exactly its claim.
+
+Setup (use a test bot token and a copy of the database: the synthetic users are created in it and the sender is
+given the packet's points):
+  config.jsonc: "UPDATE_MODE": "webhook", "WEBHOOK_URL": "", "WEBHOOK_SECRET_TOKEN": "<secret>",
+                "OUTBOUND_GLOBAL_PER_SECOND": 100000, "OUTBOUND_GROUP_PER_MINUTE": 100000
+  python Matrix_bot.py
+  python loadtest_red_packets.py --secret <secret> --chat-id <id of a group the test bot is not in>
+
+Every claim is announced in the group. The raised outbound limits and a group the bot cannot post to make those
+announcements fail at once, so the test measures claims rather than Telegram's pacing; the clicks also carry
+made-up callback query ids. The resulting Telegram errors in the bot's output are expected.
+Run it next to telegram_bot.db (or pass --db). Only the standard library is used.
+"""
+import argparse
+import http.client
+import json
+import random
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+FIRST_USER_ID = 910000000  # Synthetic users are FIRST_USER_ID, FIRST_USER_ID + 1, ...
+SETTLE_SECONDS = 10  # Claims are considered done once none has come in for this long
+
+def message_update(update_id, chat_id, user_id, text):
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "supergroup", "title": "loadtest"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"loadtest{user_id}"},
+        "text": text,
+    }
+    if text.startswith('/'):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+def claim_update(update_id, chat_id, user_id, packet_id):
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": f"loadtest{update_id}",
+            "from": {"id": user_id, "is_bot": False, "first_name": f"loadtest{user_id}"},
+            "chat_instance": "loadtest",
+            "data": f"claim_{packet_id}",
+            "message": {"message_id": 1, "date": int(time.time()), "chat": {"id": chat_id, "type": "supergroup"}},
+        },
+    }
+
+class WebhookClient:
+    """Posts updates to the bot's webhook, one keep-alive connection per thread"""
+    def __init__(self, host, port, path, secret):
+        self.host, self.port, self.path = host, port, path
+        self.headers = {'Content-Type': 'application/json', 'X-Telegram-Bot-Api-Secret-Token': secret}
+        self._local = threading.local()
+
+    def post(self, update):
+        if not hasattr(self._local, 'connection'):
+            self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        self._local.connection.request('POST', self.path, json.dumps(update).encode(), self.headers)
+        response = self._local.connection.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f"webhook answered {response.status}; check --secret, --path and --port")
+
+def wait_for(description, check, timeout):
+    deadline = time.monotonic() + timeout
+    while not check():
+        if time.monotonic() > deadline:
+            sys.exit(f"timed out waiting for {description}")
+        time.sleep(0.2)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8443, help='WEBHOOK_PORT')
+    parser.add_argument('--path', default='/telegram-webhook', help='WEBHOOK_PATH')
+    parser.add_argument('--secret', required=True, help='WEBHOOK_SECRET_TOKEN')
+    parser.add_argument('--chat-id', type=int, required=True, help='Group the packet is sent in')
+    parser.add_argument('--db', default='telegram_bot.db', help="The bot's database")
+    parser.add_argument('--points', type=int, default=3000, help='Points in the packet')
+    parser.add_argument('--shares', type=int, default=300, help='Shares in the packet')
+    parser.add_argument('--clickers', type=int, default=600, help='Users clicking the claim button')
+    parser.add_argument('--clicks', type=int, default=2, help='Clicks per user')
+    parser.add_argument('--connections', type=int, default=64, help='Parallel HTTP connections posting clicks')
+    parser.add_argument('--timeout', type=float, default=60)
+    args = parser.parse_args()
+
+    client = WebhookClient(args.host, args.port, args.path, args.secret)
+    db = sqlite3.connect(args.db, timeout=30)
+    sender = FIRST_USER_ID
+    clickers = list(range(FIRST_USER_ID + 1, FIRST_USER_ID + 1 + args.clickers))
+    user_ids = [sender] + clickers
+    update_ids = iter(range(random.randrange(1 << 30), 1 << 31))
+
+    # A group message from each user makes the bot create their account
+    with ThreadPoolExecutor(args.connections) as pool:
+        list(pool.map(lambda user_id: client.post(message_update(next(update_ids), args.chat_id, user_id, 'loadtest')), user_ids))
+    placeholders = ','.join('?' * len(user_ids))
+    wait_for("the users to be created",
+             lambda: db.execute(f'SELECT COUNT(*) FROM users WHERE telegram_id IN ({placeholders})', user_ids).fetchone()[0] == len(user_ids),
+             args.timeout)
+
+    with db:
+        db.execute('UPDATE users SET unlocked_points = unlocked_points + ? WHERE telegram_id = ?', (args.points, sender))
+    before = dict(db.execute(f'SELECT telegram_id, unlocked_points FROM users WHERE telegram_id IN ({placeholders})', user_ids))
+    known_packets = {row[0] for row in db.execute('SELECT id FROM red_packets WHERE sender_id = ?', (sender,))}
+
+    client.post(message_update(next(update_ids), args.chat_id, sender, f'/hongbao {args.points} {args.shares}'))
+    new_packets = []
+    def packet_created():
+        new_packets[:] = [row[0] for row in db.execute('SELECT id FROM red_packets WHERE sender_id = ?', (sender,))
+                          if row[0] not in known_packets]
+        return bool(new_packets)
+    wait_for("the red packet to be created", packet_created, args.timeout)
+    packet_id = new_packets[0]
+
+    clicks = [claim_update(next(update_ids), args.chat_id, user_id, packet_id) for user_id in clickers for _ in range(args.clicks)]
+    random.shuffle(clicks)
+    start = time.monotonic()
+    with ThreadPoolExecutor(args.connections) as pool:
+        list(pool.map(client.post, clicks))
+    # Wait until every share is claimed, or no claim has come in for a while (then the checks below say what is off)
+    expected_claims = min(args.shares, args.clickers)
+    claimed, last_change = 0, time.monotonic()
+    while claimed < expected_claims and time.monotonic() - last_change < SETTLE_SECONDS:
+        time.sleep(0.2)
+        count = db.execute('SELECT COUNT(*) FROM red_packet_claims WHERE packet_id = ?', (packet_id,)).fetchone()[0]
+        if count != claimed:
+            claimed, last_change = count, time.monotonic()
+    time.sleep(1)  # Let clicks still in flight fail or, wrongly, succeed
+    print(f"{len(clicks)} clicks from {args.clickers} users on a {args.shares}-share packet, "
+          f"handled in {time.monotonic() - start:.2f}s")
+
+    claims = dict(db.execute('SELECT telegram_id, claimed_points FROM red_packet_claims WHERE packet_id = ?', (packet_id,)))
+    claim_rows = db.execute('SELECT COUNT(*) FROM red_packet_claims WHERE packet_id = ?', (packet_id,)).fetchone()[0]
+    remaining_points, claimed_count = db.execute('SELECT remaining_points, claimed_count FROM red_packets WHERE id = ?', (packet_id,)).fetchone()
+    shares_left, share_points_left = db.execute('SELECT COUNT(*), COALESCE(SUM(points), 0) FROM red_packet_shares WHERE packet_id = ?', (packet_id,)).fetchone()
+    after = dict(db.execute(f'SELECT telegram_id, unlocked_points FROM users WHERE telegram_id IN ({placeholders})', user_ids))
+
+    checks = [
+        ("claims", claim_rows == expected_claims, f"{claim_rows} claims, expected {expected_claims}"),
+        ("unique claimers", len(claims) == claim_rows, f"{claim_rows - len(claims)} users claimed twice"),
+        ("claimed count", claimed_count == claim_rows, f"red_packets.claimed_count {claimed_count}, {claim_rows} claims"),
+        ("share sum", sum(claims.values()) + remaining_points == args.points,
+         f"claimed {sum(claims.values())} + left {remaining_points} != {args.points}"),
+        ("shares left", (shares_left, share_points_left) == (args.shares - claim_rows, remaining_points),
+         f"{shares_left} shares with {share_points_left} points left, expected {args.shares - claim_rows} with {remaining_points}"),
+        ("sender balance", before[sender] - after[sender] == args.points,
+         f"sender paid {before[sender] - after[sender]}, expected {args.points}"),
+    ]
+    wrong = [user_id for user_id in clickers if after[user_id] - before[user_id] != claims.get(user_id, 0)]
+    checks.append(("clicker balances", not wrong, f"{len(wrong)} balances differ from their claims, e.g. user {wrong[:1]}"))
+
+    failed = 0
+    for name, ok, detail in checks:
+        print(f"{'PASS' if ok else 'FAIL'} {name}" + ("" if ok else f": {detail}"))
+        failed += not ok
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()